@@ -21,7 +21,10 @@ from config import settings
 import logging
 # from main import client
 from utils.openai import get_client
-import re
+from utils.model_router import model_router
+from utils.blob_store import load_blob_text
+from utils.document_extraction import extract_document, EXTRACTORS as BINARY_EXTRACTORS
+from utils.pft_parsing import parse_pft_text, compile_pattern
 
 logger = logging.getLogger(__name__)
 
@@ -31,7 +34,7 @@ class DataSpecialistAgent:
     """Agent specialized in extracting and standardizing PFT data."""
     
     def __init__(self):
-        client = get_client()
+        client = get_client("DataSpecialist")
         self.agent = Agent(
             name="DataSpecialist",
             model=OpenAIChatCompletionsModel(model=settings.OPENAI_MODEL,openai_client=client),
@@ -67,18 +70,39 @@ class DataSpecialistAgent:
             """
         )
     
-    async def process_file(self, file_content: str, file_type: str) -> Dict[str, Any]:
+    async def process_file(
+        self,
+        file_content: Optional[str],
+        file_type: str,
+        file_path: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         Process PFT file and extract standardized data.
         
         Args:
-            file_content: Raw file content as string
+            file_content: Raw file content as string (None to read from file_path)
             file_type: Type of file (txt, pdf, csv, etc.)
+            file_path: Path of the stored file in the blob store
             
         Returns:
             Dictionary containing extracted and standardized PFT data
         """
         
+        if file_path and file_type.lower() in BINARY_EXTRACTORS:
+            # Binary formats are extracted in the process pool
+            try:
+                extracted = await extract_document(file_path, file_type)
+                if extracted["result"] is not None:
+                    # Structured sources (spreadsheets) are parsed directly, no LLM needed
+                    return extracted["result"]
+                file_content = extracted["text"]
+            except Exception as e:
+                logger.warning(f"Document extraction failed for {file_type}: {e!r}")
+                result = self._fallback_extraction("")
+                result["quality_metrics"]["data_quality_issues"].append(f"{file_type}_extraction_failed")
+                return result
+        elif file_content is None:
+            file_content = await load_blob_text(file_path)
         logger.info(f"process_file: file_type={file_type}, content_length={len(file_content)}")
         extraction_prompt = f"""
         Extract and standardize PFT data from the following file content:
@@ -132,7 +156,10 @@ class DataSpecialistAgent:
         
         logger.info(f"DataSpecialistAgent.process_file called: type={file_type}, len={len(file_content)}")
         try:
-            runner = Runner.run(self.agent, extraction_prompt)
+            runner = model_router.run(
+                self.agent, "extraction", extraction_prompt,
+                signals={"file_type": file_type}, expect_json=True
+            )
             result_obj = await runner
             raw_output = result_obj.final_output.strip()
             # Remove markdown-style triple backticks if present
@@ -148,87 +175,14 @@ class DataSpecialistAgent:
     
     def _fallback_extraction(self, file_content: str) -> Dict[str, Any]:
         """
-        Fallback extraction using regex patterns when AI extraction fails.
+        Fallback extraction when AI extraction fails.
+
+        Wide CSV exports are parsed column-wise with all trial rows combined;
+        anything else goes through the single-pass regex scanner.
         """
         
         logger.info("DataSpecialistAgent._fallback_extraction called")
-        # First, try CSV-style parsing if possible
-        try:
-            import csv
-            from io import StringIO
-
-            reader = csv.DictReader(StringIO(file_content))
-            raw_data = {}
-            for row in reader:
-                for key in ['fvc','fev1','fev1_fvc_ratio','pef','fef25_75','tlc','rv','dlco']:
-                    val = row.get(key.upper()) or row.get(key)
-                    if val:
-                        try:
-                            raw_data[key] = float(val)
-                        except ValueError:
-                            pass
-            if raw_data:
-                completeness = len(raw_data) / 8 * 100
-                missing = [k for k in ['fvc','fev1','fev1_fvc_ratio','pef','fef25_75','tlc','rv','dlco'] if k not in raw_data]
-                return {
-                    'raw_data': raw_data,
-                    'predicted_values': {},
-                    'percent_predicted': {},
-                    'quality_metrics': {
-                        'data_completeness': completeness,
-                        'measurement_quality': 'good',
-                        'missing_parameters': missing,
-                        'data_quality_issues': []
-                    },
-                    'test_metadata': {
-                        'test_date': None,
-                        'technician': None,
-                        'equipment': None,
-                        'test_quality': None
-                    }
-                }
-        except Exception:
-            pass
-
-        # Generic regex fallback for other formats
-        patterns = {
-            'fvc': r'FVC[:\s]*(\d+\.?\d*)',
-            'fev1': r'FEV1[:\s]*(\d+\.?\d*)',
-            'fev1_fvc_ratio': r'FEV1/FVC[:\s]*(\d+\.?\d*)',
-            'pef': r'PEF[:\s]*(\d+\.?\d*)',
-            'fef25_75': r'FEF25-75[:\s]*(\d+\.?\d*)',
-            'tlc': r'TLC[:\s]*(\d+\.?\d*)',
-            'rv': r'RV[:\s]*(\d+\.?\d*)',
-            'dlco': r'DLCO[:\s]*(\d+\.?\d*)'
-        }
-        raw_data = {}
-        for param, pattern in patterns.items():
-            match = re.search(pattern, file_content, re.IGNORECASE)
-            if match:
-                try:
-                    raw_data[param] = float(match.group(1))
-                except ValueError:
-                    pass
-        completeness = len(raw_data) / len(patterns) * 100
-        missing = [k for k in patterns if k not in raw_data]
-        quality = 'excellent' if completeness >= 80 else 'good' if completeness >= 60 else 'fair' if completeness >= 40 else 'poor'
-        return {
-            'raw_data': raw_data,
-            'predicted_values': {},
-            'percent_predicted': {},
-            'quality_metrics': {
-                'data_completeness': completeness,
-                'measurement_quality': quality,
-                'missing_parameters': missing,
-                'data_quality_issues': [] if completeness > 50 else ['low_data_completeness']
-            },
-            'test_metadata': {
-                'test_date': None,
-                'technician': None,
-                'equipment': None,
-                'test_quality': None
-            }
-        }
+        return parse_pft_text(file_content)
     
     def extract_numeric_value(self, text: str, pattern: str) -> Optional[float]:
         """
@@ -241,7 +195,7 @@ class DataSpecialistAgent:
         Returns:
             Extracted numeric value or None
         """
-        match = re.search(pattern, text, re.IGNORECASE)
+        match = compile_pattern(pattern).search(text)
         if match:
             try:
                 return float(match.group(1))
@@ -290,7 +244,7 @@ class DataSpecialistAgent:
         """
         
         try:
-            runner = Runner.run(self.agent, validation_prompt)
+            runner = model_router.run(self.agent, "validation", validation_prompt, expect_json=True)
             result_obj = await runner
             raw_output = result_obj.final_output.strip()
             # Remove markdown-style triple backticks if present
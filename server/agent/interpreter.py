@@ -15,6 +15,8 @@ from typing import Dict, Any, List, Optional
 from agents import Agent, Runner,OpenAIChatCompletionsModel
 from config import settings
 from utils.openai import get_client
+from utils.model_router import model_router
+from utils.pft_rules import rule_confidence
 import re
 
 
@@ -22,7 +24,7 @@ class InterpreterAgent:
     """Agent specialized in interpreting PFT results using medical guidelines."""
 
     def __init__(self):
-        client = get_client()
+        client = get_client("Interpreter")
         self.agent = Agent(
             name="Interpreter",
             model=OpenAIChatCompletionsModel(model=settings.OPENAI_MODEL,openai_client=client),
@@ -155,7 +157,10 @@ class InterpreterAgent:
         """
         
         try:
-            runner = Runner.run(self.agent, interpretation_prompt)
+            runner = model_router.run(
+                self.agent, "interpretation", interpretation_prompt,
+                signals={"rule_confidence": rule_confidence(raw_data, percent_predicted)}, expect_json=True
+            )
             result_obj = await runner
             raw_output = result_obj.final_output.strip()
             # Remove markdown-style triple backticks if present
@@ -289,7 +294,7 @@ class InterpreterAgent:
         """
         
         try:
-            runner = Runner.run(self.agent, reversibility_prompt)
+            runner = model_router.run(self.agent, "reversibility", reversibility_prompt, expect_json=True)
             result_obj = await runner
             raw_output = result_obj.final_output.strip()
             # Remove markdown-style triple backticks if present
@@ -16,6 +16,9 @@ from agents import Agent, Runner,OpenAIChatCompletionsModel
 from models.pft_models import DoctorFeedback
 from config import settings
 from utils.openai import get_client
+from utils.model_router import model_router
+from utils.event_loop import offload
+from utils.feedback_metrics import compute_feedback_metrics
 import re
 
 
@@ -25,7 +28,7 @@ class LearningAssistantAgent:
     """
     
     def __init__(self):
-        client = get_client()
+        client = get_client("LearningAssistant")
         self.agent = Agent(
             name="LearningAssistant",
             model=OpenAIChatCompletionsModel(model=settings.OPENAI_MODEL,openai_client=client),
@@ -158,7 +161,7 @@ class LearningAssistantAgent:
         Focus on actionable insights that can improve patient care and physician satisfaction.
         """
         
-        runner = Runner.run(self.agent, analysis_prompt)
+        runner = model_router.run(self.agent, "feedback_analysis", analysis_prompt, expect_json=True)
         result_obj = await runner
         try:
             raw_output = result_obj.final_output.strip()
@@ -284,7 +287,7 @@ class LearningAssistantAgent:
         }}
         """
         
-        runner = Runner.run(self.agent, learning_prompt)
+        runner = model_router.run(self.agent, "learning_opportunities", learning_prompt, expect_json=True)
         result_obj = await runner
         try:
             raw_output = result_obj.final_output.strip()
@@ -300,81 +303,60 @@ class LearningAssistantAgent:
     async def track_performance_metrics(
         self,
         metrics_data: List[Dict[str, Any]],
-        time_window: str = "30_days"
+        time_window: str = "30_days",
+        reports: Optional[Dict[str, Dict[str, Any]]] = None,
+        narrate: bool = True
     ) -> Dict[str, Any]:
         """
         Track and analyze performance metrics over time.
         
+        Agreement rates, kappa, trends and outliers are computed locally from
+        the feedback; the LLM only narrates the compact summary.
+        
         Args:
-            metrics_data: Performance metrics data
+            metrics_data: Doctor feedback entries
             time_window: Time window for analysis
+            reports: Stored reports keyed by report ID (AI's original labels)
+            narrate: Whether to ask the LLM for a narrative of the metrics
             
         Returns:
-            Performance tracking analysis
+            Computed metrics, plus the narrative under "analysis"
         """
+        metrics = await offload(compute_feedback_metrics, metrics_data, reports, time_window)
+        if not narrate or not metrics["summary"]["total_feedback_entries"]:
+            return metrics
         
+        compact = {key: metrics[key] for key in ("summary", "agreement", "trends", "outliers")}
         metrics_prompt = f"""
-        Analyze performance metrics over the {time_window} time window:
+        The following performance metrics over the {time_window} time window were
+        computed from physician feedback. Do not recompute or alter the numbers.
         
-        METRICS DATA:
-        {json.dumps(metrics_data, indent=2)}
+        METRICS:
+        {json.dumps(compact, indent=2)}
         
-        Provide performance tracking analysis in JSON format:
+        Provide a narrative in JSON format:
         {{
-            "metric_trends": {{
-                "accuracy_trend": {{
-                    "direction": "<improving|stable|declining>",
-                    "rate_of_change": <percentage change>,
-                    "statistical_significance": <true/false>
-                }},
-                "quality_trend": {{
-                    "direction": "<improving|stable|declining>",
-                    "rate_of_change": <percentage change>,
-                    "statistical_significance": <true/false>
-                }},
-                "efficiency_trend": {{
-                    "direction": "<improving|stable|declining>",
-                    "rate_of_change": <percentage change>,
-                    "statistical_significance": <true/false>
-                }}
-            }},
-            "performance_benchmarks": {{
-                "current_accuracy": <percentage>,
-                "target_accuracy": <percentage>,
-                "gap_analysis": "<analysis of performance gap>",
-                "benchmark_comparison": "<comparison to benchmarks>"
-            }},
-            "outlier_analysis": [
-                {{
-                    "outlier_type": "<type of outlier>",
-                    "frequency": <number>,
-                    "impact": "<impact description>",
-                    "investigation_needed": <true/false>
-                }}
-            ],
-            "improvement_trajectory": {{
-                "projected_improvement": "<projection of future improvement>",
-                "time_to_target": "<estimated time to reach targets>",
-                "confidence_interval": "<confidence in projections>"
-            }},
+            "gap_analysis": "<analysis of where performance falls short>",
+            "trend_summary": "<plain-language summary of the significant trends>",
+            "outlier_commentary": "<what the outliers suggest and whether to investigate>",
             "actionable_insights": [
                 "<specific actionable insights from metrics>"
             ]
         }}
         """
         
-        runner = Runner.run(self.agent, metrics_prompt)
-        result_obj = await runner
         try:
+            result_obj = await model_router.run(self.agent, "performance_narrative", metrics_prompt, expect_json=True)
             raw_output = result_obj.final_output.strip()
             # Remove markdown-style triple backticks if present
             if raw_output.startswith("```") and raw_output.endswith("```"):
                 # Remove language hint (e.g., ```json)
                 raw_output = re.sub(r"^```[a-zA-Z]*\n", "", raw_output)
                 raw_output = re.sub(r"\n```$", "", raw_output)
-            return json.loads(result_obj.final_output)
-        except json.JSONDecodeError:
-            return {"error": "Unable to analyze performance metrics"}
+            metrics["analysis"] = json.loads(raw_output)
+        except Exception:
+            metrics["analysis"] = {"error": "Unable to narrate performance metrics"}
+        return metrics
     
     async def generate_improvement_plan(
         self,
@@ -456,7 +438,7 @@ class LearningAssistantAgent:
         }}
         """
         
-        runner = Runner.run(self.agent, plan_prompt)
+        runner = model_router.run(self.agent, "improvement_plan", plan_prompt, expect_json=True)
         result_obj = await runner
         try:
             raw_output = result_obj.final_output.strip()
@@ -528,7 +510,7 @@ class LearningAssistantAgent:
         }}
         """
         
-        runner = Runner.run(self.agent, edge_case_prompt)
+        runner = model_router.run(self.agent, "edge_cases", edge_case_prompt, expect_json=True)
         result_obj = await runner
         try:
             raw_output = result_obj.final_output.strip()
@@ -580,7 +562,7 @@ class LearningAssistantAgent:
         Format as a professional report suitable for stakeholders.
         """
         
-        runner = Runner.run(self.agent, report_prompt)
+        runner = model_router.run(self.agent, "learning_report", report_prompt)
         result_obj = await runner
         return result_obj.final_output
 
@@ -10,21 +10,44 @@ This agent is responsible for:
 """
 
 import json
-from typing import Dict, Any, List, Optional
+import time
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 from agents import Agent, Runner,OpenAIChatCompletionsModel
+from openai.types.responses import ResponseTextDeltaEvent
 from models.pft_models import ChatMessage, ChatResponse
 from config import settings
 from utils.openai import get_client
+from utils.model_router import model_router
+from utils.resilience import resilience, is_retryable
+from utils.knowledge_index import source_name
+from utils.answer_cache import answer_cache, instructions_version
 import logging
 import re
 
 logger = logging.getLogger(__name__)
 
+# Bump when the terminology, technical or education prompt templates change
+ANSWER_PROMPT_VERSION = "1"
+
+# Optional structured fields a streamed chat answer can request, with their JSON shape
+CHAT_EXTRA_FIELDS = {
+    "confidence": "<0.0-1.0 confidence score>",
+    "key_points": '["<list of key points from the answer>"]',
+    "clinical_pearls": '["<relevant clinical pearls or tips>"]',
+    "related_concepts": '["<related medical concepts to explore>"]',
+    "follow_up_questions": '["<suggested follow-up questions>"]',
+    "limitations": '["<any limitations or caveats to the answer>"]',
+    "recommendations": '["<clinical recommendations if appropriate>"]',
+    "educational_content": '"<additional educational information>"',
+    "complexity_level": '"<basic|intermediate|advanced>"',
+    "specialty_consultation": "<true/false if specialist input recommended>"
+}
+
 class MedicalChatbotAgent:
     """Agent specialized in answering medical questions about PFT reports."""
     
     def __init__(self):
-        client = get_client()
+        client = get_client("MedicalChatbot")
         self.agent = Agent(
             name="MedicalChatbot",
             model=OpenAIChatCompletionsModel(model=settings.OPENAI_MODEL,openai_client=client),
@@ -78,47 +101,41 @@ class MedicalChatbotAgent:
             - Provide confidence level for responses
             """
         )
+        # Cached answers are invalidated whenever the instructions, models or prompts change
+        self.answer_version = instructions_version(
+            self.agent.instructions, settings.MODEL_SMALL, settings.MODEL_LARGE, ANSWER_PROMPT_VERSION
+        )
     
     async def answer_question(
         self,
         question: str,
         report_context: Optional[Dict[str, Any]] = None,
-        user_context: Optional[Dict[str, Any]] = None
+        user_context: Optional[Dict[str, Any]] = None,
+        conversation: Optional[Dict[str, Any]] = None,
+        references: Optional[List[Dict[str, Any]]] = None
     ) -> Dict[str, Any]:
         """
         Answer a medical question about PFT reports.
         
         Args:
             question: The medical question to answer
-            report_context: Related PFT report data for context
+            report_context: Related PFT report data (or its digest) for context
             user_context: Information about the user asking the question
+            conversation: Session memory with "summary" and recent "turns"
+            references: Retrieved guideline/terminology snippets to ground the answer
             
         Returns:
             Structured response with answer and metadata
         """
         
-        context_info = ""
-        if report_context:
-            context_info = f"""
-            RELATED PFT REPORT CONTEXT:
-            {json.dumps(report_context, indent=2)}
-            """
-        
-        user_info = ""
-        if user_context:
-            user_info = f"""
-            USER CONTEXT:
-            {json.dumps(user_context, indent=2)}
-            """
+        context, cited = self._question_context(report_context, user_context, conversation, references)
         
         question_prompt = f"""
         Please answer the following medical question about PFT interpretation:
         
         QUESTION: {question}
         
-        {context_info}
-        
-        {user_info}
+        {context}
         
         Provide a comprehensive, evidence-based response in the following JSON format:
         {{
@@ -146,7 +163,10 @@ class MedicalChatbotAgent:
         
         
         try:
-            runner = Runner.run(self.agent, question_prompt)
+            runner = model_router.run(
+                self.agent, "question", question_prompt,
+                signals={"input_chars": len(question)}, expect_json=True
+            )
             result_obj = await runner
             raw_output = result_obj.final_output.strip()
 
@@ -157,10 +177,196 @@ class MedicalChatbotAgent:
                 raw_output = re.sub(r"\n```$", "", raw_output)
             data = json.loads(raw_output)
             logger.info(data)
-            return data
         except Exception as e:
             logger.info(e)
-            return self._generate_fallback_response(question)
+            data = self._generate_fallback_response(question)
+        # Retrieved snippets are cited first so every answer carries grounded sources
+        if cited:
+            data["sources"] = cited + [source for source in data.get("sources", []) if source not in cited]
+        return data
+    
+    def _question_context(
+        self,
+        report_context: Optional[Dict[str, Any]],
+        user_context: Optional[Dict[str, Any]],
+        conversation: Optional[Dict[str, Any]],
+        references: Optional[List[Dict[str, Any]]]
+    ) -> Tuple[str, List[str]]:
+        """Prompt sections for a chat question, and the citations of the retrieved snippets."""
+        context_info = ""
+        if report_context:
+            context_info = f"""
+            RELATED PFT REPORT CONTEXT:
+            {json.dumps(report_context, separators=(",", ":"), default=str)}
+            """
+        
+        conversation_info = ""
+        if conversation and (conversation.get("summary") or conversation.get("turns")):
+            history = "\n".join(f"{turn['role'].upper()}: {turn['content']}" for turn in conversation.get("turns", []))
+            conversation_info = f"""
+            EARLIER CONVERSATION SUMMARY:
+            {conversation.get("summary") or "None"}
+            
+            RECENT TURNS:
+            {history or "None"}
+            """
+        
+        reference_info = ""
+        cited = [source_name(reference) for reference in references or []]
+        if references:
+            snippets = "\n".join(f"[{i + 1}] {name}: {reference['text']}"
+                                 for i, (name, reference) in enumerate(zip(cited, references)))
+            reference_info = f"""
+            REFERENCE SNIPPETS (prefer these over general knowledge; list the ones you use in "sources"):
+            {snippets}
+            """
+        
+        user_info = ""
+        if user_context:
+            user_info = f"""
+            USER CONTEXT:
+            {json.dumps(user_context, indent=2)}
+            """
+        
+        return "\n".join([conversation_info, reference_info, context_info, user_info]), cited
+    
+    async def stream_answer(
+        self,
+        question: str,
+        report_context: Optional[Dict[str, Any]] = None,
+        user_context: Optional[Dict[str, Any]] = None,
+        conversation: Optional[Dict[str, Any]] = None,
+        references: Optional[List[Dict[str, Any]]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the answer text to a question as it is generated.
+        
+        Only the answer itself is requested, as plain text, so the first
+        tokens arrive without waiting for any structured fields.
+        
+        Yields:
+            Text deltas of the answer
+        """
+        context, _ = self._question_context(report_context, user_context, conversation, references)
+        stream_prompt = f"""
+        Please answer the following medical question about PFT interpretation:
+        
+        QUESTION: {question}
+        
+        {context}
+        
+        Reply with the answer only, as plain text (no JSON), citing reference snippets by number where used.
+        Be medically accurate, evidence-based and clinically practical, and acknowledge limitations.
+        """
+        agent, model = model_router.agent_for(self.agent, "stream", {"input_chars": len(question)})
+        # Tokens already sent cannot be retried, so a stream only honours the circuit breaker
+        breaker = resilience.breaker(model)
+        breaker.check()
+        start = time.perf_counter()
+        result = Runner.run_streamed(agent, stream_prompt)
+        try:
+            async for event in result.stream_events():
+                if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                    yield event.data.delta
+        except Exception as e:
+            if is_retryable(e):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        finally:
+            if not result.is_complete:
+                result.cancel()
+                breaker.release()
+        breaker.record_success()
+        model_router.track(self.agent.name, "stream", model)
+        await model_router.record_result(self.agent.name, "stream", model, result, time.perf_counter() - start)
+    
+    async def answer_extras(
+        self,
+        question: str,
+        answer: str,
+        extras: List[str],
+        report_context: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate the requested structured extras for an answer that was already streamed.
+        
+        Args:
+            question: The question that was answered
+            answer: The streamed answer text
+            extras: Fields to generate, from CHAT_EXTRA_FIELDS
+            
+        Returns:
+            The requested fields
+        """
+        fields = {name: CHAT_EXTRA_FIELDS[name] for name in extras if name in CHAT_EXTRA_FIELDS}
+        if not fields:
+            return {}
+        template = ",\n".join(f'    "{name}": {shape}' for name, shape in fields.items())
+        context = ""
+        if report_context:
+            context = f"RELATED PFT REPORT CONTEXT:\n{json.dumps(report_context, separators=(',', ':'), default=str)}"
+        extras_prompt = f"""
+        QUESTION: {question}
+        
+        ANSWER GIVEN:
+        {answer}
+        
+        {context}
+        
+        Provide only the following fields for this answer in JSON format:
+        {{
+        {template}
+        }}
+        """
+        try:
+            result_obj = await model_router.run(self.agent, "extras", extras_prompt, expect_json=True)
+            raw_output = result_obj.final_output.strip()
+            # Remove markdown-style triple backticks if present
+            if raw_output.startswith("```") and raw_output.endswith("```"):
+                # Remove language hint (e.g., ```json)
+                raw_output = re.sub(r"^```[a-zA-Z]*\n", "", raw_output)
+                raw_output = re.sub(r"\n```$", "", raw_output)
+            data = json.loads(raw_output)
+            return {name: data.get(name) for name in fields}
+        except Exception as e:
+            logger.info(e)
+            fallback = self._generate_fallback_response(question)
+            return {name: fallback.get(name) for name in fields}
+    
+    async def summarize_conversation(self, previous_summary: str, turns: List[Dict[str, Any]]) -> str:
+        """
+        Fold older chat turns into the rolling conversation summary.
+        
+        Args:
+            previous_summary: Summary of the conversation so far
+            turns: Turns leaving the recent-history window
+            
+        Returns:
+            Updated summary
+        """
+        transcript = "\n".join(f"{turn['role'].upper()}: {turn['content']}" for turn in turns)
+        summary_prompt = f"""
+        Update the summary of a clinical chat about pulmonary function tests.
+        
+        CURRENT SUMMARY:
+        {previous_summary or "None"}
+        
+        NEW TURNS:
+        {transcript}
+        
+        Return only the updated summary as plain text, at most {settings.CHAT_SUMMARY_MAX_CHARS // 6} words.
+        Keep the questions asked, values and conclusions discussed, and any open follow-ups.
+        """
+        try:
+            result = await model_router.run(self.agent, "summary", summary_prompt)
+            return result.final_output.strip()
+        except Exception as e:
+            logger.info(e)
+            # Keep the most recent material if the summary cannot be generated
+            combined = f"{previous_summary}\n{transcript}".strip()
+            return combined[-settings.CHAT_SUMMARY_MAX_CHARS:]
     
     def _generate_fallback_response(self, question: str) -> Dict[str, Any]:
         """
@@ -217,7 +423,7 @@ class MedicalChatbotAgent:
         Make the explanation educational and clear for medical professionals.
         """
         
-        runner = Runner.run(self.agent, rationale_prompt)
+        runner = model_router.run(self.agent, "rationale", rationale_prompt)
         result_obj = await runner
         raw_output = result_obj.final_output.strip()
             # Remove markdown-style triple backticks if present
@@ -267,8 +473,7 @@ class MedicalChatbotAgent:
         }}
         """
         
-        from agents import Runner
-        result = Runner.run(self.agent, differential_prompt)
+        result = model_router.run(self.agent, "differential", differential_prompt, expect_json=True)
         result_obj = await result
         try:
 
@@ -290,9 +495,14 @@ class MedicalChatbotAgent:
             term: Medical term to explain
             
         Returns:
-            Explanation of the medical term
+            Explanation of the medical term, with cache provenance under "cache"
         """
-        
+        explanation, provenance = await answer_cache.get_or_compute(
+            "terminology", term, self.answer_version, lambda: self._explain_medical_terminology(term)
+        )
+        return {**explanation, "cache": provenance}
+    
+    async def _explain_medical_terminology(self, term: str) -> Dict[str, Any]:
         terminology_prompt = f"""
         Explain the medical term "{term}" in the context of pulmonary function testing:
         
@@ -310,8 +520,7 @@ class MedicalChatbotAgent:
         }}
         """
         
-        from agents import Runner
-        result = Runner.run(self.agent, terminology_prompt)
+        result = model_router.run(self.agent, "terminology", terminology_prompt, expect_json=True)
         result_obj = await result
         
         try:
@@ -321,14 +530,18 @@ class MedicalChatbotAgent:
                 # Remove language hint (e.g., ```json)
                 raw_output = re.sub(r"^```[a-zA-Z]*\n", "", raw_output)
                 raw_output = re.sub(r"\n```$", "", raw_output)
-            return json.loads(raw_output)
+            explanation = json.loads(raw_output)
+            # A list or string reply gets the same fallback as unparseable output
+            if isinstance(explanation, dict):
+                return explanation
         except json.JSONDecodeError:
-            return {
-                "term": term,
-                "definition": f"Medical term: {term}",
-                "clinical_significance": "Consult medical literature for detailed information",
-                "error": "Unable to generate detailed explanation"
-            }
+            pass
+        return {
+            "term": term,
+            "definition": f"Medical term: {term}",
+            "clinical_significance": "Consult medical literature for detailed information",
+            "error": "Unable to generate detailed explanation"
+        }
     
     async def provide_treatment_guidance(
         self,
@@ -372,8 +585,7 @@ class MedicalChatbotAgent:
         Note: This is general guidance only. All treatment decisions should be individualized based on complete clinical assessment.
         """
         
-        from agents import Runner
-        result = Runner.run(self.agent, treatment_prompt)
+        result = model_router.run(self.agent, "treatment", treatment_prompt, expect_json=True)
         result_obj = await result
         try:
             raw_output = result_obj.final_output.strip()
@@ -394,9 +606,14 @@ class MedicalChatbotAgent:
             question: Technical question about PFTs
             
         Returns:
-            Technical answer and guidance
+            Technical answer and guidance, with cache provenance under "cache"
         """
-        
+        answer, provenance = await answer_cache.get_or_compute(
+            "technical", question, self.answer_version, lambda: self._answer_technical_question(question)
+        )
+        return {**answer, "cache": provenance}
+    
+    async def _answer_technical_question(self, question: str) -> Dict[str, Any]:
         technical_prompt = f"""
         Answer the following technical question about pulmonary function testing:
         
@@ -416,8 +633,7 @@ class MedicalChatbotAgent:
         }}
         """
         
-        from agents import Runner
-        result = Runner.run(self.agent, technical_prompt)
+        result = model_router.run(self.agent, "technical", technical_prompt, expect_json=True)
         result_obj = await result
         try:
             raw_output = result_obj.final_output.strip()
@@ -426,21 +642,37 @@ class MedicalChatbotAgent:
                 # Remove language hint (e.g., ```json)
                 raw_output = re.sub(r"^```[a-zA-Z]*\n", "", raw_output)
                 raw_output = re.sub(r"\n```$", "", raw_output)
-            return json.loads(raw_output)
+            answer = json.loads(raw_output)
+            # A list or string reply gets the same fallback as unparseable output
+            if isinstance(answer, dict):
+                return answer
         except json.JSONDecodeError:
-            return {"error": "Unable to generate technical response"}
+            pass
+        return {"error": "Unable to generate technical response"}
     
-    def generate_educational_content(self, topic: str) -> str:
+    async def generate_educational_content(self, topic: str, include_provenance: bool = False):
         """
         Generate educational content about PFT-related topics.
         
         Args:
             topic: Educational topic to cover
+            include_provenance: Return {"topic", "content", "cache"} instead of the text
             
         Returns:
             Educational content
         """
-        
+        content, provenance = await answer_cache.get_or_compute(
+            "education", topic, self.answer_version, lambda: self._generate_educational_content(topic)
+        )
+        if include_provenance:
+            return {"topic": topic, "content": content, "cache": provenance}
+        return content
+    
+    def prewarm_terminology(self, terms: List[str]):
+        """Generate cached explanations for common terms in the background."""
+        answer_cache.start_warm("terminology", terms, self.answer_version, self._explain_medical_terminology)
+    
+    async def _generate_educational_content(self, topic: str) -> str:
         education_prompt = f"""
         Generate educational content about the following PFT-related topic:
         
@@ -458,8 +690,7 @@ class MedicalChatbotAgent:
         Make the content suitable for medical professionals seeking to enhance their understanding.
         """
         
-        from agents import Runner
-        result = Runner.run_sync(self.agent, education_prompt)
+        result = await model_router.run(self.agent, "education", education_prompt)
         return result.final_output
 
 
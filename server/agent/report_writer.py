@@ -15,6 +15,7 @@ from datetime import datetime
 from agents import Agent, Runner,OpenAIChatCompletionsModel
 from config import settings
 from utils.openai import get_client
+from utils.model_router import model_router
 import re
 
 
@@ -22,7 +23,7 @@ class ReportWriterAgent:
     """Agent specialized in generating professional medical reports."""
     
     def __init__(self):
-        client = get_client()
+        client = get_client("ReportWriter")
         self.agent = Agent(
             name="ReportWriter",
             model=OpenAIChatCompletionsModel(model=settings.OPENAI_MODEL,openai_client=client),
@@ -159,8 +160,7 @@ class ReportWriterAgent:
         """
         
         try:
-            from agents import Runner
-            result = Runner.run(self.agent, report_prompt)
+            result = model_router.run(self.agent, "report", report_prompt, expect_json=True)
             result_obj = await result
             raw_output = result_obj.final_output.strip()
             # Remove markdown-style triple backticks if present
@@ -284,8 +284,7 @@ class ReportWriterAgent:
         
         try:
             
-            from agents import Runner
-            result = Runner.run(self.agent, validation_prompt)
+            result = model_router.run(self.agent, "quality_validation", validation_prompt, expect_json=True)
             result_obj = await result
             raw_output = result_obj.final_output.strip()
             # Remove markdown-style triple backticks if present
@@ -10,18 +10,23 @@ This agent is responsible for:
 """
 
 import json
+import logging
 from typing import Dict, Any, List
 from agents import Agent, Runner,OpenAIChatCompletionsModel
 from models.pft_models import TriageLevel, TriageAssessment
 from config import settings
 from utils.openai import get_client
+from utils.model_router import model_router
+from utils.longitudinal import assess_decline
+
+logger = logging.getLogger(__name__)
 
 
 class TriageSpecialistAgent:
     """Agent specialized in triaging PFT cases based on clinical urgency."""
     
     def __init__(self):
-        client = get_client()
+        client = get_client("TriageSpecialist")
         self.agent = Agent(
             name="TriageSpecialist",
             model=OpenAIChatCompletionsModel(model=settings.OPENAI_MODEL,openai_client=client),
@@ -168,9 +173,12 @@ class TriageSpecialistAgent:
         """
         
         try:
-            runner = Runner.run(self.agent, triage_prompt)
+            runner = model_router.run(self.agent, "triage", triage_prompt, expect_json=True)
             result_obj = await runner
-            return json.loads(result_obj.final_output)
+            result = json.loads(result_obj.final_output)
+            # Worklist rebuilds keep agent assessments but recompute rule-based ones
+            result["assessed_by"] = "agent"
+            return result
         except Exception as e:
             return self._fallback_triage_assessment(interpretation, percent_predicted)
     
@@ -252,7 +260,8 @@ class TriageSpecialistAgent:
             "patient_safety_concerns": red_flags,
             "clinical_rationale": f"Triage level {triage_level} based on {severity} {pattern} pattern",
             "red_flags": red_flags,
-            "follow_up_instructions": self._generate_follow_up_instructions(triage_level, pattern)
+            "follow_up_instructions": self._generate_follow_up_instructions(triage_level, pattern),
+            "assessed_by": "rules"
         }
     
     def _identify_risk_factors(self, interpretation: Dict[str, Any]) -> List[str]:
@@ -325,17 +334,22 @@ class TriageSpecialistAgent:
         
         return instructions
     
-    def assess_rapid_decline(
+    async def assess_rapid_decline(
         self,
         current_data: Dict[str, Any],
-        historical_data: List[Dict[str, Any]]
+        historical_data: List[Dict[str, Any]],
+        include_narrative: bool = False
     ) -> Dict[str, Any]:
         """
         Assess for rapid decline in lung function.
         
+        Decline is computed locally (per-parameter regression slopes with
+        confidence intervals); the LLM is only asked for a narrative.
+        
         Args:
-            current_data: Current PFT measurements
+            current_data: Current PFT measurements (optionally with test_date)
             historical_data: Historical PFT data
+            include_narrative: Ask the agent to explain the computed trend
             
         Returns:
             Rapid decline assessment
@@ -344,41 +358,26 @@ class TriageSpecialistAgent:
         if not historical_data:
             return {"rapid_decline": False, "assessment": "No historical data for comparison"}
         
-        decline_prompt = f"""
-        Assess for rapid decline in lung function:
-        
-        CURRENT DATA:
-        {json.dumps(current_data, indent=2)}
+        assessment = assess_decline(current_data, historical_data)
+        if not include_narrative or not assessment.get("parameters"):
+            return assessment
         
-        HISTORICAL DATA:
-        {json.dumps(historical_data, indent=2)}
-        
-        Assess for:
-        1. Accelerated FEV1 decline (>60 mL/year)
-        2. Rapid FVC decline
-        3. Significant DLCO deterioration
-        4. Overall pattern of accelerated decline
+        narrative_prompt = f"""
+        Explain the clinical significance of this lung function trend in 2-3 sentences
+        for the referring physician. Do not recompute the numbers.
         
-        Return assessment in JSON format:
-        {{
-            "rapid_decline": <true/false>,
-            "decline_rate": "<annual decline rate>",
-            "parameters_affected": ["<list of parameters showing rapid decline>"],
-            "clinical_significance": "<significance of decline>",
-            "recommended_actions": ["<recommended actions>"],
-            "urgency_upgrade": <true/false if triage should be upgraded>
-        }}
+        COMPUTED TREND:
+        {json.dumps(assessment, indent=2)}
         """
         
-        from agents import Runner
-        result = Runner.run_sync(self.agent, decline_prompt)
-        
         try:
-            return json.loads(result.final_output)
-        except json.JSONDecodeError:
-            return {"rapid_decline": False, "assessment": "Unable to assess decline"}
+            result_obj = await model_router.run(self.agent, "decline_narrative", narrative_prompt)
+            assessment["clinical_significance"] = result_obj.final_output.strip()
+        except Exception as e:
+            logger.warning(f"Decline narrative failed: {e}")
+        return assessment
     
-    def identify_complex_cases(
+    async def identify_complex_cases(
         self,
         interpretation: Dict[str, Any],
         patient_demographics: Dict[str, Any]
@@ -423,12 +422,10 @@ class TriageSpecialistAgent:
         }}
         """
         
-        from agents import Runner
-        result = Runner.run_sync(self.agent, complexity_prompt)
-        
         try:
+            result = await model_router.run(self.agent, "complex_cases", complexity_prompt, expect_json=True)
             return json.loads(result.final_output)
-        except json.JSONDecodeError:
+        except Exception:
             return {
                 "complex_case": False,
                 "complexity_factors": [],
@@ -3,7 +3,7 @@ Configuration settings for AutoPFTReport System.
 """
 
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from typing import Any
 from pydantic_settings import BaseSettings,SettingsConfigDict
 
@@ -44,11 +44,77 @@ class Settings(BaseSettings):
     SUPPORTED_FILE_TYPES: list = ["txt", "pdf", "csv", "xlsx", "xml", "json"]
     MAX_PROCESSING_TIME: int = 600  # 10 minutes
     MAX_CONCURRENT_REQUESTS: int = 10
+    UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "./uploads")
+    BLOB_DIR: str = os.getenv("BLOB_DIR", "./uploads/blobs")
+    EXTRACTION_WORKERS: int = 2  # processes for CPU-bound PDF/XLSX extraction
+    EXTRACTION_TIMEOUT: int = 30  # seconds
+    EXTRACTION_MAX_CHARS: int = 20000  # extracted text handed to the parser/LLM
+    PDF_MAX_PAGES: int = 20
+    XLSX_MAX_ROWS: int = 5000  # rows scanned per worksheet
+    DEDUP_TTL: int = 30 * 24 * 60 * 60  # seconds an upload fingerprint points at its report
+    DEDUP_CLAIM_TTL: int = 600  # seconds a claimed upload shows as queued before its request is stored
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 1MB
+    MAX_BATCH_FILES: int = 1000
+    MAX_BATCH_ARCHIVE_SIZE: int = 1024 * 1024 * 1024  # 1GB
+    MAX_INTERPRET_BATCH: int = 10000  # studies per /pft/interpret/batch call
+    LOOP_LAG_INTERVAL: float = 0.1  # seconds between event loop heartbeats
+    LOOP_LAG_THRESHOLD: float = 0.25  # seconds of loop lag logged as a stall
     
     # Database Configuration (for future use)
     DATABASE_URL: str = "sqlite:///./autopftreport.db"
     # Redis Configuration
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://redis:6379/0")
+    REDIS_MAX_CONNECTIONS: int = 50
+    STATUS_FLUSH_INTERVAL: float = 0.25  # seconds; intermediate progress updates are coalesced within this window
+    
+    # WebSocket Progress Configuration
+    WS_HEARTBEAT_INTERVAL: float = 20.0  # seconds
+    WS_QUEUE_SIZE: int = 100  # per-connection buffer before a slow consumer is dropped
+    WS_MAX_SUBSCRIPTIONS: int = 200  # request IDs per multiplexed connection
+    
+    # Server-Sent Events Progress Configuration
+    SSE_KEEPALIVE_INTERVAL: float = 15.0  # seconds
+    PROGRESS_STREAM_MAXLEN: int = 100  # events kept per request for Last-Event-ID replay
+    PROGRESS_STREAM_TTL: int = 24 * 60 * 60  # seconds
+    
+    # Feedback Analytics Configuration
+    FEEDBACK_STREAM_MAXLEN: int = 100000  # entries kept in the feedback stream
+    FEEDBACK_BATCH_SIZE: int = 100  # stream entries aggregated per read
+    FEEDBACK_POLL_INTERVAL: float = 5.0  # seconds a read blocks waiting for feedback
+    FEEDBACK_CLAIM_IDLE: float = 60.0  # seconds before another worker's unacknowledged entries are taken over
+    FEEDBACK_WINDOW_SIZE: int = 50  # most recent entries in the sliding window
+    FEEDBACK_SUMMARY_INTERVAL: int = 24 * 60 * 60  # seconds between scheduled LLM summaries
+    FEEDBACK_SUMMARY_COOLDOWN: int = 60 * 60  # minimum seconds between any two LLM summaries
+    FEEDBACK_DRIFT_MIN_ENTRIES: int = 10  # window entries needed before drift is evaluated
+    FEEDBACK_RATING_DRIFT: float = 0.5  # drop in a window mean rating (1-5 scale) that triggers a summary
+    FEEDBACK_CORRECTION_DRIFT: float = 0.15  # rise in a window correction rate that triggers a summary
+    
+    # Chat Session Configuration
+    CHAT_SESSION_TTL: int = 24 * 60 * 60  # seconds of inactivity before a chat session expires
+    CHAT_HISTORY_TURNS: int = 6  # question/answer pairs kept verbatim in the prompt
+    CHAT_TURN_MAX_CHARS: int = 1500  # characters stored per message
+    CHAT_SUMMARY_MAX_CHARS: int = 2000  # rolling summary of older turns
+    
+    # Knowledge Retrieval Configuration
+    KNOWLEDGE_CORPUS_PATH: str = "./data/knowledge/corpus.jsonl"  # guideline excerpts and terminology
+    KNOWLEDGE_INDEX_DIR: str = os.getenv("KNOWLEDGE_INDEX_DIR", "./data/knowledge/index")
+    RETRIEVAL_TOP_K: int = 4  # snippets added to a chat prompt
+    RETRIEVAL_MIN_SCORE: float = 1.0  # BM25 score below which a snippet is not used
+    
+    # Answer Cache Configuration (terminology, technical and educational answers)
+    ANSWER_CACHE_TTL: int = 180 * 24 * 60 * 60  # seconds an answer is kept
+    ANSWER_CACHE_REFRESH_AFTER: int = 30 * 24 * 60 * 60  # seconds before an answer is regenerated in the background
+    ANSWER_CACHE_LOCAL_SIZE: int = 1024  # answers held in process memory
+    ANSWER_CACHE_LOCAL_TTL: int = 300  # seconds before a process-memory answer is re-read from Redis
+    ANSWER_CACHE_PREWARM: bool = True  # generate COMMON_PFT_TERMS explanations at startup
+    
+    # Model Routing Configuration (see MODEL_ROUTES)
+    MODEL_ROUTING_ENABLED: bool = True  # False sends every call to OPENAI_MODEL
+    MODEL_SMALL: str = os.getenv("MODEL_SMALL", "openai/gpt-4o-mini")
+    MODEL_LARGE: str = os.getenv("MODEL_LARGE", "openai/gpt-4o")
+    ROUTING_MIN_CONFIDENCE: float = 0.6  # answers below this confidence are retried on the large model
+    ROUTING_LONG_INPUT_CHARS: int = 600  # questions longer than this go to the large model
+    ROUTING_LARGE_FILE_TYPES: list = ["pdf", "xlsx", "xml"]  # extractions that go to the large model
     
     # Logging Configuration
     LOG_LEVEL: str = "INFO"
@@ -63,11 +129,35 @@ class Settings(BaseSettings):
     ALLOWED_METHODS: list = ["*"]
     ALLOWED_HEADERS: list = ["*"]
     
+    # LLM Gateway Connection Pool Configuration
+    LLM_POOL_MAX_CONNECTIONS: int = 50  # concurrent connections to the gateway per worker
+    LLM_POOL_MAX_KEEPALIVE: int = 20  # idle connections kept open for reuse
+    LLM_KEEPALIVE_EXPIRY: float = 60.0  # seconds an idle connection is kept
+    LLM_HTTP2: bool = True  # multiplex requests over one connection (needs the h2 package)
+    LLM_CONNECT_TIMEOUT: float = 5.0  # seconds
+    LLM_WARMUP_CONNECTIONS: int = 4  # connections opened at startup (one with HTTP/2)
+    
     # Agent Configuration
     AGENT_TIMEOUT: int = 120  # seconds
     RETRY_ATTEMPTS: int = 3
     RETRY_DELAY: int = 5  # seconds
     
+    # Agent Call Resilience Configuration (see utils/resilience.py)
+    RETRY_MAX_DELAY: float = 30.0  # cap on one backoff sleep, in seconds
+    RESILIENCE_FALLBACK_MARGIN: float = 5.0  # seconds of a step's timeout left for the deterministic fallback
+    CIRCUIT_FAILURE_THRESHOLD: int = 5  # consecutive failures that open a model endpoint's circuit
+    CIRCUIT_RESET_TIMEOUT: float = 30.0  # seconds before an open circuit lets a probe call through
+    HEDGE_ENABLED: bool = False  # duplicate calls slower than the endpoint's recent HEDGE_PERCENTILE latency
+    HEDGE_PERCENTILE: float = 95.0
+    HEDGE_MIN_SAMPLES: int = 20  # latencies needed before calls are hedged
+    LATENCY_WINDOW: int = 200  # recent latencies kept per endpoint
+    
+    # Stage Checkpoint Configuration (see utils/checkpoints.py)
+    CHECKPOINT_TTL: int = 7 * 24 * 60 * 60  # seconds a failed or interrupted run can be resumed
+    CHECKPOINT_LEASE: int = 180  # seconds a running request is held without a stage completing (> longest step)
+    CHECKPOINT_SCAN_INTERVAL: float = 60.0  # seconds between scans for interrupted runs
+    CHECKPOINT_MAX_ATTEMPTS: int = 3  # runs of a request before automatic resumption gives up
+    
     # Quality Thresholds
     MIN_INTERPRETATION_CONFIDENCE: float = 0.7
     MIN_REPORT_QUALITY_SCORE: float = 7.0
@@ -144,9 +234,89 @@ MEDICAL_GUIDELINES = {
             "Clinical correlation",
             "Common patterns"
         ]
+    },
+    "ats_ers_2005_interpretation": {
+        "name": "ATS/ERS Task Force: Interpretative strategies for lung function tests",
+        "url": "https://erj.ersjournals.com/content/26/5/948",
+        "key_points": [
+            "Pattern recognition",
+            "Severity grading",
+            "DLCO and lung volume interpretation"
+        ]
+    },
+    "ats_ers_2019": {
+        "name": "Standardization of Spirometry 2019 Update (ATS/ERS)",
+        "url": "https://www.atsjournals.org/doi/10.1164/rccm.201908-1590ST",
+        "key_points": [
+            "Acceptability and repeatability criteria",
+            "Quality grading",
+            "Bronchodilator testing procedure"
+        ]
+    },
+    "ers_ats_2022": {
+        "name": "ERS/ATS technical standard on interpretive strategies for routine lung function tests",
+        "url": "https://erj.ersjournals.com/content/60/1/2101499",
+        "key_points": [
+            "LLN and z-score based interpretation",
+            "Bronchodilator responsiveness",
+            "Severity by z-score"
+        ]
+    },
+    "gli_2012": {
+        "name": "GLI-2012 multi-ethnic reference equations for spirometry",
+        "url": "https://erj.ersjournals.com/content/40/6/1324",
+        "key_points": [
+            "Predicted values from 3 to 95 years",
+            "Lower limit of normal",
+            "Z-scores"
+        ]
+    }
+}
+
+# Timeout per agent, in seconds: the orchestrator step timeout, the agent's HTTP client
+# timeout and its retry budget. "Agent.task" entries override the agent's for one task.
+AGENT_TIMEOUTS = {
+    "DataSpecialist": 60,
+    "Interpreter": 90,
+    "TriageSpecialist": 60,
+    "ReportWriter": 120,
+    "ReportWriter.quality_validation": 30,
+    "MedicalChatbot": 60,
+    "LearningAssistant": 120
+}
+
+# Model tier ("small" or "large") per agent and task; unlisted tasks use the large model.
+# Complexity signals and low-confidence/unparseable answers escalate small routes to large.
+MODEL_ROUTES = {
+    "DataSpecialist": {"extraction": "small", "validation": "small"},
+    "Interpreter": {"interpretation": "small", "reversibility": "small"},
+    "TriageSpecialist": {"triage": "small", "decline_narrative": "small", "complex_cases": "large"},
+    "ReportWriter": {"report": "large", "quality_validation": "small"},
+    "MedicalChatbot": {
+        "question": "small", "stream": "small", "extras": "small", "summary": "small",
+        "terminology": "small", "technical": "small", "education": "small",
+        "rationale": "large", "differential": "large", "treatment": "large"
+    },
+    "LearningAssistant": {
+        "feedback_analysis": "small", "performance_narrative": "small", "learning_opportunities": "large",
+        "improvement_plan": "large", "edge_cases": "large", "learning_report": "large"
     }
 }
 
+# USD per million (input, output) tokens, for the cost recorded per route
+MODEL_PRICING = {
+    "openai/gpt-4o": (2.50, 10.00),
+    "openai/gpt-4o-mini": (0.15, 0.60)
+}
+
+# Terms whose explanations are pre-generated into the answer cache
+COMMON_PFT_TERMS = [
+    "FEV1", "FVC", "FEV1/FVC", "DLCO", "KCO", "TLC", "RV", "FRC", "RV/TLC", "LLN", "z-score",
+    "percent predicted", "PEF", "FEF25-75", "bronchodilator response", "post-bronchodilator",
+    "obstructive pattern", "restrictive pattern", "mixed pattern", "air trapping", "hyperinflation",
+    "flow-volume loop", "GLI reference equations", "spirometry quality grade"
+]
+
 # Error Messages and User Feedback
 ERROR_MESSAGES = {
     "file_too_large": "File size exceeds maximum limit of {max_size}MB",
@@ -218,6 +388,11 @@ def is_supported_file_type(file_type: str) -> bool:
     """Check if file type is supported."""
     return file_type.lower() in [ft.lower() for ft in settings.SUPPORTED_FILE_TYPES]
 
+def timeout_key(agent_name: str, task: Optional[str] = None) -> str:
+    """AGENT_TIMEOUTS entry for an agent's task: "Agent.task" if listed, else the agent's."""
+    key = f"{agent_name}.{task}"
+    return key if task and key in AGENT_TIMEOUTS else agent_name
+
 def get_processing_timeout() -> int:
     """Get processing timeout in seconds."""
     return settings.MAX_PROCESSING_TIME
@@ -9,37 +9,61 @@ import os
 import uuid
 import asyncio
 import json
+import shutil
+import zipfile
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 import uvicorn
-from fastapi import WebSocket
+from fastapi import WebSocket, WebSocketDisconnect
 
-import redis.asyncio as aioredis
-from config import settings
+from config import settings, COMMON_PFT_TERMS
 import logging
 from fastapi import Request
 
 # Import our models and agents
 from models.pft_models import (
     PFTProcessingRequest, PFTProcessingResponse, PFTReport,
-    DoctorFeedback, ChatMessage, ChatResponse, TriageLevel
+    DoctorFeedback, ChatMessage, ChatStreamRequest, ChatResponse, TriageLevel, PatientDemographics,
+    BatchInterpretationRequest
 )
 # Agent imports
 from agent.data_specialist import DataSpecialistAgent
 from agent.interpreter import InterpreterAgent
 from agent.report_writer import ReportWriterAgent
 from agent.triage_specialist import TriageSpecialistAgent
-from agent.medical_chatbot import MedicalChatbotAgent
+from agent.medical_chatbot import MedicalChatbotAgent, CHAT_EXTRA_FIELDS
 from agent.learning_assistant import LearningAssistantAgent
 
 # Workflow orchestrator for PFT processing
 from utils.orchestrator import PFTWorkflowOrchestrator
 
 from utils import openai
+from utils.redis import get_redis
+from utils.progress_hub import progress_hub
+from utils.progress import progress_stream_key, is_terminal
+from utils.uploads import (
+    UploadTooLargeError, DEMOGRAPHIC_FIELDS, spool_upload, extract_zip,
+    parse_manifest, file_extension, batch_directory
+)
+from utils.blob_store import blob_store
+from utils.dedup import dedup_index, upload_fingerprint
+from utils.document_extraction import shutdown_executor
+from utils.pft_rules import interpret_batch, triage_batch
+from utils.worklist import worklist, WORKLIST_LEVELS
+from utils.event_loop import loop_monitor, offload
+from utils.feedback_stats import feedback_aggregator
+from utils.chat_sessions import chat_sessions
+from utils.report_digest import report_digests, sections_for_question
+from utils.knowledge_index import knowledge_index, source_name
+from utils.model_router import model_router
+from utils.resilience import resilience
+from utils.answer_cache import answer_cache
+from utils.checkpoints import checkpoints
 # from openai import AsyncOpenAI
 
 # from agents import (
@@ -74,7 +98,8 @@ app.add_middleware(
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     logger.info(f"HTTP request: {request.method} {request.url}")
-    response = await call_next(request)
+    with loop_monitor.track(f"{request.method} {request.url.path}"):
+        response = await call_next(request)
     logger.info(f"HTTP response: {response.status_code} {request.url}")
     return response
 
@@ -90,9 +115,8 @@ learning_assistant = LearningAssistantAgent()
 workflow = PFTWorkflowOrchestrator()
 
 # Redis-based storage for requests, completed reports, and feedback
-redis_client = aioredis.from_url(
-    settings.REDIS_URL, encoding="utf-8", decode_responses=True
-)
+# (shares the worker-wide connection pool with the orchestrator)
+redis_client = get_redis()
 
 
 class ProcessingStatus(BaseModel):
@@ -124,11 +148,20 @@ async def root():
         "description": "AI-powered PFT interpretation and reporting system",
         "endpoints": {
             "upload": "/pft/upload",
+            "batch_upload": "/pft/upload/batch",
+            "batch_status": "/pft/batch/{batch_id}",
             "status": "/pft/status/{request_id}",
+            "progress_ws": "/pft/ws",
+            "progress_events": "/pft/events/{request_id}",
             "report": "/pft/report/{request_id}",
+            "retry": "/pft/retry/{request_id}",
             "interpret": "/pft/interpret",
+            "interpret_batch": "/pft/interpret/batch",
+            "worklist": "/pft/worklist/{level}",
             "feedback": "/pft/feedback",
             "chat": "/chat",
+            "chat_stream": "/chat/stream",
+            "terminology": "/chat/terminology/{term}",
             "health": "/health"
         }
     }
@@ -148,26 +181,144 @@ async def health_check():
             "triage_specialist": "active",
             "medical_chatbot": "active",
             "learning_assistant": "active"
-        }
+        },
+        "event_loop": loop_monitor.stats(),
+        "answer_cache": answer_cache.stats(),
+        "llm_pool": openai.pool_stats(),
+        "resilience": resilience.stats()
     }
 
 
+@app.on_event("startup")
+async def start_background_services():
+    """Start worker-wide background services."""
+    await progress_hub.start()
+    await loop_monitor.start()
+    await feedback_aggregator.start(summarize=learning_assistant.analyze_feedback_batch)
+    await asyncio.to_thread(knowledge_index.load_or_build)
+    openai.start_warm_up()
+    await checkpoints.start(resume=workflow.resume_pft_request)
+    if settings.ANSWER_CACHE_PREWARM:
+        medical_chatbot.prewarm_terminology(COMMON_PFT_TERMS)
+
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    """Stop worker-wide background services."""
+    await progress_hub.stop()
+    await loop_monitor.stop()
+    await feedback_aggregator.stop()
+    await answer_cache.stop()
+    await checkpoints.stop()
+    await openai.close()
+    shutdown_executor()
+
+
 @app.websocket("/pft/ws/{request_id}")
 async def websocket_progress(websocket: WebSocket, request_id: str):
     """WebSocket endpoint for real-time PFT processing progress updates."""
     logger.info(f"WebSocket connect: request_id={request_id}")
     await websocket.accept()
-    pubsub = redis_client.pubsub()
-    await pubsub.subscribe(f"pft:progress:{request_id}")
+    subscriber = progress_hub.register()
+    progress_hub.subscribe(subscriber, request_id)
     try:
-        async for message in pubsub.listen():
-                if message.get("type") == "message":
-                    logger.debug(f"WebSocket sending progress: {message.get('data')}")
-                    await websocket.send_text(message.get("data"))
+        while not subscriber.dropped:
+            message = await subscriber.next_message(settings.WS_HEARTBEAT_INTERVAL)
+            if message is not None:
+                logger.debug(f"WebSocket sending progress: {message[1]}")
+                await websocket.send_text(message[1])
+    except WebSocketDisconnect:
+        pass
     finally:
         logger.info(f"WebSocket disconnect: request_id={request_id}")
-        await pubsub.unsubscribe(f"pft:progress:{request_id}")
-        await pubsub.close()
+        progress_hub.unregister(subscriber)
+
+
+@app.websocket("/pft/ws")
+async def websocket_progress_multiplexed(websocket: WebSocket):
+    """
+    Multiplexed WebSocket streaming progress for many request IDs over one connection.
+
+    Client messages: {"action": "subscribe" | "unsubscribe", "request_ids": [...]}
+    Server messages: {"type": "progress" | "subscribed" | "unsubscribed" | "heartbeat" | "error", ...}
+    """
+    await websocket.accept()
+    subscriber = progress_hub.register()
+    logger.info("Multiplexed WebSocket connect")
+
+    async def receive_commands():
+        while True:
+            try:
+                command = json.loads(await websocket.receive_text())
+                action = command.get("action")
+                request_ids = [str(r) for r in command.get("request_ids", [])]
+            except (ValueError, AttributeError, TypeError):
+                await websocket.send_json({"type": "error", "detail": "Invalid message"})
+                continue
+
+            if action == "subscribe":
+                allowed = settings.WS_MAX_SUBSCRIPTIONS - len(subscriber.request_ids)
+                request_ids = [r for r in request_ids if r not in subscriber.request_ids][:max(allowed, 0)]
+                for request_id in request_ids:
+                    progress_hub.subscribe(subscriber, request_id)
+                # Send the current snapshot so late subscribers start from the latest state
+                snapshot = await redis_client.mget(
+                    [f"pft:processing:{r}" for r in request_ids]
+                ) if request_ids else []
+                await websocket.send_json({
+                    "type": "subscribed",
+                    "request_ids": request_ids,
+                    "status": {
+                        r: json.loads(data) for r, data in zip(request_ids, snapshot) if data
+                    }
+                })
+            elif action == "unsubscribe":
+                for request_id in request_ids:
+                    progress_hub.unsubscribe(subscriber, request_id)
+                await websocket.send_json({"type": "unsubscribed", "request_ids": request_ids})
+            else:
+                await websocket.send_json({"type": "error", "detail": f"Unknown action: {action}"})
+
+    async def send_progress():
+        while not subscriber.dropped:
+            message = await subscriber.next_message(settings.WS_HEARTBEAT_INTERVAL)
+            if message is None:
+                await websocket.send_json({"type": "heartbeat", "timestamp": datetime.now().isoformat()})
+                continue
+            request_id, payload = message
+            await websocket.send_text(
+                f'{{"type": "progress", "request_id": {json.dumps(request_id)}, "data": {payload}}}'
+            )
+        # Slow consumer: the hub already dropped this subscriber
+        await websocket.close(code=1013)
+
+    tasks = [asyncio.create_task(receive_commands()), asyncio.create_task(send_progress())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        progress_hub.unregister(subscriber)
+        logger.info("Multiplexed WebSocket disconnect")
+
+
+async def duplicate_upload_response(duplicate: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the upload response for a deduplicated upload."""
+    request_id = duplicate["request_id"]
+    response = {
+        "request_id": request_id,
+        "status": duplicate["status"],
+        "duplicate_of": request_id,
+        "deduplicated": True
+    }
+    if duplicate["state"] == "completed":
+        report = await redis_client.get(f"pft:report:{request_id}")
+        response["message"] = "Identical study already processed; returning the existing report"
+        response["report"] = json.loads(report) if report else None
+    else:
+        response["message"] = "Identical study is already being processed; attached to the existing request"
+    return response
 
 
 @app.post("/pft/upload")
@@ -182,12 +333,16 @@ async def upload_pft_file(
     smoking_status: Optional[str] = None,
     file: UploadFile = File(...),
     priority: TriageLevel = TriageLevel.ROUTINE,
-    requesting_physician: Optional[str] = None
+    requesting_physician: Optional[str] = None,
+    force_reprocess: bool = False
 ):
     """
     Upload a PFT file for processing.
 
     Accepts multipart/form-data with patient demographics and file upload.
+    An upload identical to an earlier one (same bytes and demographics) attaches
+    to the in-flight request or returns the completed report, unless
+    ``force_reprocess`` is set.
     """
     logger.info(f"upload_pft_file called for patient_id={patient_id}, file={file.filename}")
     # Validate file extension
@@ -197,36 +352,49 @@ async def upload_pft_file(
             status_code=400,
             detail=f"Unsupported file type: .{ext}, supported: {settings.SUPPORTED_FILE_TYPES}"
         )
-    # Read file bytes and enforce size limit
-    content_bytes = await file.read()
-    if len(content_bytes) > settings.MAX_FILE_SIZE:
+    # Stream the file into the blob store, rejecting it as soon as it exceeds the size limit
+    try:
+        file_digest, file_path, file_size = await blob_store.put_upload(file, settings.MAX_FILE_SIZE)
+    except UploadTooLargeError:
         raise HTTPException(
             status_code=400,
             detail=f"File size exceeds maximum of {settings.MAX_FILE_SIZE} bytes"
         )
-    # Convert bytes to string for downstream processing
-    file_content = content_bytes.decode('latin-1')
+
+    patient_demographics = {
+        "patient_id": patient_id,
+        "age": age,
+        "gender": gender,
+        "height": height,
+        "weight": weight,
+        "ethnicity": ethnicity,
+        "smoking_status": smoking_status
+    }
 
     # Generate unique request ID
     request_id = str(uuid.uuid4())
+    # Reuse an identical in-flight or completed request instead of re-running the pipeline
+    duplicate = await dedup_index.claim(
+        upload_fingerprint(file_digest, ext, patient_demographics),
+        request_id,
+        force=force_reprocess
+    )
+    if duplicate:
+        logger.info(f"Duplicate upload for patient_id={patient_id}: reusing {duplicate['request_id']}")
+        return await duplicate_upload_response(duplicate)
+
     # Build processing request
     processing_request = PFTProcessingRequest(
         request_id=request_id,
-        patient_demographics={
-            "patient_id": patient_id,
-            "age": age,
-            "gender": gender,
-            "height": height,
-            "weight": weight,
-            "ethnicity": ethnicity,
-            "smoking_status": smoking_status
-        },
-        raw_file_data=file_content,
+        patient_demographics=patient_demographics,
+        file_path=str(file_path),
+        file_digest=file_digest,
+        file_size=file_size,
         file_type=ext,
         priority=priority.value,
         requesting_physician=requesting_physician
     )
-    request_dict = processing_request.dict()
+    request_dict = processing_request.dict(exclude={"raw_file_data"})
     request_dict["priority"] = processing_request.priority.value
     # Store initial request in Redis
     await redis_client.set(
@@ -240,15 +408,16 @@ async def upload_pft_file(
             "estimated_completion": None
         })
     )
-    # Launch orchestrator pipeline in background
+    # Launch orchestrator pipeline in background; the file is read from disk when extraction starts
     background_tasks.add_task(
         workflow.process_pft_request,
         request_id,
-        processing_request.raw_file_data,
+        None,
         processing_request.file_type,
         dict(processing_request.patient_demographics),
         processing_request.historical_data,
-        processing_request.priority.value
+        processing_request.priority.value,
+        file_path=processing_request.file_path
     )
     return {
         "request_id": request_id,
@@ -258,6 +427,246 @@ async def upload_pft_file(
     }
 
 
+async def run_batch_studies(jobs: List[Dict[str, Any]]):
+    """Process the studies of a bulk upload concurrently, bounded by MAX_CONCURRENT_REQUESTS."""
+    semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_REQUESTS)
+
+    async def run_study(job: Dict[str, Any]):
+        async with semaphore:
+            try:
+                await workflow.process_pft_request(
+                    job["request_id"],
+                    None,
+                    job["file_type"],
+                    job["patient_demographics"],
+                    [],
+                    job["priority"],
+                    file_path=job["file_path"]
+                )
+            except Exception as e:
+                logger.error(f"Batch study {job['request_id']} failed: {e}")
+
+    await asyncio.gather(*(run_study(job) for job in jobs))
+
+
+@app.post("/pft/upload/batch")
+async def upload_pft_batch(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    manifest: UploadFile = File(...),
+    priority: TriageLevel = TriageLevel.ROUTINE,
+    requesting_physician: Optional[str] = None,
+    force_reprocess: bool = False
+):
+    """
+    Upload a batch of PFT files (individual files and/or ZIP archives) for processing.
+
+    The demographics manifest (CSV or JSON) has one row per study keyed by
+    ``filename``, with the same fields as /pft/upload. Files are streamed to
+    disk, and one job per study is queued under a shared batch ID. Studies
+    that duplicate an earlier upload reuse its request unless
+    ``force_reprocess`` is set.
+    """
+    logger.info(f"upload_pft_batch called: files={len(files)}, manifest={manifest.filename}")
+    manifest_bytes = await manifest.read(settings.MAX_FILE_SIZE + 1)
+    if len(manifest_bytes) > settings.MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail="Manifest exceeds maximum file size")
+    try:
+        manifest_rows = parse_manifest(manifest_bytes, manifest.filename or "manifest.csv")
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid manifest: {str(e)}")
+
+    batch_id = str(uuid.uuid4())
+    batch_dir = batch_directory(batch_id)
+    study_paths = []
+    seen_names = set()
+    rejected = []
+
+    # Stream every upload to disk; archives are expanded entry by entry
+    for upload in files:
+        name = os.path.basename(upload.filename or "")
+        try:
+            if file_extension(name) == "zip":
+                archive = batch_dir / f".{uuid.uuid4()}.zip"
+                await spool_upload(upload, archive, settings.MAX_BATCH_ARCHIVE_SIZE)
+                try:
+                    extracted, skipped = await asyncio.to_thread(
+                        extract_zip,
+                        archive,
+                        batch_dir,
+                        settings.MAX_FILE_SIZE,
+                        settings.MAX_BATCH_FILES - len(study_paths),
+                        seen_names
+                    )
+                finally:
+                    archive.unlink(missing_ok=True)
+                study_paths.extend(extracted)
+                rejected.extend(skipped)
+            elif name in seen_names:
+                rejected.append({"filename": name, "reason": "Duplicate filename in batch"})
+            elif len(study_paths) >= settings.MAX_BATCH_FILES:
+                rejected.append({"filename": name, "reason": f"Batch exceeds {settings.MAX_BATCH_FILES} files"})
+            else:
+                target = batch_dir / name
+                await spool_upload(upload, target, settings.MAX_FILE_SIZE)
+                study_paths.append(target)
+                seen_names.add(name)
+        except (UploadTooLargeError, zipfile.BadZipFile) as e:
+            rejected.append({"filename": name, "reason": str(e)})
+
+    # Match studies to manifest demographics
+    jobs = []
+    duplicates = {}
+    for path in study_paths:
+        ext = file_extension(path.name)
+        row = manifest_rows.get(path.name)
+        reason = None
+        if ext not in settings.SUPPORTED_FILE_TYPES:
+            reason = f"Unsupported file type: .{ext}"
+        elif row is None:
+            reason = "No manifest entry for file"
+        else:
+            try:
+                demographics = PatientDemographics(
+                    **{k: row[k] for k in DEMOGRAPHIC_FIELDS if row.get(k) is not None}
+                )
+                study_priority = TriageLevel(row["priority"]) if row.get("priority") else priority
+            except ValueError as e:
+                reason = f"Invalid manifest entry: {str(e)}"
+        if reason:
+            rejected.append({"filename": path.name, "reason": reason})
+            path.unlink(missing_ok=True)
+            continue
+        file_digest, file_path, file_size = await asyncio.to_thread(blob_store.ingest_file, path)
+        request_id = str(uuid.uuid4())
+        duplicate = await dedup_index.claim(
+            upload_fingerprint(file_digest, ext, demographics.dict()),
+            request_id,
+            force=force_reprocess
+        )
+        if duplicate:
+            duplicates[path.name] = duplicate["request_id"]
+            continue
+        jobs.append({
+            "request_id": request_id,
+            "filename": path.name,
+            "file_path": str(file_path),
+            "file_digest": file_digest,
+            "file_size": file_size,
+            "file_type": ext,
+            "patient_demographics": demographics.dict(),
+            "priority": study_priority.value,
+            "requesting_physician": row.get("requesting_physician") or requesting_physician
+        })
+
+    # Studies now live in the blob store; only rejected leftovers remain in the spool directory
+    shutil.rmtree(batch_dir, ignore_errors=True)
+
+    if not jobs and not duplicates:
+        raise HTTPException(status_code=400, detail={"message": "No valid studies in batch", "rejected": rejected})
+    studies = {job["filename"]: job["request_id"] for job in jobs}
+    studies.update(duplicates)
+
+    # Register the batch and every queued study in one round-trip
+    created_at = datetime.now().isoformat()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for job in jobs:
+            pipe.set(
+                f"pft:processing:{job['request_id']}",
+                json.dumps({
+                    "request": {
+                        "request_id": job["request_id"],
+                        "batch_id": batch_id,
+                        "filename": job["filename"],
+                        "patient_demographics": job["patient_demographics"],
+                        "file_path": job["file_path"],
+                        "file_digest": job["file_digest"],
+                        "file_size": job["file_size"],
+                        "file_type": job["file_type"],
+                        "priority": job["priority"],
+                        "requesting_physician": job["requesting_physician"]
+                    },
+                    "status": "queued",
+                    "progress": 0,
+                    "current_step": "Queued for processing",
+                    "created_at": created_at,
+                    "estimated_completion": None
+                })
+            )
+        pipe.set(
+            f"pft:batch:{batch_id}",
+            json.dumps({
+                "batch_id": batch_id,
+                "created_at": created_at,
+                "studies": studies,
+                "duplicates": duplicates,
+                "rejected": rejected
+            })
+        )
+        await pipe.execute()
+
+    background_tasks.add_task(run_batch_studies, jobs)
+    return {
+        "batch_id": batch_id,
+        "status": "queued",
+        "queued": len(jobs),
+        "studies": studies,
+        "duplicates": duplicates,
+        "rejected": rejected,
+        "message": f"{len(jobs)} PFT studies queued for processing"
+    }
+
+
+@app.get("/pft/batch/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """Get aggregate processing progress for a bulk upload."""
+    logger.info(f"get_batch_status called for batch_id={batch_id}")
+    data = await redis_client.get(f"pft:batch:{batch_id}")
+    if not data:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    batch = json.loads(data)
+    studies = batch["studies"]
+    statuses = await redis_client.mget([f"pft:processing:{r}" for r in studies.values()])
+
+    counts: Dict[str, int] = {}
+    total_progress = 0
+    study_status = []
+    for (filename, request_id), raw in zip(studies.items(), statuses):
+        status = json.loads(raw) if raw else {}
+        stage = status.get("stage") or status.get("status") or "unknown"
+        counts[stage] = counts.get(stage, 0) + 1
+        total_progress += status.get("progress", 0)
+        study_status.append({
+            "filename": filename,
+            "request_id": request_id,
+            "stage": stage,
+            "progress": status.get("progress", 0),
+            "error_message": status.get("error_message")
+        })
+
+    finished = counts.get("completed", 0) + counts.get("failed", 0)
+    return {
+        "batch_id": batch_id,
+        "created_at": batch["created_at"],
+        "total": len(studies),
+        "completed": counts.get("completed", 0),
+        "failed": counts.get("failed", 0),
+        "in_progress": len(studies) - finished,
+        "progress": round(total_progress / len(studies)) if studies else 100,
+        "stage_counts": counts,
+        "studies": study_status,
+        "duplicates": batch.get("duplicates", {}),
+        "rejected": batch.get("rejected", [])
+    }
+
+
+@app.get("/pft/dedup/stats")
+async def get_dedup_stats():
+    """Upload deduplication hit counts (each hit is an agent pipeline not re-run)."""
+    logger.info("get_dedup_stats called")
+    return await dedup_index.stats()
+
+
 @app.get("/pft/status/{request_id}")
 async def get_processing_status(request_id: str) -> ProcessingStatus:
     """Get processing status for a PFT request."""
@@ -266,11 +675,10 @@ async def get_processing_status(request_id: str) -> ProcessingStatus:
     if not data:
         raise HTTPException(status_code=404, detail="Request not found")
     request_data = json.loads(data)
-    print(request_data)
     
     return ProcessingStatus(
         request_id=request_id,
-        status=request_data.get("status",""),
+        status=request_data.get("status", request_data.get("stage", "")),
         progress=request_data["progress"],
         current_step=request_data["current_step"],
         estimated_completion=request_data.get("estimated_completion"),
@@ -278,6 +686,72 @@ async def get_processing_status(request_id: str) -> ProcessingStatus:
     )
 
 
+@app.get("/pft/events/{request_id}")
+async def stream_processing_events(
+    request: Request,
+    request_id: str,
+    last_event_id: Optional[str] = None
+):
+    """
+    Server-Sent Events stream of processing progress.
+
+    Replays events after the ``Last-Event-ID`` header (or ``last_event_id``
+    query parameter) from the request's Redis Stream, then follows live
+    updates and closes once processing completes or fails.
+    """
+    logger.info(f"stream_processing_events called for request_id={request_id}")
+    stream_key = progress_stream_key(request_id)
+    status_key = f"pft:processing:{request_id}"
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.exists(stream_key)
+        pipe.get(status_key)
+        stream_exists, current = await pipe.execute()
+    if not stream_exists and not current:
+        raise HTTPException(status_code=404, detail="Request not found")
+
+    cursor = request.headers.get("last-event-id") or last_event_id or "0-0"
+
+    async def event_source():
+        # Subscribe before the first read so no update slips between replay and follow
+        subscriber = progress_hub.register()
+        progress_hub.subscribe(subscriber, request_id)
+        last_id = cursor
+        try:
+            if not stream_exists:
+                # Stream expired or predates SSE support; the stored status is all we have
+                yield f"event: progress\ndata: {current}\n\n"
+                if is_terminal(json.loads(current)):
+                    return
+            while True:
+                entries = await redis_client.xread({stream_key: last_id}, count=100)
+                for _, items in entries:
+                    for entry_id, fields in items:
+                        last_id = entry_id
+                        payload = fields.get("data", "{}")
+                        yield f"id: {entry_id}\nevent: progress\ndata: {payload}\n\n"
+                        if is_terminal(json.loads(payload)):
+                            return
+                if await request.is_disconnected():
+                    return
+                # Wait for the hub to signal a new event; read the stream on wake-up
+                message = await subscriber.next_message(settings.SSE_KEEPALIVE_INTERVAL)
+                if message is None:
+                    yield ": keepalive\n\n"
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                if subscriber.dropped:
+                    subscriber = progress_hub.register()
+                    progress_hub.subscribe(subscriber, request_id)
+        finally:
+            progress_hub.unregister(subscriber)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/pft/report/{request_id}")
 async def get_pft_report(request_id: str):
     """Retrieve completed PFT report."""
@@ -297,6 +771,34 @@ async def get_pft_report(request_id: str):
     raise HTTPException(status_code=404, detail="Report not found")
 
 
+@app.post("/pft/retry/{request_id}")
+async def retry_pft_request(request_id: str, background_tasks: BackgroundTasks):
+    """
+    Re-run a failed or interrupted request from its last completed stage.
+
+    Stages checkpointed by the earlier run are restored instead of calling
+    their agents again.
+    """
+    logger.info(f"retry_pft_request called for request_id={request_id}")
+    checkpoint = await checkpoints.load(request_id)
+    if checkpoint is None:
+        if await redis_client.exists(f"pft:report:{request_id}"):
+            raise HTTPException(status_code=409, detail="Report already completed")
+        raise HTTPException(status_code=404, detail="No resumable run for this request")
+    # The lease is held while the request is running (here or on another worker)
+    if not await checkpoints.claim(request_id):
+        raise HTTPException(status_code=409, detail="Request is still being processed")
+    background_tasks.add_task(workflow.resume_pft_request, request_id)
+    completed_stages = list(checkpoint["stages"])
+    return {
+        "request_id": request_id,
+        "status": "queued",
+        "completed_stages": completed_stages,
+        "previous_error": checkpoint["error"],
+        "message": f"Resuming after {len(completed_stages)} completed stage(s)"
+    }
+
+
 @app.post("/pft/interpret")
 async def direct_interpretation(
     raw_data: Dict[str, Any],
@@ -313,7 +815,7 @@ async def direct_interpretation(
     logger.info("direct_interpretation called")
     try:
         # Use interpreter agent directly
-        interpretation = interpreter.interpret_pft_results(
+        interpretation = await interpreter.interpret_pft_results(
             raw_data=raw_data,
             predicted_values=predicted_values or {},
             percent_predicted=percent_predicted or {},
@@ -322,7 +824,7 @@ async def direct_interpretation(
         )
         
         # Get triage assessment
-        triage_assessment = triage_specialist.assess_triage_priority(
+        triage_assessment = await triage_specialist.assess_triage_priority(
             interpretation=interpretation,
             patient_demographics=patient_demographics,
             raw_data=raw_data,
@@ -340,19 +842,110 @@ async def direct_interpretation(
         raise HTTPException(status_code=500, detail=f"Interpretation failed: {str(e)}")
 
 
+@app.post("/pft/interpret/batch")
+async def batch_interpretation(batch: BatchInterpretationRequest):
+    """
+    Interpret many structured studies in one call.
+
+    The rule engine scores the whole batch vectorized up front; with use_llm
+    the agents then run per study, at most MAX_CONCURRENT_REQUESTS at a time.
+    Results stream back as NDJSON, one line per study in completion order,
+    carrying the study's index and study_id.
+    """
+    logger.info(f"batch_interpretation called: studies={len(batch.studies)}, use_llm={batch.use_llm}")
+    if len(batch.studies) > settings.MAX_INTERPRET_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {settings.MAX_INTERPRET_BATCH} studies per batch")
+
+    studies = [study.dict() for study in batch.studies]
+    # Scoring thousands of studies is CPU work; keep it off the event loop
+    rule_interpretations = await offload(interpret_batch, studies)
+    rule_triage = [] if batch.use_llm else await offload(
+        triage_batch, rule_interpretations, [study["percent_predicted"] for study in studies]
+    )
+    semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_REQUESTS)
+
+    async def score(index: int, study: Dict[str, Any], rules: Dict[str, Any]) -> Dict[str, Any]:
+        result = {"index": index, "study_id": study["study_id"]}
+        try:
+            if batch.use_llm:
+                async with semaphore:
+                    interpretation = await interpreter.interpret_pft_results(
+                        raw_data=study["raw_data"],
+                        predicted_values=study["predicted_values"],
+                        percent_predicted=study["percent_predicted"],
+                        patient_demographics=study["patient_demographics"],
+                        historical_data=study["historical_data"]
+                    )
+                    triage_assessment = await triage_specialist.assess_triage_priority(
+                        interpretation=interpretation,
+                        patient_demographics=study["patient_demographics"],
+                        raw_data=study["raw_data"],
+                        percent_predicted=study["percent_predicted"],
+                        historical_data=study["historical_data"]
+                    )
+                result["rules"] = {"pattern": rules["pattern"], "severity": rules["severity"]}
+            else:
+                interpretation = rules
+                triage_assessment = rule_triage[index]
+            result.update({
+                "source": "llm" if batch.use_llm else "rules",
+                "interpretation": interpretation,
+                "triage": triage_assessment,
+                "processed_at": datetime.now().isoformat()
+            })
+        except Exception as e:
+            logger.error(f"Batch interpretation of study {index} failed: {e}")
+            result["error"] = str(e)
+        return result
+
+    async def results():
+        if not batch.use_llm:
+            for index, (study, rules) in enumerate(zip(studies, rule_interpretations)):
+                yield json.dumps(await score(index, study, rules)) + "\n"
+            return
+        tasks = [
+            asyncio.create_task(score(index, study, rules))
+            for index, (study, rules) in enumerate(zip(studies, rule_interpretations))
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result) + "\n"
+        finally:
+            # Client went away: stop the remaining LLM calls
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.get("/pft/worklist/{level}")
+async def get_worklist(level: str, limit: int = 100):
+    """Reports on the critical or urgent worklist, highest urgency first."""
+    if level not in WORKLIST_LEVELS:
+        raise HTTPException(status_code=404, detail=f"Unknown worklist '{level}'")
+    return {"level": level, "reports": await worklist.entries(level, limit)}
+
+
+@app.post("/pft/worklist/rebuild")
+async def rebuild_worklist():
+    """
+    Re-triage every stored report with the rule engine and rebuild the worklists.
+
+    Use after changing triage thresholds; runs without any LLM calls.
+    """
+    logger.info("rebuild_worklist called")
+    result = await worklist.rebuild()
+    logger.info(f"Worklists rebuilt: {result}")
+    return result
+
+
 @app.post("/pft/feedback")
 async def submit_feedback(feedback: DoctorFeedback):
     """Submit doctor feedback for system learning."""
     logger.info(f"submit_feedback called: report_id={feedback.report_id}, physician_id={feedback.physician_id}")
     try:
-        # Store feedback in Redis list
-        await redis_client.rpush("pft:feedback", json.dumps(feedback.dict()))
-        total_fb = await redis_client.llen("pft:feedback")
-        # Trigger learning analysis every 10 entries
-        if total_fb >= 10:
-            batch = await redis_client.lrange("pft:feedback", -10, -1)
-            fb_list = [json.loads(item) for item in batch]
-            learning_assistant.analyze_feedback_batch(fb_list, "recent")
+        # Stored and queued for the background aggregator; analysis never runs on the request path
+        await feedback_aggregator.submit(feedback.json())
         
         return {
             "message": "Feedback submitted successfully",
@@ -364,28 +957,49 @@ async def submit_feedback(feedback: DoctorFeedback):
         raise HTTPException(status_code=500, detail=f"Feedback submission failed: {str(e)}")
 
 
+async def _chat_report_context(message: ChatMessage, session: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Digest of the report a chat message is about (cached in the session), plus
+    detailed sections only when the question needs them."""
+    report_id = message.report_id or session["report_id"]
+    if not report_id:
+        return None
+    sections = sections_for_question(message.message)
+    if report_id == session["report_id"] and session["report_digest"] and not sections:
+        return session["report_digest"]
+    report_context = await report_digests.context(report_id, sections)
+    if report_context and report_id != session["report_id"]:
+        digest = {key: value for key, value in report_context.items() if key != "details"}
+        await chat_sessions.set_report(message.session_id, report_id, digest)
+    return report_context
+
+
 @app.post("/chat")
-async def chat_with_medical_bot(message: ChatMessage) -> ChatResponse:
+async def chat_with_medical_bot(message: ChatMessage, background_tasks: BackgroundTasks) -> ChatResponse:
     """Chat with the medical AI assistant."""
     logger.info(f"chat_with_medical_bot called: message_id={message.message_id}, user_id={message.user_id}")
     try:
-        # Get related report context if report_id provided
-        report_context = None
-        if message.report_id:
-            data = await redis_client.get(f"pft:report:{message.report_id}")
-            if data:
-                report_context = json.loads(data)
+        session = await chat_sessions.load(message.session_id)
+        report_context = await _chat_report_context(message, session)
         
-        # Get response from chatbot
+        # Get response from chatbot, grounded in the top guideline/terminology snippets
         response_data = await medical_chatbot.answer_question(
             question=message.message,
             report_context=report_context,
-            user_context={"user_id": message.user_id}
+            user_context={"user_id": message.user_id},
+            conversation=session,
+            references=knowledge_index.search(message.message)
         )
+        answer = response_data.get("answer", "I'm sorry, I couldn't process your question.")
+        
+        evicted = await chat_sessions.append(message.session_id, message.message, answer)
+        if evicted:
+            background_tasks.add_task(
+                chat_sessions.fold_summary, message.session_id, evicted, medical_chatbot.summarize_conversation
+            )
         
         return ChatResponse(
             message_id=message.message_id,
-            response=response_data.get("answer", "I'm sorry, I couldn't process your question."),
+            response=answer,
             confidence=response_data.get("confidence", 0.5),
             sources=response_data.get("sources", []),
             timestamp=datetime.now()
@@ -395,29 +1009,90 @@ async def chat_with_medical_bot(message: ChatMessage) -> ChatResponse:
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
 
+@app.post("/chat/stream")
+async def stream_chat_with_medical_bot(message: ChatStreamRequest, request: Request):
+    """
+    Chat with the medical AI assistant over Server-Sent Events.
+    
+    The answer is sent as ``token`` events as it is generated, followed by an
+    ``extras`` event with any requested structured fields and a final
+    ``done`` event with the sources.
+    """
+    logger.info(f"stream_chat_with_medical_bot called: message_id={message.message_id}, user_id={message.user_id}")
+    unknown = [name for name in message.extras if name not in CHAT_EXTRA_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown extras: {', '.join(unknown)}")
+    
+    session = await chat_sessions.load(message.session_id)
+    report_context = await _chat_report_context(message, session)
+    references = knowledge_index.search(message.message)
+    # Turns evicted by this exchange, folded into the session summary once the response is sent
+    evicted: List[Dict[str, Any]] = []
+    
+    async def event_source():
+        parts = []
+        try:
+            async for delta in medical_chatbot.stream_answer(
+                question=message.message,
+                report_context=report_context,
+                user_context={"user_id": message.user_id},
+                conversation=session,
+                references=references
+            ):
+                parts.append(delta)
+                yield f"event: token\ndata: {json.dumps({'delta': delta})}\n\n"
+                if await request.is_disconnected():
+                    return
+            answer = "".join(parts)
+            if message.extras:
+                extras = await medical_chatbot.answer_extras(message.message, answer, message.extras, report_context)
+                yield f"event: extras\ndata: {json.dumps(extras, default=str)}\n\n"
+            evicted.extend(await chat_sessions.append(message.session_id, message.message, answer))
+            done = {
+                "message_id": message.message_id,
+                "sources": [source_name(reference) for reference in references],
+                "timestamp": datetime.now().isoformat()
+            }
+            yield f"event: done\ndata: {json.dumps(done)}\n\n"
+        except Exception as e:
+            logger.error(f"Chat stream failed for message {message.message_id}: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': f'Chat failed: {str(e)}'})}\n\n"
+    
+    async def fold_evicted():
+        if evicted:
+            await chat_sessions.fold_summary(message.session_id, evicted, medical_chatbot.summarize_conversation)
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(fold_evicted)
+    )
+
+
 @app.get("/chat/explain/{report_id}")
 async def explain_report_rationale(report_id: str, question: Optional[str] = None):
     """Explain the rationale behind a specific report's interpretation."""
     logger.info(f"explain_report_rationale called: report_id={report_id}, question={question}")
-    data = await redis_client.get(f"pft:report:{report_id}")
-    if not data:
+    sections = sections_for_question(question) if question else ["interpretation"]
+    report_context = await report_digests.context(report_id, sections)
+    if report_context is None:
         raise HTTPException(status_code=404, detail="Report not found")
     
     try:
-        report = json.loads(data)
-        
         if question:
             # Answer specific question about the report
             response_data = await medical_chatbot.answer_question(
                 question=question,
-                report_context=report
+                report_context=report_context,
+                references=knowledge_index.search(question)
             )
             return response_data
         else:
             # Provide general explanation of interpretation rationale
             explanation = await medical_chatbot.explain_interpretation_rationale(
-                interpretation=report.get("interpretation", {}),
-                raw_data=report.get("raw_data", {})
+                interpretation=report_context.get("details", {}).get("interpretation", {}),
+                raw_data=report_context.get("values", {})
             )
             return {"explanation": explanation}
             
@@ -425,6 +1100,36 @@ async def explain_report_rationale(report_id: str, question: Optional[str] = Non
         raise HTTPException(status_code=500, detail=f"Explanation failed: {str(e)}")
 
 
+@app.get("/chat/terminology/{term}")
+async def explain_terminology(term: str):
+    """Explain a PFT term (served from the answer cache when available)."""
+    logger.info(f"explain_terminology called: term={term}")
+    try:
+        return await medical_chatbot.explain_medical_terminology(term)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Terminology explanation failed: {str(e)}")
+
+
+@app.get("/chat/technical")
+async def answer_technical_question(question: str):
+    """Answer a technical question about PFT procedures and quality control."""
+    logger.info(f"answer_technical_question called: question={question}")
+    try:
+        return await medical_chatbot.answer_technical_question(question)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Technical answer failed: {str(e)}")
+
+
+@app.get("/chat/education/{topic}")
+async def educational_content(topic: str):
+    """Educational content about a PFT topic."""
+    logger.info(f"educational_content called: topic={topic}")
+    try:
+        return await medical_chatbot.generate_educational_content(topic, include_provenance=True)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Educational content failed: {str(e)}")
+
+
 @app.get("/analytics/performance")
 async def get_performance_analytics(
     time_period: str = "last_30_days",
@@ -436,6 +1141,7 @@ async def get_performance_analytics(
         # In production, this would query actual performance data
         # Gather performance summary
         reports = await redis_client.keys("pft:report:*")
+        feedback_stats = await feedback_aggregator.stats()
         analytics_data = {
             "time_period": time_period,
             "total_reports_processed": len(reports),
@@ -445,10 +1151,13 @@ async def get_performance_analytics(
                 "triage_accuracy": 89.3,
                 "report_quality_score": 4.2
             },
+            "deduplication": await dedup_index.stats(),
             "user_satisfaction": {
-                "average_rating": 4.1,
+                "average_rating": feedback_stats["overall"]["means"]["report_quality"] or 4.1,
                 "total_feedback_entries": await redis_client.llen("pft:feedback")
             },
+            "feedback": feedback_stats,
+            "model_routes": await model_router.stats(),
             "system_performance": {
                 "uptime": "99.8%",
                 "average_response_time": "1.2 seconds",
@@ -461,11 +1170,27 @@ async def get_performance_analytics(
             raw_fb = await redis_client.lrange("pft:feedback", 0, -1)
             fb_list = [json.loads(item) for item in raw_fb] if raw_fb else []
             if fb_list:
-                trends = learning_assistant.track_performance_metrics(
+                # The AI's original labels come from the reports the feedback refers to
+                report_ids = list({fb.get("report_id") for fb in fb_list if fb.get("report_id")})
+                stored = await redis_client.mget([f"pft:report:{rid}" for rid in report_ids]) if report_ids else []
+                trends = await learning_assistant.track_performance_metrics(
                     metrics_data=fb_list,
-                    time_window=time_period
+                    time_window=time_period,
+                    reports={rid: json.loads(data) for rid, data in zip(report_ids, stored) if data}
                 )
                 analytics_data["trends"] = trends
+                agreement = trends.get("agreement")
+                if agreement:
+                    def accuracy(name):
+                        # None when no feedback refers to a still-stored report
+                        rate = agreement[name]["agreement_rate"]
+                        return None if rate is None else round(rate * 100, 1)
+
+                    analytics_data["accuracy_metrics"] = {
+                        "interpretation_accuracy": accuracy("pattern"),
+                        "triage_accuracy": accuracy("triage"),
+                        "report_quality_score": trends["summary"]["average_report_quality"]
+                    }
         
         return analytics_data
         
@@ -175,7 +175,10 @@ class PFTProcessingRequest(BaseModel):
     """Request for PFT processing."""
     request_id: str = Field(..., description="Unique request identifier")
     patient_demographics: PatientDemographics
-    raw_file_data: str = Field(..., description="Raw PFT file content or data")
+    raw_file_data: Optional[str] = Field(None, description="Raw PFT file content or data (when not stored as a file)")
+    file_path: Optional[str] = Field(None, description="Path of the stored PFT file in the blob store")
+    file_digest: Optional[str] = Field(None, description="SHA-256 digest of the stored PFT file")
+    file_size: Optional[int] = Field(None, description="Size of the stored PFT file in bytes")
     file_type: str = Field(..., description="Type of PFT file (PDF, TXT, XML, etc.)")
     historical_data: List[HistoricalPFTData] = Field(default_factory=list)
     priority: TriageLevel = Field(TriageLevel.ROUTINE, description="Processing priority")
@@ -191,6 +194,22 @@ class PFTProcessingResponse(BaseModel):
     processing_time: float = Field(..., description="Processing time in seconds")
 
 
+class BatchInterpretationStudy(BaseModel):
+    """One structured study in a batch interpretation request."""
+    study_id: Optional[str] = Field(None, description="Caller's identifier, echoed in the result")
+    raw_data: Dict[str, Any] = Field(default_factory=dict)
+    patient_demographics: Dict[str, Any] = Field(default_factory=dict)
+    predicted_values: Dict[str, Any] = Field(default_factory=dict)
+    percent_predicted: Dict[str, Any] = Field(default_factory=dict)
+    historical_data: List[Dict[str, Any]] = Field(default_factory=list)
+
+
+class BatchInterpretationRequest(BaseModel):
+    """Batch of structured studies to interpret."""
+    studies: List[BatchInterpretationStudy]
+    use_llm: bool = Field(True, description="Interpret with the LLM agents; False uses the rule engine only")
+
+
 class DoctorFeedback(BaseModel):
     """Feedback from doctors for system learning."""
     report_id: str = Field(..., description="Report identifier")
@@ -222,6 +241,14 @@ class ChatMessage(BaseModel):
     report_id: Optional[str] = Field(None, description="Related report ID if applicable")
 
 
+class ChatStreamRequest(ChatMessage):
+    """Chat message answered over a token stream."""
+    extras: List[str] = Field(
+        default_factory=list,
+        description="Structured fields to send after the answer (e.g. key_points, follow_up_questions)"
+    )
+
+
 class ChatResponse(BaseModel):
     """Response from medical chatbot."""
     message_id: str = Field(..., description="Original message identifier")
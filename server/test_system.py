@@ -142,6 +142,45 @@ def test_data_specialist():
         return False
 
 
+def test_post_bronchodilator_percent_predicted():
+    """Regression: % predicted in a post-bronchodilator section must not become the pre-BD value."""
+    print("Testing pre/post-bronchodilator percent predicted parsing...")
+    
+    try:
+        from utils.pft_parsing import scan_pft_text
+        
+        result = scan_pft_text(
+            "Pre-bronchodilator\n"
+            "FVC 3.2 L\n"
+            "FEV1 2.1 L\n"
+            "Post-bronchodilator\n"
+            "FVC 3.4 L 85% predicted\n"
+            "FEV1 2.4 L 70% predicted\n"
+        )
+        expected = {"post_bd_fvc_percent": 85.0, "post_bd_fev1_percent": 70.0}
+        if result["percent_predicted"] != expected:
+            print(f"✗ Unexpected percent predicted: {result['percent_predicted']}")
+            return False
+        if result["raw_data"].get("fvc") != 3.2 or result["raw_data"].get("post_bd_fvc") != 3.4:
+            print(f"✗ Unexpected raw data: {result['raw_data']}")
+            return False
+        
+        # Lung volumes and diffusion after a post-BD section keep their own keys
+        sample = scan_pft_text(SAMPLE_FILE_CONTENT)
+        values = {**sample["raw_data"], **sample["percent_predicted"]}
+        missing = [key for key in ("tlc", "rv", "dlco", "dlco_percent") if key not in values]
+        if missing or any(key.startswith(("post_bd_tlc", "post_bd_rv", "post_bd_dlco")) for key in values):
+            print(f"✗ Sample report parsed as {values}")
+            return False
+        
+        print("✓ Post-bronchodilator percent predicted kept separate from pre-BD values")
+        return True
+        
+    except Exception as e:
+        print(f"✗ Post-bronchodilator parsing check failed: {e}")
+        return False
+
+
 def test_interpreter():
     """Test the Interpreter agent."""
     print("Testing Interpreter agent...")
@@ -171,6 +210,142 @@ def test_interpreter():
         return False
 
 
+def test_rule_engine_matches_fallback():
+    """Property check: the vectorized rule engine agrees with the scalar fallback interpretation."""
+    print("Testing vectorized rule engine against the fallback interpretation...")
+    
+    try:
+        import random
+        import pandas as pd
+        from agent.interpreter import InterpreterAgent
+        from utils.pft_rules import interpret_batch, interpret_frame
+        
+        rng = random.Random(20240115)
+        # Thresholds and their neighbours are drawn often; None is a missing value
+        edges = [None, 29.9, 30, 49.9, 50, 69.9, 70, 74.9, 75, 79.9, 80]
+        
+        def value(low, high):
+            return rng.choice(edges) if rng.random() < 0.4 else rng.choice([round(rng.uniform(low, high), 1), rng.randint(low, high)])
+        
+        studies = [
+            {
+                "raw_data": {"fev1_fvc_ratio": value(20, 110)},
+                "percent_predicted": {
+                    "fvc_percent": value(10, 140),
+                    "fev1_percent": value(10, 140),
+                    "dlco_percent": value(10, 140)
+                }
+            }
+            for _ in range(2000)
+        ]
+        
+        vectorized = interpret_batch(studies)
+        frame = interpret_frame(pd.DataFrame([
+            {"fev1_fvc_ratio": s["raw_data"]["fev1_fvc_ratio"], **s["percent_predicted"]} for s in studies
+        ]))
+        for index, study in enumerate(studies):
+            expected = InterpreterAgent._fallback_interpretation(None, study["raw_data"], {}, study["percent_predicted"])
+            row = frame.iloc[index]
+            if vectorized[index] != expected or (row["pattern"], row["severity"]) != (expected["pattern"], expected["severity"]):
+                print(f"✗ Mismatch for {study}: {vectorized[index]} != {expected}")
+                return False
+        
+        print(f"✓ Vectorized rule engine matches fallback on {len(studies)} random studies")
+        return True
+        
+    except Exception as e:
+        print(f"✗ Rule engine property check failed: {e}")
+        return False
+
+
+def test_triage_engine_matches_fallback():
+    """Property check: vectorized triage agrees with the scalar fallback triage assessment."""
+    print("Testing vectorized triage against the fallback triage assessment...")
+    
+    try:
+        import random
+        from agent.triage_specialist import TriageSpecialistAgent
+        from utils.pft_rules import triage_batch
+        
+        rng = random.Random(20240116)
+        edges = [None, 29.9, 30, 39.9, 40, 49.9, 50, 69.9, 70]
+        
+        def value():
+            return rng.choice(edges) if rng.random() < 0.4 else round(rng.uniform(10, 130), 1)
+        
+        interpretations, percent_predicted = [], []
+        for _ in range(2000):
+            interpretations.append({
+                "pattern": rng.choice(["normal", "obstructive", "restrictive", "mixed"]),
+                "severity": rng.choice(["normal", "mild", "moderate", "severe", "very_severe"]),
+                "reversibility": rng.choice([None, True, False]),
+                "airway_obstruction": rng.random() < 0.5,
+                "diffusion_impairment": rng.random() < 0.3
+            })
+            percent_predicted.append({"fev1_percent": value(), "dlco_percent": value()})
+        
+        agent = TriageSpecialistAgent()
+        vectorized = triage_batch(interpretations, percent_predicted)
+        for index, (interpretation, percent) in enumerate(zip(interpretations, percent_predicted)):
+            expected = agent._fallback_triage_assessment(interpretation, percent)
+            if vectorized[index] != expected:
+                print(f"✗ Mismatch for {interpretation}, {percent}: {vectorized[index]} != {expected}")
+                return False
+        
+        print(f"✓ Vectorized triage matches fallback on {len(interpretations)} random cases")
+        return True
+        
+    except Exception as e:
+        print(f"✗ Triage engine property check failed: {e}")
+        return False
+
+
+def test_feedback_metrics():
+    """Property check: locally computed agreement and kappa match a direct count."""
+    print("Testing feedback agreement metrics...")
+    
+    try:
+        import random
+        from utils.feedback_metrics import compute_feedback_metrics
+        
+        rng = random.Random(20240117)
+        patterns = ["normal", "obstructive", "restrictive", "mixed"]
+        feedback, reports, pairs = [], {}, []
+        for index in range(500):
+            original = rng.choice(patterns)
+            corrected = rng.choice(patterns) if rng.random() < 0.3 else None
+            reports[f"r{index}"] = {"interpretation": {"pattern": original}, "triage": {"level": "routine"}}
+            feedback.append({
+                "report_id": f"r{index}",
+                "physician_id": f"p{index % 7}",
+                "interpretation_accuracy": rng.randint(1, 5),
+                "report_quality": rng.randint(1, 5),
+                "triage_appropriateness": rng.randint(1, 5),
+                "corrected_pattern": corrected
+            })
+            pairs.append((original, corrected or original))
+        
+        metrics = compute_feedback_metrics(feedback, reports, time_window="all")
+        n = len(pairs)
+        observed = sum(1 for a, b in pairs if a == b) / n
+        expected = sum(
+            sum(1 for a, _ in pairs if a == label) * sum(1 for _, b in pairs if b == label)
+            for label in patterns
+        ) / (n * n)
+        kappa = round((observed - expected) / (1 - expected), 3)
+        result = metrics["agreement"]["pattern"]
+        if result["agreement_rate"] != round(observed, 3) or result["cohens_kappa"] != kappa:
+            print(f"✗ Pattern agreement {result} != rate {observed:.3f}, kappa {kappa}")
+            return False
+        
+        print(f"✓ Agreement {result['agreement_rate']} and kappa {result['cohens_kappa']} match direct count")
+        return True
+        
+    except Exception as e:
+        print(f"✗ Feedback metrics check failed: {e}")
+        return False
+
+
 def test_api_endpoints():
     """Test API endpoints."""
     print("Testing API endpoints...")
@@ -239,7 +414,11 @@ def run_all_tests():
         ("Agent Imports", test_agent_imports),
         ("Agent Initialization", test_agent_initialization),
         ("Data Specialist", test_data_specialist),
+        ("Post-BD Parsing", test_post_bronchodilator_percent_predicted),
         ("Interpreter", test_interpreter),
+        ("Rule Engine", test_rule_engine_matches_fallback),
+        ("Triage Engine", test_triage_engine_matches_fallback),
+        ("Feedback Metrics", test_feedback_metrics),
         ("API Endpoints", test_api_endpoints)
     ]
     
@@ -0,0 +1,207 @@
+"""
+Answer cache for AutoPFTReport System.
+
+Terminology explanations, technical answers and educational content are
+essentially static for a small vocabulary, so they are generated once and
+served from cache afterwards:
+
+- keys are normalised ("FEV1?", " fev1 " and "FEV1" share an entry)
+- keys include a version derived from the agent instructions, model and
+  prompt templates; changing any of them starts a fresh cache
+- entries live in Redis (shared by all workers) with an in-process LRU in
+  front, so repeat questions are answered without a network round-trip
+- stale entries are served immediately and refreshed in the background
+- a term list can be pre-warmed at startup
+
+Every answer carries provenance describing where it came from.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from config import settings
+from utils.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_PREFIX = "pft:answers:"
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9/%]+")
+
+
+def normalize_key(text: str) -> str:
+    """Lowercase, collapse punctuation and whitespace."""
+    return _NON_WORD_RE.sub(" ", (text or "").lower()).strip()
+
+
+def instructions_version(*parts: str) -> str:
+    """Short hash of everything that shapes an answer (instructions, model, prompt version)."""
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:12]
+
+
+def _cacheable(value: Any) -> bool:
+    if isinstance(value, dict):
+        return bool(value) and "error" not in value
+    return bool(value)
+
+
+class AnswerCache:
+    """Versioned, normalised answer cache in Redis with an in-process LRU."""
+
+    def __init__(self):
+        self.redis_client = get_redis()
+        self._local: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._refreshing: set = set()
+        self._tasks: set = set()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, kind: str, version: str, text: str) -> str:
+        return f"{ANSWER_CACHE_PREFIX}{kind}:{version}:{normalize_key(text)}"
+
+    def _local_get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self._local.get(key)
+        if item is None:
+            return None
+        loaded_at, entry = item
+        # Re-read from Redis periodically so refreshes made by other workers are picked up
+        if time.monotonic() - loaded_at > settings.ANSWER_CACHE_LOCAL_TTL:
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return entry
+
+    def _local_put(self, key: str, entry: Dict[str, Any]):
+        self._local[key] = (time.monotonic(), entry)
+        self._local.move_to_end(key)
+        while len(self._local) > settings.ANSWER_CACHE_LOCAL_SIZE:
+            self._local.popitem(last=False)
+
+    async def _store(self, key: str, value: Any):
+        entry = {"value": value, "cached_at": time.time()}
+        await self.redis_client.set(key, json.dumps(entry, default=str), ex=settings.ANSWER_CACHE_TTL)
+        self._local_put(key, entry)
+
+    async def get_or_compute(
+        self,
+        kind: str,
+        text: str,
+        version: str,
+        producer: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Cached answer for ``text``, generating (and caching) it with ``producer`` on a miss.
+
+        Returns:
+            (answer, provenance) where provenance reports whether the answer
+            was cached, where it was served from and how old it is
+        """
+        key = self.key(kind, version, text)
+        source = "memory"
+        entry = self._local_get(key)
+        if entry is None:
+            source = "redis"
+            data = await self.redis_client.get(key)
+            if data:
+                entry = json.loads(data)
+                self._local_put(key, entry)
+
+        if entry is not None:
+            self.hits += 1
+            age = time.time() - entry["cached_at"]
+            refreshing = age > settings.ANSWER_CACHE_REFRESH_AFTER
+            if refreshing:
+                self._schedule_refresh(key, producer)
+            return entry["value"], {
+                "cached": True,
+                "source": source,
+                "version": version,
+                "cached_at": datetime.fromtimestamp(entry["cached_at"]).isoformat(),
+                "age_seconds": int(age),
+                "refreshing": refreshing
+            }
+
+        self.misses += 1
+        value = await producer()
+        if _cacheable(value):
+            await self._store(key, value)
+        return value, {"cached": False, "source": "generated", "version": version}
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _schedule_refresh(self, key: str, producer: Callable[[], Awaitable[Any]]):
+        if key not in self._refreshing:
+            self._refreshing.add(key)
+            self._spawn(self._refresh(key, producer))
+
+    async def _refresh(self, key: str, producer: Callable[[], Awaitable[Any]]):
+        try:
+            # One worker refreshes a given entry at a time
+            if await self.redis_client.set(f"{key}:refresh", "1", nx=True, ex=settings.AGENT_TIMEOUT):
+                value = await producer()
+                if _cacheable(value):
+                    await self._store(key, value)
+        except Exception as e:
+            logger.warning(f"Answer cache refresh failed for {key}: {e}")
+        finally:
+            self._refreshing.discard(key)
+
+    def start_warm(
+        self,
+        kind: str,
+        texts: Iterable[str],
+        version: str,
+        producer_for: Callable[[str], Awaitable[Any]]
+    ):
+        """Generate missing answers for ``texts`` in the background."""
+        self._spawn(self._warm(kind, list(texts), version, producer_for))
+
+    async def _warm(self, kind: str, texts, version: str, producer_for: Callable[[str], Awaitable[Any]]):
+        warmed = 0
+        for text in texts:
+            key = self.key(kind, version, text)
+            try:
+                if await self.redis_client.exists(key):
+                    continue
+                # Workers starting together split the list instead of generating twice
+                if not await self.redis_client.set(f"{key}:refresh", "1", nx=True, ex=settings.AGENT_TIMEOUT):
+                    continue
+                value = await producer_for(text)
+                if _cacheable(value):
+                    await self._store(key, value)
+                    warmed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Answer cache warm-up failed for {kind} '{text}': {e}")
+        if warmed:
+            logger.info(f"Answer cache warmed {warmed} {kind} entries")
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+            "local_entries": len(self._local)
+        }
+
+
+answer_cache = AnswerCache()
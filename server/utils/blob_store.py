@@ -0,0 +1,100 @@
+"""
+Content-addressed local blob store for AutoPFTReport System.
+
+Uploaded PFT files are written once under their SHA-256 digest and passed
+through the pipeline by path, so request memory stays constant regardless of
+file size and identical uploads share one copy on disk.
+"""
+
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Tuple
+
+import aiofiles
+from fastapi import UploadFile
+
+from config import settings
+from utils.uploads import UploadTooLargeError
+
+
+class BlobStore:
+    """Stores files under ``<root>/<aa>/<bb>/<sha256>``."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.tmp_dir = self.root / "tmp"
+
+    def path_for(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def _commit(self, tmp_path: Path, digest: str) -> Path:
+        target = self.path_for(digest)
+        if target.exists():
+            tmp_path.unlink(missing_ok=True)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, target)
+        return target
+
+    async def put_upload(self, upload: UploadFile, max_bytes: int) -> Tuple[str, Path, int]:
+        """
+        Stream an upload into the store, hashing as it goes and rejecting it early once
+        it exceeds ``max_bytes``.
+
+        Returns:
+            Tuple of (sha256 digest, blob path, size in bytes)
+        """
+        if upload.size is not None and upload.size > max_bytes:
+            raise UploadTooLargeError(f"File size exceeds maximum of {max_bytes} bytes")
+
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.tmp_dir / str(uuid.uuid4())
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp_path, "wb") as out:
+                while True:
+                    chunk = await upload.read(settings.UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise UploadTooLargeError(f"File size exceeds maximum of {max_bytes} bytes")
+                    sha.update(chunk)
+                    await out.write(chunk)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        digest = sha.hexdigest()
+        return digest, self._commit(tmp_path, digest), size
+
+    def ingest_file(self, path: Path) -> Tuple[str, Path, int]:
+        """Move an already spooled file into the store (blocking; run off the event loop)."""
+        sha = hashlib.sha256()
+        size = 0
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(settings.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        return digest, self._commit(path, digest), size
+
+
+def read_blob_text(path: str) -> str:
+    """Read a stored file for text-based extraction (blocking; run off the event loop)."""
+    with open(path, "rb") as f:
+        return f.read().decode("latin-1")
+
+
+async def load_blob_text(path: str) -> str:
+    return await asyncio.to_thread(read_blob_text, path)
+
+
+blob_store = BlobStore(settings.BLOB_DIR)
@@ -0,0 +1,103 @@
+"""
+Chat session memory for AutoPFTReport System.
+
+Each chat session keeps its most recent turns, a rolling summary of older
+turns and the digest of the report it is discussing, all in Redis with a
+sliding TTL. Turns that fall out of the recent window are folded into the
+summary in the background, so the prompt for each turn stays roughly the
+same size however long the conversation runs.
+"""
+
+import json
+import time
+from typing import Dict, Any, List, Optional
+
+from config import settings
+from utils.redis import get_redis
+
+CHAT_SESSION_PREFIX = "pft:chat:session:"
+
+
+def session_key(session_id: str) -> str:
+    return f"{CHAT_SESSION_PREFIX}{session_id}"
+
+
+def turns_key(session_id: str) -> str:
+    return f"{CHAT_SESSION_PREFIX}{session_id}:turns"
+
+
+def _clip(text: str, limit: int) -> str:
+    text = text or ""
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+class ChatSessionStore:
+    """Recent turns, rolling summary and report digest per chat session."""
+
+    def __init__(self):
+        self.redis_client = get_redis()
+
+    async def load(self, session_id: str) -> Dict[str, Any]:
+        """Summary, recent turns and cached report digest of a session."""
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(session_key(session_id))
+            pipe.lrange(turns_key(session_id), 0, -1)
+            meta, turns = await pipe.execute()
+        digest = meta.get("report_digest")
+        return {
+            "summary": meta.get("summary", ""),
+            "turns": [json.loads(turn) for turn in turns],
+            "report_id": meta.get("report_id"),
+            "report_digest": json.loads(digest) if digest else None
+        }
+
+    async def set_report(self, session_id: str, report_id: str, digest: Dict[str, Any]):
+        """Cache the digest of the report this session is discussing."""
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(session_key(session_id), mapping={
+                "report_id": report_id,
+                "report_digest": json.dumps(digest, separators=(",", ":"), default=str)
+            })
+            pipe.expire(session_key(session_id), settings.CHAT_SESSION_TTL)
+            await pipe.execute()
+
+    async def append(self, session_id: str, question: str, answer: str) -> List[Dict[str, Any]]:
+        """
+        Record a question/answer pair.
+
+        Returns:
+            Turns evicted from the recent window, to be folded into the summary
+        """
+        now = time.time()
+        key = turns_key(session_id)
+        turns = [
+            json.dumps({"role": "user", "content": _clip(question, settings.CHAT_TURN_MAX_CHARS), "at": now}),
+            json.dumps({"role": "assistant", "content": _clip(answer, settings.CHAT_TURN_MAX_CHARS), "at": now})
+        ]
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.rpush(key, *turns)
+            pipe.expire(key, settings.CHAT_SESSION_TTL)
+            pipe.expire(session_key(session_id), settings.CHAT_SESSION_TTL)
+            length, *_ = await pipe.execute()
+
+        overflow = length - settings.CHAT_HISTORY_TURNS * 2
+        if overflow <= 0:
+            return []
+        # LPOP with a count is atomic, so concurrent turns never evict the same entries
+        evicted = await self.redis_client.lpop(key, overflow) or []
+        return [json.loads(turn) for turn in evicted]
+
+    async def fold_summary(self, session_id: str, evicted: List[Dict[str, Any]], summarize) -> Optional[str]:
+        """Fold evicted turns into the rolling summary with ``summarize(previous, turns)``."""
+        if not evicted:
+            return None
+        previous = await self.redis_client.hget(session_key(session_id), "summary") or ""
+        summary = _clip(await summarize(previous, evicted), settings.CHAT_SUMMARY_MAX_CHARS)
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(session_key(session_id), "summary", summary)
+            pipe.expire(session_key(session_id), settings.CHAT_SESSION_TTL)
+            await pipe.execute()
+        return summary
+
+
+chat_sessions = ChatSessionStore()
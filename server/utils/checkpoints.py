@@ -0,0 +1,195 @@
+"""
+Stage checkpoints for AutoPFTReport System.
+
+Each stage result of a workflow run is saved as it completes, in the
+``pft:checkpoint:{request_id}`` hash (one ``stage:{stage}`` field per
+stage, plus the job arguments needed to run the request again). A run
+that fails or is interrupted can therefore be resumed from the last
+completed stage, skipping the agent calls that already succeeded:
+
+- failed runs are resumed on demand with ``POST /pft/retry/{request_id}``
+- runs interrupted by a worker dying are resumed automatically. A running
+  request holds a lease renewed after every stage; when the lease lapses,
+  the next worker to scan the pending set picks the request up. A request
+  is resumed this way at most CHECKPOINT_MAX_ATTEMPTS times, after which
+  it is marked failed and left for /pft/retry.
+
+Checkpoints are deleted once the report is stored and otherwise expire
+after CHECKPOINT_TTL.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from config import settings
+from utils.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PREFIX = "pft:checkpoint:"
+PENDING_KEY = "pft:checkpoints:pending"  # requests with a run that has not completed or failed
+STAGE_FIELD_PREFIX = "stage:"
+
+
+class StageCheckpoints:
+    """Per-stage results of workflow runs, and resumption of interrupted runs."""
+
+    def __init__(self):
+        self.redis_client = get_redis()
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._resume: Optional[Callable[..., Awaitable[Any]]] = None
+        self._scan_task: Optional[asyncio.Task] = None
+        self._resuming: set = set()
+        self._tasks: set = set()
+        self._semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_REQUESTS)
+
+    @staticmethod
+    def _key(request_id: str) -> str:
+        return f"{CHECKPOINT_PREFIX}{request_id}"
+
+    @staticmethod
+    def _lease_key(request_id: str) -> str:
+        return f"{CHECKPOINT_PREFIX}{request_id}:lease"
+
+    async def begin(self, request_id: str, job: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Register a run of ``request_id`` and take its lease.
+
+        Args:
+            job: Arguments needed to run the request again (file, demographics, ...)
+
+        Returns:
+            Stage results checkpointed by earlier runs, keyed by stage value
+        """
+        key = self._key(request_id)
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, "job", json.dumps(job, default=str))
+            pipe.hincrby(key, "attempts", 1)
+            pipe.hdel(key, "error")
+            pipe.expire(key, settings.CHECKPOINT_TTL)
+            pipe.sadd(PENDING_KEY, request_id)
+            pipe.set(self._lease_key(request_id), self.worker_id, ex=settings.CHECKPOINT_LEASE)
+            pipe.hgetall(key)
+            *_, fields = await pipe.execute()
+        return {
+            field[len(STAGE_FIELD_PREFIX):]: json.loads(value)
+            for field, value in fields.items()
+            if field.startswith(STAGE_FIELD_PREFIX)
+        }
+
+    async def save(self, request_id: str, stage: str, result: Dict[str, Any]):
+        """Checkpoint one stage result and renew the run's lease."""
+        key = self._key(request_id)
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(key, f"{STAGE_FIELD_PREFIX}{stage}", json.dumps(result, default=str))
+                pipe.expire(key, settings.CHECKPOINT_TTL)
+                pipe.expire(self._lease_key(request_id), settings.CHECKPOINT_LEASE)
+                await pipe.execute()
+        except Exception as e:
+            # A missing checkpoint only costs the stage being run again on retry
+            logger.warning(f"Could not checkpoint {stage} for request {request_id}: {e}")
+
+    async def complete(self, request_id: str):
+        """Drop the checkpoints of a request whose report has been stored."""
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.delete(self._key(request_id), self._lease_key(request_id))
+                pipe.srem(PENDING_KEY, request_id)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not clear checkpoints for request {request_id}: {e}")
+
+    async def fail(self, request_id: str, error_message: str):
+        """Keep a failed run's checkpoints for /pft/retry, without resuming it automatically."""
+        key = self._key(request_id)
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(key, "error", error_message)
+                pipe.expire(key, settings.CHECKPOINT_TTL)
+                pipe.delete(self._lease_key(request_id))
+                pipe.srem(PENDING_KEY, request_id)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not record failure for request {request_id}: {e}")
+
+    async def load(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """The job, attempt count, last error and stage results of a request; None if it has none."""
+        fields = await self.redis_client.hgetall(self._key(request_id))
+        if "job" not in fields:
+            return None
+        return {
+            "job": json.loads(fields["job"]),
+            "attempts": int(fields.get("attempts", 0)),
+            "error": fields.get("error"),
+            "stages": {
+                field[len(STAGE_FIELD_PREFIX):]: json.loads(value)
+                for field, value in fields.items()
+                if field.startswith(STAGE_FIELD_PREFIX)
+            }
+        }
+
+    async def claim(self, request_id: str) -> bool:
+        """Take the lease of a request that no worker is running; False if one is."""
+        return bool(await self.redis_client.set(
+            self._lease_key(request_id), self.worker_id, nx=True, ex=settings.CHECKPOINT_LEASE
+        ))
+
+    async def start(self, resume: Callable[..., Awaitable[Any]]):
+        """
+        Start scanning for interrupted runs (idempotent).
+
+        ``resume(request_id, automatic=True)`` runs a claimed request from its
+        checkpoints, giving up once it has been attempted CHECKPOINT_MAX_ATTEMPTS times.
+        """
+        self._resume = resume
+        if self._scan_task is None or self._scan_task.done():
+            self._scan_task = asyncio.create_task(self._scan())
+
+    async def stop(self):
+        # Cancelled runs keep their lease until it lapses, then another worker resumes them
+        tasks = [task for task in (self._scan_task, *self._tasks) if task is not None and not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._scan_task = None
+
+    async def _scan(self):
+        while True:
+            try:
+                await self.resume_interrupted()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Checkpoint scan failed: {e}")
+            await asyncio.sleep(settings.CHECKPOINT_SCAN_INTERVAL)
+
+    async def resume_interrupted(self):
+        """Resume pending requests whose lease has lapsed (running requests fail to be claimed)."""
+        for request_id in await self.redis_client.smembers(PENDING_KEY):
+            if request_id in self._resuming:
+                continue
+            self._resuming.add(request_id)
+            task = asyncio.create_task(self._resume_one(request_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _resume_one(self, request_id: str):
+        try:
+            # Claim only when a slot is free, so a queued resume never sits on a lease
+            async with self._semaphore:
+                if await self.claim(request_id):
+                    await self._resume(request_id, automatic=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Could not resume request {request_id}: {e}")
+        finally:
+            self._resuming.discard(request_id)
+
+
+checkpoints = StageCheckpoints()
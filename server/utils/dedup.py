@@ -0,0 +1,177 @@
+"""
+Upload deduplication for AutoPFTReport System.
+
+Technicians often re-upload the same export after a browser timeout. Each
+upload is fingerprinted from the stored file digest plus normalised patient
+demographics, and the fingerprint index maps to the request that first
+processed it, so a duplicate can attach to the in-flight job or reuse the
+completed report instead of running the agent pipeline again.
+"""
+
+import hashlib
+import json
+from typing import Dict, Any, Optional
+
+from config import settings
+from utils.redis import get_redis
+
+DEDUP_STATS_KEY = "pft:dedup:stats"
+
+# Claim the fingerprint and mark the new request queued in one step, so a concurrent
+# identical upload never sees the owner without a status (which would read as failed)
+CLAIM_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    redis.call('SET', KEYS[2], ARGV[3], 'EX', ARGV[4])
+    return 1
+end
+return 0
+"""
+
+# Drop the index entry only if it still points at the failed request that was inspected
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def normalize_demographics(patient_demographics: Dict[str, Any]) -> Dict[str, Any]:
+    """Canonical form of demographics so formatting differences don't defeat deduplication."""
+
+    def text(value):
+        return " ".join(str(value).split()).lower() if value not in (None, "") else None
+
+    def number(value, digits):
+        try:
+            return round(float(value), digits)
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        "patient_id": text(patient_demographics.get("patient_id")),
+        "age": number(patient_demographics.get("age"), 0),
+        "gender": text(patient_demographics.get("gender")),
+        "height": number(patient_demographics.get("height"), 1),
+        "weight": number(patient_demographics.get("weight"), 1),
+        "ethnicity": text(patient_demographics.get("ethnicity")),
+        "smoking_status": text(patient_demographics.get("smoking_status"))
+    }
+
+
+def upload_fingerprint(file_digest: str, file_type: str, patient_demographics: Dict[str, Any]) -> str:
+    """Fingerprint of an upload: file bytes (via their digest) plus normalised demographics."""
+    canonical = json.dumps(
+        {
+            "file": file_digest,
+            "type": file_type.lower(),
+            "demographics": normalize_demographics(patient_demographics)
+        },
+        sort_keys=True
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class DedupIndex:
+    """Redis index from upload fingerprint to the request that processed it."""
+
+    def __init__(self):
+        self.redis_client = get_redis()
+        self._claim_script = self.redis_client.register_script(CLAIM_SCRIPT)
+        self._release_script = self.redis_client.register_script(RELEASE_SCRIPT)
+
+    @staticmethod
+    def _key(fingerprint: str) -> str:
+        return f"pft:dedup:{fingerprint}"
+
+    @staticmethod
+    def _queued_status() -> str:
+        # Placeholder until the caller stores the full request; expires if it never does
+        return json.dumps({"status": "queued", "progress": 0, "current_step": "Queued for processing"})
+
+    async def lookup(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Find a live request for this fingerprint.
+
+        Returns:
+            {"request_id", "state": "completed" | "in_flight", "status"} or None when
+            there is no match or the matching request failed / expired
+        """
+        request_id = await self.redis_client.get(self._key(fingerprint))
+        if not request_id:
+            return None
+        return await self._inspect(request_id)
+
+    async def _inspect(self, request_id: str) -> Optional[Dict[str, Any]]:
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.exists(f"pft:report:{request_id}")
+            pipe.get(f"pft:processing:{request_id}")
+            has_report, status = await pipe.execute()
+
+        if has_report:
+            return {"request_id": request_id, "state": "completed", "status": "completed"}
+        if status:
+            status = json.loads(status)
+            stage = status.get("stage") or status.get("status")
+            if stage != "failed":
+                return {"request_id": request_id, "state": "in_flight", "status": stage}
+        return None
+
+    async def claim(self, fingerprint: str, request_id: str, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Register ``request_id`` as the owner of ``fingerprint``.
+
+        Returns:
+            None if the claim succeeded (the caller should process the upload), otherwise
+            the existing duplicate as returned by ``lookup``
+        """
+        key = self._key(fingerprint)
+        status_key = f"pft:processing:{request_id}"
+        if force:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.set(key, request_id, ex=settings.DEDUP_TTL)
+                pipe.set(status_key, self._queued_status(), ex=settings.DEDUP_CLAIM_TTL)
+                pipe.hincrby(DEDUP_STATS_KEY, "forced_reprocess", 1)
+                await pipe.execute()
+            return None
+
+        # SET NX so two concurrent identical uploads can't both start the pipeline
+        for _ in range(3):
+            claimed = await self._claim_script(
+                keys=[key, status_key],
+                args=[request_id, settings.DEDUP_TTL, self._queued_status(), settings.DEDUP_CLAIM_TTL]
+            )
+            if claimed:
+                await self.redis_client.hincrby(DEDUP_STATS_KEY, "misses", 1)
+                return None
+            existing_id = await self.redis_client.get(key)
+            if not existing_id:
+                continue
+            existing = await self._inspect(existing_id)
+            if existing:
+                await self.redis_client.hincrby(DEDUP_STATS_KEY, f"{existing['state']}_hits", 1)
+                return existing
+            # The indexed request failed or expired; replace it unless another upload already has
+            await self._release_script(keys=[key], args=[existing_id])
+
+        # Still contended after retries: process without owning the fingerprint
+        await self.redis_client.hincrby(DEDUP_STATS_KEY, "misses", 1)
+        return None
+
+    async def stats(self) -> Dict[str, Any]:
+        raw = await self.redis_client.hgetall(DEDUP_STATS_KEY)
+        counts = {k: int(v) for k, v in raw.items()}
+        hits = counts.get("completed_hits", 0) + counts.get("in_flight_hits", 0)
+        total = hits + counts.get("misses", 0) + counts.get("forced_reprocess", 0)
+        return {
+            "completed_hits": counts.get("completed_hits", 0),
+            "in_flight_hits": counts.get("in_flight_hits", 0),
+            "misses": counts.get("misses", 0),
+            "forced_reprocess": counts.get("forced_reprocess", 0),
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            # Every hit skips a full five-stage agent pipeline
+            "pipelines_saved": hits
+        }
+
+
+dedup_index = DedupIndex()
@@ -0,0 +1,316 @@
+"""
+Binary document extraction for AutoPFTReport System.
+
+PDF and XLSX exports can't be sent to the LLM as decoded bytes. They are
+parsed in a process pool, so the CPU-bound work never blocks the event loop:
+PDFs become compact text (text plus result tables) for the parser or LLM,
+and workbooks are streamed row by row into the standard extraction result.
+
+EXTRACTION_TIMEOUT is enforced inside the pool worker (a SIGALRM timer), so
+a pathological file frees its worker instead of occupying it after the
+caller has given up. A worker stuck where the signal can't interrupt it is
+killed by recycling the pool.
+"""
+
+import asyncio
+import logging
+import re
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import settings
+from utils.pft_parsing import (
+    PARAMETERS, PREDICTED_PARAMETERS, classify_column, match_parameter, to_float,
+    normalize_ratio, combine_trials, build_extraction_result
+)
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_KILL_GRACE = 5.0  # seconds past EXTRACTION_TIMEOUT before a worker that ignored its timer is killed
+
+
+class ExtractionTimeout(Exception):
+    """Raised in a pool worker when an extraction runs past EXTRACTION_TIMEOUT."""
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Lazily create the worker-wide extraction process pool."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.EXTRACTION_WORKERS)
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _recycle_executor(executor: ProcessPoolExecutor):
+    """Kill a pool's workers and let the next extraction start a fresh pool."""
+    global _executor
+    if _executor is executor:
+        _executor = None
+    for process in list((executor._processes or {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _on_alarm(signum, frame):
+    raise ExtractionTimeout(f"Extraction exceeded {settings.EXTRACTION_TIMEOUT}s")
+
+
+def _run_limited(extractor, path: str, limit: int, timeout: float) -> Dict[str, Any]:
+    """Run ``extractor`` in a pool worker, interrupted after ``timeout`` seconds."""
+    if not hasattr(signal, "setitimer"):
+        return extractor(path, limit)
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return extractor(path, limit)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _clean_rows(table: List[List[Any]]) -> List[List[str]]:
+    rows = []
+    for row in table or []:
+        cells = [" ".join(str(cell).split()) if cell is not None else "" for cell in row]
+        if any(cells):
+            rows.append(cells)
+    return rows
+
+
+def extract_pdf(path: str, max_pages: int) -> Dict[str, Any]:
+    """
+    Extract text and tables from the first ``max_pages`` pages of a PDF.
+
+    Runs inside the process pool. Falls back to PyPDF2 text extraction when
+    pdfplumber cannot parse the document.
+    """
+    try:
+        import pdfplumber
+
+        text_parts, tables = [], []
+        with pdfplumber.open(path) as pdf:
+            total_pages = len(pdf.pages)
+            for page in pdf.pages[:max_pages]:
+                text_parts.append(page.extract_text() or "")
+                for table in page.extract_tables():
+                    rows = _clean_rows(table)
+                    if rows:
+                        tables.append(rows)
+        return {
+            "text": "\n".join(text_parts),
+            "tables": tables,
+            "pages": total_pages,
+            "pages_read": min(total_pages, max_pages),
+            "extractor": "pdfplumber"
+        }
+    except Exception:
+        from PyPDF2 import PdfReader
+
+        reader = PdfReader(path)
+        pages = reader.pages[:max_pages]
+        return {
+            "text": "\n".join(page.extract_text() or "" for page in pages),
+            "tables": [],
+            "pages": len(reader.pages),
+            "pages_read": len(pages),
+            "extractor": "pypdf2"
+        }
+
+
+def format_extracted_document(document: Dict[str, Any], max_chars: int) -> str:
+    """Render extracted text and tables as compact text for the parser or LLM."""
+    lines = [" ".join(line.split()) for line in document.get("text", "").splitlines()]
+    parts = ["\n".join(line for line in lines if line)]
+    for index, table in enumerate(document.get("tables", []), start=1):
+        parts.append(f"TABLE {index}:")
+        parts.extend(" | ".join(row) for row in table)
+    if document.get("pages_read", 0) < document.get("pages", 0):
+        parts.append(f"[Only the first {document['pages_read']} of {document['pages']} pages were read]")
+    return "\n".join(parts)[:max_chars]
+
+
+def _parse_sheet_rows(rows) -> Dict[str, Any]:
+    """
+    Find spirometry measurements in a stream of worksheet rows.
+
+    Recognises two layouts by their header row:
+    - wide: one column per parameter ("FVC", "FEV1", "FEV1 %Pred" ...), one row per trial
+    - long: one row per parameter with value/predicted/%predicted/post-BD columns
+    Rows are consumed lazily; nothing beyond the current row is kept except parsed values.
+    """
+    wide_columns: Dict[int, Tuple[str, str]] = {}
+    long_columns: Dict[int, str] = {}
+    trials: List[Dict[str, float]] = []
+    raw_data: Dict[str, float] = {}
+    predicted: Dict[str, float] = {}
+    percent: Dict[str, float] = {}
+    preview: List[str] = []
+
+    for row in rows:
+        cells = list(row)
+        if len(preview) < 60 and any(c is not None for c in cells):
+            preview.append(" | ".join("" if c is None else str(c) for c in cells).strip(" |"))
+
+        classified = [classify_column(c) if isinstance(c, str) else (None, None) for c in cells]
+        parameter_headers = [(i, c) for i, c in enumerate(classified) if c[0] is not None]
+        kind_headers = [(i, c[1]) for i, c in enumerate(classified) if c[0] is None and c[1] is not None]
+
+        # Header rows start a new table
+        if len(parameter_headers) >= 2 and not any(to_float(c) is not None for c in cells):
+            wide_columns = dict(parameter_headers)
+            long_columns = {}
+            continue
+        if len(kind_headers) >= 2 and any(kind == "value" for _, kind in kind_headers):
+            long_columns = dict(kind_headers)
+            wide_columns = {}
+            continue
+
+        if wide_columns:
+            trial = {}
+            for index, (parameter, kind) in wide_columns.items():
+                value = to_float(cells[index]) if index < len(cells) else None
+                if value is None:
+                    continue
+                if kind == "value":
+                    trial[parameter] = value
+                elif kind == "predicted":
+                    predicted.setdefault(parameter, value)
+                elif kind == "percent":
+                    percent.setdefault(f"{parameter}_percent", value)
+                elif kind == "post":
+                    trial[f"post_bd_{parameter}"] = value
+            if trial:
+                trials.append(trial)
+            continue
+
+        # Long layout (or label/value pairs without a header)
+        label_index = next((i for i, c in enumerate(cells) if isinstance(c, str) and c.strip()), None)
+        if label_index is None:
+            continue
+        parameter = match_parameter(cells[label_index])
+        if parameter is None:
+            continue
+        columns = long_columns or {
+            i: "value" for i in range(label_index + 1, len(cells)) if to_float(cells[i]) is not None
+        }
+        for index, kind in sorted(columns.items()):
+            value = to_float(cells[index]) if index < len(cells) else None
+            if value is None:
+                continue
+            if kind == "value":
+                raw_data.setdefault(parameter, value)
+            elif kind == "predicted":
+                predicted.setdefault(parameter, value)
+            elif kind == "percent":
+                percent.setdefault(f"{parameter}_percent", value)
+            elif kind == "post":
+                raw_data.setdefault(f"post_bd_{parameter}", value)
+
+    for key, value in combine_trials(trials).items():
+        raw_data.setdefault(key, value)
+    for key in ("fev1_fvc_ratio", "post_bd_fev1_fvc_ratio"):
+        if key in raw_data:
+            raw_data[key] = normalize_ratio(raw_data[key])
+    return {
+        "raw_data": raw_data,
+        "predicted_values": {k: v for k, v in predicted.items() if k in PREDICTED_PARAMETERS},
+        "percent_predicted": percent,
+        "trials": len(trials),
+        "preview": preview
+    }
+
+
+def extract_xlsx(path: str, max_rows: int) -> Dict[str, Any]:
+    """
+    Locate the spirometry results sheet of a workbook and extract its measurements.
+
+    Runs inside the process pool. The workbook is opened read-only and every
+    sheet is streamed row by row (at most ``max_rows`` rows each); the sheet
+    with the most recognised parameters wins, preferring sheets whose name
+    mentions spirometry/PFT results on ties.
+    """
+    from itertools import islice
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        best_name, best = None, None
+        for sheet in workbook.worksheets:
+            parsed = _parse_sheet_rows(islice(sheet.iter_rows(values_only=True), max_rows))
+            name_bonus = 1 if re.search(r"spiro|pft|result|lung", sheet.title, re.IGNORECASE) else 0
+            score = (len([p for p in PARAMETERS if p in parsed["raw_data"]]), name_bonus)
+            if best is None or score > best[0]:
+                best_name, best = sheet.title, (score, parsed)
+    finally:
+        workbook.close()
+
+    if best is None:
+        return {"result": None, "text": "", "sheet": None, "extractor": "openpyxl"}
+
+    (found, _), parsed = best
+    text = "\n".join(parsed["preview"])
+    result = None
+    if found:
+        result = build_extraction_result(
+            parsed["raw_data"],
+            parsed["predicted_values"],
+            parsed["percent_predicted"],
+            test_metadata={"source_sheet": best_name, "trials": parsed["trials"]}
+        )
+    return {"result": result, "text": text, "sheet": best_name, "extractor": "openpyxl"}
+
+
+EXTRACTORS = {
+    "pdf": extract_pdf,
+    "xlsx": extract_xlsx,
+}
+
+
+def _extractor_limit(file_type: str) -> int:
+    return settings.PDF_MAX_PAGES if file_type == "pdf" else settings.XLSX_MAX_ROWS
+
+
+async def extract_document(path: str, file_type: str) -> Optional[Dict[str, Any]]:
+    """
+    Extract a binary document off the event loop.
+
+    Returns:
+        {"text": compact text for the parser/LLM, "result": structured extraction
+        result or None}, or None if the file type has no binary extractor
+    """
+    file_type = file_type.lower()
+    extractor = EXTRACTORS.get(file_type)
+    if extractor is None:
+        return None
+
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    try:
+        document = await asyncio.wait_for(
+            loop.run_in_executor(
+                executor, _run_limited, extractor, path, _extractor_limit(file_type), settings.EXTRACTION_TIMEOUT
+            ),
+            timeout=settings.EXTRACTION_TIMEOUT + _KILL_GRACE
+        )
+    except asyncio.TimeoutError:
+        logger.error(f"extract_document: worker did not stop after its timeout; recycling the pool ({path})")
+        _recycle_executor(executor)
+        raise
+    if file_type == "pdf":
+        logger.info(
+            f"extract_document: type=pdf, pages={document.get('pages_read')}/{document.get('pages')}, "
+            f"tables={len(document.get('tables', []))}, extractor={document.get('extractor')}"
+        )
+        return {"text": format_extracted_document(document, settings.EXTRACTION_MAX_CHARS), "result": None}
+
+    logger.info(f"extract_document: type={file_type}, sheet={document.get('sheet')}, structured={document['result'] is not None}")
+    return {"text": document["text"][:settings.EXTRACTION_MAX_CHARS], "result": document["result"]}
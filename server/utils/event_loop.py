@@ -0,0 +1,130 @@
+"""
+Event loop hygiene for AutoPFTReport System.
+
+All requests on a worker share one asyncio event loop, so any synchronous
+call that runs for long (a blocking SDK call, a large CPU-bound batch)
+stalls every other request and WebSocket on that worker.
+
+- ``offload`` runs unavoidable synchronous work in a thread.
+- ``LoopLagMonitor`` measures event loop lag with a heartbeat task. A
+  watchdog thread notices when the heartbeat stops and logs the loop
+  thread's stack *while it is still blocked*, together with the HTTP
+  requests in flight, so the offending handler can be identified.
+"""
+
+import asyncio
+import functools
+import logging
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def offload(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a synchronous callable in a worker thread and await its result."""
+    return await asyncio.to_thread(functools.partial(func, *args, **kwargs))
+
+
+class LoopLagMonitor:
+    """Heartbeat-based event loop lag monitor with a stall watchdog."""
+
+    def __init__(self, interval: Optional[float] = None, threshold: Optional[float] = None):
+        self.interval = interval or settings.LOOP_LAG_INTERVAL
+        self.threshold = threshold or settings.LOOP_LAG_THRESHOLD
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._stall_reported = False
+        self._in_flight: Dict[int, Dict[str, Any]] = {}
+        self._next_request = 0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.last_stall: Optional[Dict[str, Any]] = None
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @contextmanager
+    def track(self, description: str):
+        """Register an in-flight request so stalls can be attributed to it."""
+        self._next_request += 1
+        token = self._next_request
+        self._in_flight[token] = {"request": description, "started": time.monotonic()}
+        try:
+            yield
+        finally:
+            self._in_flight.pop(token, None)
+
+    def _in_flight_summary(self) -> list:
+        now = time.monotonic()
+        return [
+            f"{entry['request']} ({now - entry['started']:.2f}s)"
+            for entry in list(self._in_flight.values())
+        ]
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = now - expected
+            self._last_beat = now
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.stalls += 1
+                self.last_stall = {"lag_seconds": round(lag, 3), "at": time.time()}
+                logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms")
+            self._stall_reported = False
+
+    def _watch(self):
+        """Runs in a thread: dump the loop thread's stack while it is stalled."""
+        while not self._stopped.wait(self.interval):
+            stalled_for = time.monotonic() - self._last_beat - self.interval
+            if stalled_for <= self.threshold or self._stall_reported:
+                continue
+            self._stall_reported = True
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<unavailable>"
+            logger.warning(
+                f"Event loop stalled for over {stalled_for * 1000:.0f} ms; "
+                f"in-flight requests: {self._in_flight_summary() or 'none'}\n"
+                f"Loop thread stack:\n{stack}"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": round(self.threshold * 1000),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": self.stalls,
+            "last_stall": self.last_stall,
+            "in_flight_requests": len(self._in_flight)
+        }
+
+
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,239 @@
+"""
+Feedback performance metrics for AutoPFTReport System.
+
+Computes accuracy and agreement statistics directly from stored doctor
+feedback, so the numbers behind performance reports are exact rather than
+estimated by a language model:
+
+- mean 1-5 ratings
+- agreement rate and Cohen's kappa between the AI's pattern / severity /
+  triage level and the physician's (a feedback entry without a correction
+  counts as agreement)
+- per-window trends, with a least-squares regression over the individual
+  entries to test whether the change is significant
+- outliers: physicians whose ratings differ markedly from their peers
+  (modified z-score) and reports rated poorly on every scale
+- per-route accuracy: agreement for each model that produced the
+  interpretation or triage (see utils/model_router.py)
+"""
+
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from utils.feedback_stats import RATING_FIELDS, CORRECTION_FIELDS, summarize_entry
+
+SIGNIFICANCE_LEVEL = 0.05
+MIN_TREND_ENTRIES = 10
+OUTLIER_Z_SCORE = 3.5
+MIN_PHYSICIAN_ENTRIES = 3
+LOW_RATING = 2
+MAX_LISTED_OUTLIERS = 10
+
+# Agent call (as recorded in the report's model_routes) that produced each corrected label
+CORRECTION_ROUTES = {
+    "pattern": "Interpreter.interpretation",
+    "severity": "Interpreter.interpretation",
+    "triage": "TriageSpecialist.triage",
+}
+
+
+def parse_time_window(time_window: str) -> Optional[int]:
+    """Number of days in a label such as "30_days" or "last_30_days"; None for all time."""
+    match = re.search(r"(\d+)", time_window or "")
+    return int(match.group(1)) if match else None
+
+
+def cohens_kappa(first: List[str], second: List[str]) -> Optional[float]:
+    """Cohen's kappa between two raters' labels; None when undefined."""
+    if not first:
+        return None
+    labels, codes = np.unique(np.concatenate([first, second]), return_inverse=True)
+    a, b = codes[:len(first)], codes[len(first):]
+    matrix = np.zeros((labels.size, labels.size))
+    np.add.at(matrix, (a, b), 1)
+    n = matrix.sum()
+    observed = np.trace(matrix) / n
+    expected = (matrix.sum(axis=1) @ matrix.sum(axis=0)) / (n * n)
+    if expected >= 1:
+        return 1.0 if observed >= 1 else None
+    return round(float((observed - expected) / (1 - expected)), 3)
+
+
+def feedback_frame(feedback: List[Dict[str, Any]], reports: Optional[Dict[str, Dict[str, Any]]] = None) -> pd.DataFrame:
+    """One row per feedback entry: date, physician, ratings and (original, final) labels."""
+    reports = reports or {}
+    rows = []
+    for item in feedback:
+        report = reports.get(item.get("report_id"))
+        entry = summarize_entry(item, report)
+        routes = ((report or {}).get("processing_metadata") or {}).get("model_routes") or {}
+        row = {
+            "report_id": item.get("report_id"),
+            "physician_id": item.get("physician_id"),
+            "feedback_date": item.get("feedback_date"),
+            **{field: entry["ratings"].get(field, np.nan) for field in RATING_FIELDS}
+        }
+        for name, (original, final) in entry["pairs"].items():
+            row[f"{name}_original"] = original
+            row[f"{name}_final"] = final
+            row[f"{name}_model"] = (routes.get(CORRECTION_ROUTES[name]) or {}).get("model", "unknown")
+        rows.append(row)
+    frame = pd.DataFrame(rows)
+    if not frame.empty:
+        frame["feedback_date"] = pd.to_datetime(frame["feedback_date"], errors="coerce", format="mixed")
+        if frame["feedback_date"].dt.tz is not None:
+            frame["feedback_date"] = frame["feedback_date"].dt.tz_convert(None)
+    return frame
+
+
+def _trend(days: np.ndarray, values: np.ndarray, window_days: int) -> Dict[str, Any]:
+    valid = ~(np.isnan(days) | np.isnan(values))
+    days, values = days[valid], values[valid]
+    if days.size < MIN_TREND_ENTRIES or np.ptp(days) == 0:
+        return {"direction": "insufficient_data", "entries": int(days.size)}
+    if np.ptp(values) == 0:
+        return {"direction": "stable", "change_per_window": 0.0, "p_value": None,
+                "statistical_significance": False, "entries": int(days.size)}
+    fit = stats.linregress(days, values)
+    significant = bool(fit.pvalue < SIGNIFICANCE_LEVEL)
+    direction = "stable"
+    if significant:
+        direction = "improving" if fit.slope > 0 else "declining"
+    return {
+        "direction": direction,
+        "change_per_window": round(float(fit.slope * window_days), 4),
+        "p_value": round(float(fit.pvalue), 4),
+        "statistical_significance": significant,
+        "entries": int(days.size)
+    }
+
+
+def compute_feedback_metrics(
+    feedback: List[Dict[str, Any]],
+    reports: Optional[Dict[str, Dict[str, Any]]] = None,
+    time_window: str = "30_days",
+    window_days: int = 7,
+    now: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """
+    Accuracy, agreement, trend and outlier metrics from stored feedback.
+
+    Args:
+        feedback: Feedback entries as stored in ``pft:feedback``
+        reports: Stored reports keyed by report ID, for the AI's original labels
+        time_window: Period label such as "30_days"; entries outside it are ignored
+        window_days: Width of the trend windows in days
+
+    Returns:
+        Dict with summary, agreement, trends, windows and outliers
+    """
+    frame = feedback_frame(feedback, reports)
+    period_days = parse_time_window(time_window)
+    if not frame.empty and period_days is not None:
+        start = (now or datetime.now()) - timedelta(days=period_days)
+        frame = frame[frame["feedback_date"].isna() | (frame["feedback_date"] >= start)]
+    if frame.empty:
+        return {"time_window": time_window, "summary": {"total_feedback_entries": 0}}
+
+    summary = {"total_feedback_entries": int(len(frame))}
+    for field in RATING_FIELDS:
+        mean = frame[field].mean()
+        summary[f"average_{field}"] = None if np.isnan(mean) else round(float(mean), 3)
+
+    agreement = {}
+    for name in CORRECTION_FIELDS:
+        # Feedback on reports that are no longer stored has no original label to agree with
+        known = frame[frame[f"{name}_original"] != "unknown"]
+        agreed = known[f"{name}_original"] == known[f"{name}_final"]
+        agreement[name] = {
+            "agreement_rate": round(float(agreed.mean()), 3) if len(agreed) else None,
+            "corrections": int((~agreed).sum()),
+            "cohens_kappa": cohens_kappa(known[f"{name}_original"].tolist(), known[f"{name}_final"].tolist()),
+            "rated_against_report": int(len(known))
+        }
+
+    dated = frame[frame["feedback_date"].notna()]
+    trends, windows = {}, []
+    if not dated.empty:
+        origin = dated["feedback_date"].min()
+        days = ((dated["feedback_date"] - origin).dt.total_seconds() / 86400).to_numpy(dtype=float)
+        for field in RATING_FIELDS:
+            trends[field] = _trend(days, dated[field].to_numpy(dtype=float), window_days)
+        for name in CORRECTION_FIELDS:
+            known = (dated[f"{name}_original"] != "unknown").to_numpy()
+            agreed = (dated[f"{name}_original"] == dated[f"{name}_final"]).to_numpy(dtype=float)
+            trends[f"{name}_agreement"] = _trend(days[known], agreed[known], window_days)
+
+        window_index = (days // window_days).astype(int)
+        grouped = dated.assign(window=window_index).groupby("window")
+        for index, group in grouped:
+            known = group[group["pattern_original"] != "unknown"]
+            windows.append({
+                "start": (origin + timedelta(days=int(index) * window_days)).date().isoformat(),
+                "entries": int(len(group)),
+                **{field: round(float(group[field].mean()), 3) for field in RATING_FIELDS},
+                "pattern_agreement": (
+                    round(float((known["pattern_original"] == known["pattern_final"]).mean()), 3)
+                    if len(known) else None
+                )
+            })
+
+    return {
+        "time_window": time_window,
+        "summary": summary,
+        "agreement": agreement,
+        "trends": trends,
+        "windows": windows,
+        "outliers": _outliers(frame),
+        "routes": _route_accuracy(frame)
+    }
+
+
+def _route_accuracy(frame: pd.DataFrame) -> Dict[str, Any]:
+    """Agreement rate per model for each corrected label, where the report recorded its route."""
+    routes = {}
+    for name, route in CORRECTION_ROUTES.items():
+        known = frame[frame[f"{name}_model"] != "unknown"]
+        agreed = (known[f"{name}_original"] == known[f"{name}_final"]).groupby(known[f"{name}_model"])
+        for model, values in agreed:
+            routes.setdefault(route, {}).setdefault(model, {})[name] = {
+                "agreement_rate": round(float(values.mean()), 3),
+                "entries": int(values.size)
+            }
+    return routes
+
+
+def _outliers(frame: pd.DataFrame) -> Dict[str, Any]:
+    overall = frame[list(RATING_FIELDS)].mean(axis=1)
+    physicians = frame.assign(overall=overall).groupby("physician_id")["overall"].agg(["mean", "count"])
+    physicians = physicians[physicians["count"] >= MIN_PHYSICIAN_ENTRIES]
+
+    flagged = []
+    if len(physicians) >= 3:
+        means = physicians["mean"].to_numpy(dtype=float)
+        median = np.median(means)
+        mad = np.median(np.abs(means - median))
+        if mad > 0:
+            z_scores = 0.6745 * (means - median) / mad
+            for physician_id, mean, count, z in zip(physicians.index, means, physicians["count"], z_scores):
+                if abs(z) > OUTLIER_Z_SCORE:
+                    flagged.append({
+                        "physician_id": physician_id,
+                        "mean_rating": round(float(mean), 3),
+                        "entries": int(count),
+                        "modified_z_score": round(float(z), 2)
+                    })
+
+    low = frame[(frame[list(RATING_FIELDS)] <= LOW_RATING).all(axis=1)]
+    return {
+        "physicians": flagged[:MAX_LISTED_OUTLIERS],
+        "low_rated_reports": {
+            "count": int(len(low)),
+            "report_ids": low["report_id"].drop_duplicates().head(MAX_LISTED_OUTLIERS).tolist()
+        }
+    }
@@ -0,0 +1,287 @@
+"""
+Incremental feedback analytics for AutoPFTReport System.
+
+Doctor feedback is appended to a Redis stream and returned to the client
+immediately. A background aggregator consumes the stream through a consumer
+group (each entry is processed by exactly one worker) and folds every entry
+into statistics kept in Redis:
+
+- running sums for the 1-5 ratings, so means never require a rescan
+- confusion matrices of the report's original pattern / severity / triage
+  level against the physician's correction (no correction counts as
+  agreement). Feedback on a report that is not stored, or has no such
+  label, has no original to compare and is left out of the matrices and
+  correction rates
+- a sliding window of the most recent entries
+
+The LLM summariser only runs on a schedule, or early when the window drifts
+from the long-run statistics, instead of on every submission.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import settings
+from utils.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_LIST_KEY = "pft:feedback"
+FEEDBACK_STREAM_KEY = "pft:feedback:stream"
+FEEDBACK_STATS_KEY = "pft:feedback:stats"
+FEEDBACK_WINDOW_KEY = "pft:feedback:window"
+FEEDBACK_SUMMARY_KEY = "pft:feedback:summary"
+FEEDBACK_SUMMARY_LOCK_KEY = "pft:feedback:summary:lock"
+CONSUMER_GROUP = "feedback-aggregator"
+
+RATING_FIELDS = ("interpretation_accuracy", "report_quality", "triage_appropriateness")
+
+# Feedback field -> where the original value lives in the stored report
+CORRECTION_FIELDS = {
+    "pattern": ("corrected_pattern", "interpretation", "pattern"),
+    "severity": ("corrected_severity", "interpretation", "severity"),
+    "triage": ("corrected_triage", "triage", "level"),
+}
+
+
+def _original_value(report: Dict[str, Any], section: str, field: str) -> str:
+    value = (report.get(section) or {}).get(field)
+    return str(value).lower().replace(":", "_") if value else "unknown"
+
+
+def summarize_entry(feedback: Dict[str, Any], report: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reduce one feedback entry to its ratings and (original, corrected) pairs with a known original."""
+    report = report or {}
+    entry = {"ratings": {}, "pairs": {}}
+    for field in RATING_FIELDS:
+        if feedback.get(field) is not None:
+            entry["ratings"][field] = float(feedback[field])
+    for name, (corrected_field, section, field) in CORRECTION_FIELDS.items():
+        original = _original_value(report, section, field)
+        if original == "unknown":
+            continue
+        corrected = feedback.get(corrected_field)
+        entry["pairs"][name] = (original, str(corrected) if corrected else original)
+    return entry
+
+
+def window_statistics(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Mean ratings and correction rates over a list of summarized entries."""
+    means = {}
+    for field in RATING_FIELDS:
+        values = [e["ratings"][field] for e in entries if field in e["ratings"]]
+        means[field] = round(sum(values) / len(values), 3) if values else None
+    correction_rates = {}
+    for name in CORRECTION_FIELDS:
+        pairs = [e["pairs"][name] for e in entries if name in e["pairs"]]
+        corrected = sum(1 for original, new in pairs if original != new)
+        correction_rates[name] = round(corrected / len(pairs), 3) if pairs else None
+    return {"entries": len(entries), "means": means, "correction_rates": correction_rates}
+
+
+def detect_drift(overall: Dict[str, Any], window: Dict[str, Any]) -> List[str]:
+    """Names of the statistics whose recent window has drifted from the long-run value."""
+    if window["entries"] < settings.FEEDBACK_DRIFT_MIN_ENTRIES:
+        return []
+    drifted = []
+    for field in RATING_FIELDS:
+        overall_mean, recent_mean = overall["means"].get(field), window["means"].get(field)
+        if overall_mean is not None and recent_mean is not None \
+                and overall_mean - recent_mean >= settings.FEEDBACK_RATING_DRIFT:
+            drifted.append(field)
+    for name in CORRECTION_FIELDS:
+        overall_rate, recent_rate = overall["correction_rates"].get(name), window["correction_rates"].get(name)
+        if overall_rate is not None and recent_rate is not None \
+                and recent_rate - overall_rate >= settings.FEEDBACK_CORRECTION_DRIFT:
+            drifted.append(f"{name}_corrections")
+    return drifted
+
+
+class FeedbackAggregator:
+    """Consumes the feedback stream and maintains incremental statistics in Redis."""
+
+    def __init__(self):
+        self.redis_client = get_redis()
+        self.consumer = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._summarize: Optional[Callable[[List[Dict[str, Any]], str], Awaitable[Dict[str, Any]]]] = None
+        self._consumer_task: Optional[asyncio.Task] = None
+        self._summary_task: Optional[asyncio.Task] = None
+        self._next_check = 0.0
+
+    async def submit(self, payload: str):
+        """Store a serialized feedback entry and queue it for aggregation."""
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.rpush(FEEDBACK_LIST_KEY, payload)
+            pipe.xadd(
+                FEEDBACK_STREAM_KEY,
+                {"feedback": payload},
+                maxlen=settings.FEEDBACK_STREAM_MAXLEN,
+                approximate=True
+            )
+            await pipe.execute()
+
+    async def start(self, summarize: Callable[[List[Dict[str, Any]], str], Awaitable[Dict[str, Any]]] = None):
+        """Start the stream consumer (idempotent). ``summarize`` is the LLM batch analyser."""
+        self._summarize = summarize
+        if self._consumer_task is None or self._consumer_task.done():
+            self._consumer_task = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        for task in (self._consumer_task, self._summary_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._consumer_task = None
+        self._summary_task = None
+
+    async def _ensure_group(self):
+        try:
+            await self.redis_client.xgroup_create(FEEDBACK_STREAM_KEY, CONSUMER_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _consume(self):
+        """Read the stream through the consumer group, reconnecting with backoff on errors."""
+        delay = 1.0
+        while True:
+            try:
+                await self._ensure_group()
+                # Entries left unacknowledged by a worker that died are taken over
+                _, claimed, *_ = await self.redis_client.xautoclaim(
+                    FEEDBACK_STREAM_KEY, CONSUMER_GROUP, self.consumer,
+                    min_idle_time=int(settings.FEEDBACK_CLAIM_IDLE * 1000), start_id="0-0",
+                    count=settings.FEEDBACK_BATCH_SIZE
+                )
+                if claimed:
+                    await self.process(claimed)
+                delay = 1.0
+                while True:
+                    response = await self.redis_client.xreadgroup(
+                        CONSUMER_GROUP, self.consumer, {FEEDBACK_STREAM_KEY: ">"},
+                        count=settings.FEEDBACK_BATCH_SIZE,
+                        block=int(settings.FEEDBACK_POLL_INTERVAL * 1000)
+                    )
+                    for _, entries in response or []:
+                        await self.process(entries)
+                    await self._maybe_summarize()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Feedback aggregator error: {e}; retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def process(self, entries: List[Any]):
+        """Fold a batch of stream entries into the statistics and acknowledge them."""
+        entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+        if not entries:
+            return
+        feedback = [json.loads(fields["feedback"]) for _, fields in entries]
+        report_keys = [f"pft:report:{f.get('report_id')}" for f in feedback]
+        reports = [json.loads(data) if data else None for data in await self.redis_client.mget(report_keys)]
+
+        # Statistics and acknowledgement commit together, so a crash never counts an entry twice
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            for item, report in zip(feedback, reports):
+                entry = summarize_entry(item, report)
+                pipe.hincrby(FEEDBACK_STATS_KEY, "count", 1)
+                for field, value in entry["ratings"].items():
+                    pipe.hincrby(FEEDBACK_STATS_KEY, f"n:{field}", 1)
+                    pipe.hincrbyfloat(FEEDBACK_STATS_KEY, f"sum:{field}", value)
+                for name, (original, corrected) in entry["pairs"].items():
+                    pipe.hincrby(FEEDBACK_STATS_KEY, f"confusion:{name}:{original}:{corrected}", 1)
+                pipe.lpush(FEEDBACK_WINDOW_KEY, json.dumps(entry))
+            pipe.ltrim(FEEDBACK_WINDOW_KEY, 0, settings.FEEDBACK_WINDOW_SIZE - 1)
+            pipe.xack(FEEDBACK_STREAM_KEY, CONSUMER_GROUP, *[entry_id for entry_id, _ in entries])
+            await pipe.execute()
+
+    async def stats(self) -> Dict[str, Any]:
+        """Long-run statistics, confusion matrices and the recent window, from Redis."""
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(FEEDBACK_STATS_KEY)
+            pipe.lrange(FEEDBACK_WINDOW_KEY, 0, -1)
+            pipe.get(FEEDBACK_SUMMARY_KEY)
+            raw, window, summary = await pipe.execute()
+
+        means = {}
+        for field in RATING_FIELDS:
+            n = int(raw.get(f"n:{field}", 0))
+            means[field] = round(float(raw.get(f"sum:{field}", 0)) / n, 3) if n else None
+
+        confusion = {name: {} for name in CORRECTION_FIELDS}
+        correction_rates = {}
+        for key, value in raw.items():
+            if key.startswith("confusion:"):
+                _, name, original, corrected = key.split(":", 3)
+                if original == "unknown":
+                    # Counted before unknown originals were skipped; not a correction of anything
+                    continue
+                confusion.setdefault(name, {}).setdefault(original, {})[corrected] = int(value)
+        for name, matrix in confusion.items():
+            total = sum(sum(row.values()) for row in matrix.values())
+            corrected = sum(n for original, row in matrix.items() for new, n in row.items() if new != original)
+            correction_rates[name] = round(corrected / total, 3) if total else None
+
+        overall = {"entries": int(raw.get("count", 0)), "means": means, "correction_rates": correction_rates}
+        recent = window_statistics([json.loads(item) for item in window])
+        return {
+            "overall": overall,
+            "confusion_matrices": confusion,
+            "window": recent,
+            "drift": detect_drift(overall, recent),
+            "last_summary": json.loads(summary) if summary else None
+        }
+
+    async def _maybe_summarize(self):
+        """Run the LLM summariser when the schedule is due or the window has drifted."""
+        if self._summarize is None or (self._summary_task is not None and not self._summary_task.done()):
+            return
+        if time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + settings.FEEDBACK_POLL_INTERVAL
+        stats = await self.stats()
+        if not stats["overall"]["entries"]:
+            return
+        last = stats["last_summary"] or {}
+        since_last = time.time() - last.get("generated_at", 0)
+        new_entries = stats["overall"]["entries"] - last.get("entries", 0)
+        if new_entries <= 0:
+            return
+        if stats["drift"] and since_last >= settings.FEEDBACK_SUMMARY_COOLDOWN:
+            reason = "drift"
+        elif since_last >= settings.FEEDBACK_SUMMARY_INTERVAL:
+            reason = "scheduled"
+        else:
+            return
+        # One worker summarises per cooldown period
+        if not await self.redis_client.set(FEEDBACK_SUMMARY_LOCK_KEY, self.consumer, nx=True,
+                                           ex=int(settings.FEEDBACK_SUMMARY_COOLDOWN)):
+            return
+        self._summary_task = asyncio.create_task(self._run_summary(reason, stats))
+
+    async def _run_summary(self, reason: str, stats: Dict[str, Any]):
+        try:
+            raw = await self.redis_client.lrange(FEEDBACK_LIST_KEY, -settings.FEEDBACK_WINDOW_SIZE, -1)
+            analysis = await self._summarize([json.loads(item) for item in raw], "recent")
+            await self.redis_client.set(FEEDBACK_SUMMARY_KEY, json.dumps({
+                "generated_at": time.time(),
+                "reason": reason,
+                "drift": stats["drift"],
+                "entries": stats["overall"]["entries"],
+                "analysis": analysis
+            }))
+            logger.info(f"Feedback summary generated ({reason})")
+        except Exception as e:
+            logger.error(f"Feedback summary failed: {e}")
+
+
+feedback_aggregator = FeedbackAggregator()
@@ -0,0 +1,256 @@
+"""
+Local knowledge retrieval for AutoPFTReport System.
+
+A BM25 index over guideline excerpts, PFT terminology and de-identified
+past reports grounds the medical chatbot. The index is built offline:
+
+    python -m utils.knowledge_index build [--include-reports]
+    python -m utils.knowledge_index search "what is a significant bronchodilator response"
+
+It is stored as NumPy arrays in term-major (CSR) layout with the BM25
+weight of every posting precomputed, and memory-mapped at startup, so a
+query is a gather and a sum over the postings of its terms and takes well
+under a millisecond. Only the top-k snippets are added to a prompt.
+
+If no index is found at startup (e.g. the dev compose bind mount hides the
+one built into the image), it is built from the corpus before loading.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from typing import Dict, Any, Iterable, List, Optional
+
+import numpy as np
+
+from config import settings, MEDICAL_GUIDELINES
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+REPORT_SOURCE = "De-identified past report"
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its of on or "
+    "should than that the their there this to was what when which while why will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_RE.findall((text or "").lower()) if token not in STOP_WORDS]
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    """Guideline excerpts and terminology entries (one JSON object per line)."""
+    with open(path, encoding="utf-8") as corpus:
+        return [json.loads(line) for line in corpus if line.strip()]
+
+
+def deidentify_report(digest: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Turn a report digest into a snippet with identifiers removed and age banded."""
+    if not digest.get("pattern"):
+        return None
+    patient = digest.get("patient") or {}
+    age = patient.get("age")
+    who = " ".join(filter(None, [f"{int(age) // 10 * 10}s" if isinstance(age, (int, float)) else None,
+                                 patient.get("gender")]))
+    values = ", ".join(f"{name.upper()} {value}" for name, value in (digest.get("values") or {}).items()
+                       if isinstance(value, (int, float)))
+    percent = ", ".join(f"{name.replace('_percent', '').upper()} {value}%"
+                        for name, value in (digest.get("percent_predicted") or {}).items()
+                        if isinstance(value, (int, float)))
+    findings = "; ".join(str(finding) for finding in digest.get("key_findings") or [])
+    triage = (digest.get("triage") or {}).get("level")
+    text = " ".join(filter(None, [
+        f"Patient {who}." if who else None,
+        f"Pattern {digest['pattern']}, severity {digest.get('severity', 'not graded')}.",
+        f"Values: {values}." if values else None,
+        f"Percent predicted: {percent}." if percent else None,
+        f"Findings: {findings}." if findings else None,
+        f"Triage {triage}." if triage else None
+    ]))
+    return {"type": "report", "source": "past_reports",
+            "title": f"{digest['pattern'].capitalize()} pattern, {digest.get('severity', 'ungraded')}", "text": text}
+
+
+async def load_report_documents(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """De-identified snippets from the stored report digests."""
+    from utils.redis import get_redis
+    redis_client = get_redis()
+    documents = []
+    async for key in redis_client.scan_iter(match="pft:digest:*", count=1000):
+        data = await redis_client.hget(key, "digest")
+        document = deidentify_report(json.loads(data)) if data else None
+        if document:
+            document["id"] = f"r{len(documents) + 1:06d}"
+            documents.append(document)
+            if limit and len(documents) >= limit:
+                break
+    return documents
+
+
+def build_index(documents: Iterable[Dict[str, Any]], output_dir: str) -> Dict[str, Any]:
+    """Write the BM25 index for ``documents`` to ``output_dir``."""
+    documents = list(documents)
+    vocabulary: Dict[str, int] = {}
+    term_ids, doc_ids, frequencies = [], [], []
+    lengths = np.zeros(len(documents), dtype=np.float32)
+    for doc_id, document in enumerate(documents):
+        counts = Counter(tokenize(f"{document.get('title', '')} {document['text']}"))
+        lengths[doc_id] = sum(counts.values())
+        for term, count in counts.items():
+            term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+            doc_ids.append(doc_id)
+            frequencies.append(count)
+
+    term_ids = np.asarray(term_ids, dtype=np.int32)
+    doc_ids = np.asarray(doc_ids, dtype=np.int32)
+    frequencies = np.asarray(frequencies, dtype=np.float32)
+    order = np.argsort(term_ids, kind="stable")
+    term_ids, doc_ids, frequencies = term_ids[order], doc_ids[order], frequencies[order]
+
+    n_docs = max(len(documents), 1)
+    document_frequency = np.bincount(term_ids, minlength=len(vocabulary)).astype(np.float32)
+    idf = np.log1p((n_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+    average_length = float(lengths.mean()) if lengths.size else 1.0
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_ids] / average_length)
+    weights = (idf[term_ids] * frequencies * (BM25_K1 + 1) / (frequencies + norm)).astype(np.float32)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)))]).astype(np.int64)
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(output_dir, "doc_ids.npy"), doc_ids)
+    np.save(os.path.join(output_dir, "weights.npy"), weights)
+    with open(os.path.join(output_dir, "vocabulary.json"), "w", encoding="utf-8") as out:
+        json.dump(vocabulary, out)
+    with open(os.path.join(output_dir, "documents.jsonl"), "w", encoding="utf-8") as out:
+        for document in documents:
+            out.write(json.dumps(document) + "\n")
+    meta = {
+        "documents": len(documents),
+        "terms": len(vocabulary),
+        "postings": int(weights.size),
+        "k1": BM25_K1,
+        "b": BM25_B,
+        "built_at": time.time()
+    }
+    with open(os.path.join(output_dir, "meta.json"), "w", encoding="utf-8") as out:
+        json.dump(meta, out)
+    return meta
+
+
+class KnowledgeIndex:
+    """Memory-mapped BM25 index queried in-process."""
+
+    def __init__(self, index_dir: Optional[str] = None):
+        self.index_dir = index_dir or settings.KNOWLEDGE_INDEX_DIR
+        self.loaded = False
+        self._load_failed = False
+        self.meta: Dict[str, Any] = {}
+
+    def load(self) -> bool:
+        """Map the index files; returns False (and logs once) if no index has been built."""
+        try:
+            self.offsets = np.load(os.path.join(self.index_dir, "offsets.npy"), mmap_mode="r")
+            self.doc_ids = np.load(os.path.join(self.index_dir, "doc_ids.npy"), mmap_mode="r")
+            self.weights = np.load(os.path.join(self.index_dir, "weights.npy"), mmap_mode="r")
+            with open(os.path.join(self.index_dir, "vocabulary.json"), encoding="utf-8") as vocabulary:
+                self.vocabulary = json.load(vocabulary)
+            with open(os.path.join(self.index_dir, "documents.jsonl"), encoding="utf-8") as documents:
+                self.documents = [json.loads(line) for line in documents]
+            with open(os.path.join(self.index_dir, "meta.json"), encoding="utf-8") as meta:
+                self.meta = json.load(meta)
+        except FileNotFoundError:
+            if not self._load_failed:
+                logger.warning(f"Knowledge index not found in {self.index_dir}; chat answers will not be grounded")
+            self._load_failed = True
+            return False
+        self.loaded = True
+        self._load_failed = False
+        return True
+
+    def load_or_build(self, corpus_path: Optional[str] = None) -> bool:
+        """Load the index, first building it from the corpus (without reports) if it is missing."""
+        if not os.path.exists(os.path.join(self.index_dir, "meta.json")):
+            corpus_path = corpus_path or settings.KNOWLEDGE_CORPUS_PATH
+            try:
+                meta = build_index(load_corpus(corpus_path), self.index_dir)
+                logger.info(f"Built missing knowledge index in {self.index_dir}: {meta['documents']} documents")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not build knowledge index from {corpus_path}: {e}")
+        return self.load()
+
+    def search(self, query: str, k: Optional[int] = None, min_score: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Top-k documents for ``query`` by BM25 score."""
+        if not self.loaded and (self._load_failed or not self.load()):
+            return []
+        k = k or settings.RETRIEVAL_TOP_K
+        min_score = settings.RETRIEVAL_MIN_SCORE if min_score is None else min_score
+        terms = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not terms:
+            return []
+
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for term in terms:
+            start, end = self.offsets[term], self.offsets[term + 1]
+            # Postings of one term hold distinct documents, so plain fancy-index addition is safe
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+
+        candidates = np.flatnonzero(scores >= min_score)
+        if candidates.size > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [{**self.documents[i], "score": round(float(scores[i]), 3)} for i in ranked]
+
+
+def source_name(document: Dict[str, Any]) -> str:
+    """Citation for a retrieved snippet."""
+    if document.get("type") == "report":
+        return REPORT_SOURCE
+    guideline = MEDICAL_GUIDELINES.get(document.get("source"), {})
+    return f"{guideline.get('name', document.get('source'))}: {document.get('title')}"
+
+
+knowledge_index = KnowledgeIndex()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Build or query the chatbot knowledge index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build the index from the corpus (and stored reports)")
+    build.add_argument("--corpus", default=settings.KNOWLEDGE_CORPUS_PATH)
+    build.add_argument("--output", default=settings.KNOWLEDGE_INDEX_DIR)
+    build.add_argument("--include-reports", action="store_true", help="Add de-identified reports from Redis")
+    build.add_argument("--max-reports", type=int, default=None)
+    search = commands.add_parser("search", help="Query a built index")
+    search.add_argument("query")
+    search.add_argument("--index", default=settings.KNOWLEDGE_INDEX_DIR)
+    search.add_argument("-k", type=int, default=settings.RETRIEVAL_TOP_K)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        documents = load_corpus(args.corpus)
+        if args.include_reports:
+            documents += asyncio.run(load_report_documents(args.max_reports))
+        meta = build_index(documents, args.output)
+        print(f"Indexed {meta['documents']} documents, {meta['terms']} terms, {meta['postings']} postings "
+              f"into {args.output}")
+    else:
+        index = KnowledgeIndex(args.index)
+        start = time.perf_counter()
+        results = index.search(args.query, k=args.k, min_score=0)
+        elapsed = (time.perf_counter() - start) * 1000
+        for result in results:
+            print(f"{result['score']:7.3f}  {source_name(result)}")
+        print(f"{len(results)} results in {elapsed:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
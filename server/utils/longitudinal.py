@@ -0,0 +1,222 @@
+"""
+Longitudinal lung function decline for AutoPFTReport System.
+
+Fits an ordinary least squares slope per patient and parameter over serial
+FEV1 / FVC / DLCO measurements, with a t-based 95% confidence interval.
+The fit is vectorized across patients with grouped sums, so a whole
+cohort's history is processed in a few array operations.
+
+Decline thresholds:
+- FEV1: accelerated decline faster than 60 mL/year
+- FVC: decline of 5% or more of the patient's mean value per year
+- DLCO: decline of 10% or more of the patient's mean value per year
+Slopes are only flagged when the measurements span at least
+MIN_FOLLOW_UP_YEARS, since short intervals exaggerate test-to-test noise.
+"""
+
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+DECLINE_PARAMETERS = ["fev1", "fvc", "dlco"]
+
+# Parameters measured in litres; slopes are reported in mL/year
+VOLUME_PARAMETERS = ("fev1", "fvc")
+
+ACCELERATED_FEV1_DECLINE_ML = 60  # mL/year
+RAPID_FVC_DECLINE_PERCENT = 5  # % of mean value per year
+RAPID_DLCO_DECLINE_PERCENT = 10  # % of mean value per year
+MIN_FOLLOW_UP_YEARS = 1.0
+CONFIDENCE = 0.95
+
+DAYS_PER_YEAR = 365.25
+
+
+def _to_datetime(value: Any) -> Optional[datetime]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        return pd.Timestamp(value).to_pydatetime()
+    except (TypeError, ValueError):
+        return None
+
+
+def fit_slopes(groups: Sequence[int], years: Sequence[float], values: Sequence[float]) -> pd.DataFrame:
+    """
+    Per-group OLS slope of values against time in years.
+
+    Args:
+        groups: Integer group code per measurement (0..n_groups-1)
+        years: Measurement time in years (any origin)
+        values: Measured values; NaN measurements are ignored
+
+    Returns:
+        One row per group: n_tests, span_years, mean, slope, ci_low, ci_high
+        (slope and CI per year; CI is NaN with fewer than three tests)
+    """
+    groups = np.asarray(groups, dtype=int)
+    years = np.asarray(years, dtype=float)
+    values = np.asarray(values, dtype=float)
+    n_groups = int(groups.max()) + 1 if groups.size else 0
+
+    valid = ~(np.isnan(values) | np.isnan(years))
+    groups, years, values = groups[valid], years[valid], values[valid]
+
+    n = np.bincount(groups, minlength=n_groups).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_t = np.bincount(groups, years, n_groups) / n
+        mean_y = np.bincount(groups, values, n_groups) / n
+        # Centred sums keep the fit stable for dates far from the origin
+        dt = years - mean_t[groups]
+        dy = values - mean_y[groups]
+        s_tt = np.bincount(groups, dt * dt, n_groups)
+        s_ty = np.bincount(groups, dt * dy, n_groups)
+        s_yy = np.bincount(groups, dy * dy, n_groups)
+
+        slope = np.where(s_tt > 0, s_ty / s_tt, np.nan)
+        residual = np.clip(s_yy - slope * s_ty, 0, None)
+        dof = n - 2
+        stderr = np.where(dof > 0, np.sqrt(residual / np.where(dof > 0, dof, 1) / s_tt), np.nan)
+        t_crit = stats.t.ppf(0.5 + CONFIDENCE / 2, np.where(dof > 0, dof, 1))
+        margin = np.where(dof > 0, t_crit * stderr, np.nan)
+
+    span = np.zeros(n_groups)
+    if groups.size:
+        first = np.full(n_groups, np.inf)
+        last = np.full(n_groups, -np.inf)
+        np.minimum.at(first, groups, years)
+        np.maximum.at(last, groups, years)
+        span = np.where(n > 0, last - first, 0.0)
+
+    return pd.DataFrame({
+        "n_tests": n.astype(int),
+        "span_years": span,
+        "mean": mean_y,
+        "slope": slope,
+        "ci_low": slope - margin,
+        "ci_high": slope + margin
+    })
+
+
+def decline_frame(frame: pd.DataFrame, patient_column: str = "patient_id", date_column: str = "test_date") -> pd.DataFrame:
+    """
+    Decline slopes for every patient and parameter of a long-format history.
+
+    Args:
+        frame: One row per test with patient, date and fev1/fvc/dlco columns
+
+    Returns:
+        One row per (patient, parameter): slope/CI per year in reporting units
+        (mL/year for volumes), relative slope in % of mean per year, and the
+        rapid flag
+    """
+    codes, patients = pd.factorize(frame[patient_column])
+    dates = pd.to_datetime(frame[date_column], errors="coerce")
+    years = (dates - pd.Timestamp("2000-01-01")).dt.days.to_numpy(dtype=float) / DAYS_PER_YEAR
+
+    results = []
+    for parameter in DECLINE_PARAMETERS:
+        if parameter not in frame:
+            continue
+        fitted = fit_slopes(codes, years, pd.to_numeric(frame[parameter], errors="coerce").to_numpy(dtype=float))
+        scale = 1000.0 if parameter in VOLUME_PARAMETERS else 1.0
+        for column in ("slope", "ci_low", "ci_high"):
+            fitted[column] = fitted[column] * scale
+        with np.errstate(invalid="ignore", divide="ignore"):
+            fitted["relative_slope_percent"] = fitted["slope"] / (fitted["mean"] * scale) * 100
+        fitted["rapid"] = _rapid(parameter, fitted)
+        fitted.insert(0, "parameter", parameter)
+        fitted.insert(0, patient_column, patients)
+        results.append(fitted)
+
+    if not results:
+        return pd.DataFrame()
+    return pd.concat(results, ignore_index=True)
+
+
+def _rapid(parameter: str, fitted: pd.DataFrame) -> np.ndarray:
+    followed = (fitted["n_tests"] >= 2) & (fitted["span_years"] >= MIN_FOLLOW_UP_YEARS)
+    if parameter == "fev1":
+        declining = fitted["slope"] < -ACCELERATED_FEV1_DECLINE_ML
+    elif parameter == "fvc":
+        declining = fitted["relative_slope_percent"] <= -RAPID_FVC_DECLINE_PERCENT
+    else:
+        declining = fitted["relative_slope_percent"] <= -RAPID_DLCO_DECLINE_PERCENT
+    return (followed & declining.fillna(False)).to_numpy(dtype=bool)
+
+
+def _unit(parameter: str) -> str:
+    return "mL/year" if parameter in VOLUME_PARAMETERS else "mL/min/mmHg/year"
+
+
+def assess_decline(
+    current_data: Dict[str, Any],
+    historical_data: List[Dict[str, Any]],
+    test_date: Any = None
+) -> Dict[str, Any]:
+    """
+    Rapid decline assessment for one patient's current and historical tests.
+
+    Returns:
+        Dict with rapid_decline, decline_rate, parameters_affected,
+        urgency_upgrade, recommended_actions and per-parameter slopes
+    """
+    current_date = _to_datetime(test_date or current_data.get("test_date")) or datetime.now()
+    rows = [{"patient_id": 0, "test_date": _to_datetime(h.get("test_date")), **{p: h.get(p) for p in DECLINE_PARAMETERS}}
+            for h in historical_data]
+    rows.append({"patient_id": 0, "test_date": current_date, **{p: current_data.get(p) for p in DECLINE_PARAMETERS}})
+    frame = pd.DataFrame(rows)
+    frame = frame[frame["test_date"].notna()]
+    slopes = decline_frame(frame)
+
+    parameters = {}
+    for row in slopes.itertuples(index=False):
+        if row.n_tests < 2 or np.isnan(row.slope):
+            continue
+        parameters[row.parameter] = {
+            "slope": round(float(row.slope), 1),
+            "ci_low": None if np.isnan(row.ci_low) else round(float(row.ci_low), 1),
+            "ci_high": None if np.isnan(row.ci_high) else round(float(row.ci_high), 1),
+            "unit": _unit(row.parameter),
+            "relative_slope_percent": None if np.isnan(row.relative_slope_percent) else round(float(row.relative_slope_percent), 1),
+            "n_tests": int(row.n_tests),
+            "span_years": round(float(row.span_years), 2),
+            "rapid": bool(row.rapid)
+        }
+
+    if not parameters:
+        return {"rapid_decline": False, "assessment": "Not enough dated tests to estimate decline", "parameters": {}}
+
+    affected = [p for p, fit in parameters.items() if fit["rapid"]]
+    fev1 = parameters.get("fev1")
+    rate = next(iter(parameters.values())) if fev1 is None else fev1
+    rate_name = "fev1" if fev1 is not None else next(iter(parameters))
+    decline_rate = f"{rate_name.upper()} {rate['slope']:+.0f} {rate['unit']}"
+    if rate["ci_low"] is not None:
+        decline_rate += f" (95% CI {rate['ci_low']:+.0f} to {rate['ci_high']:+.0f})"
+
+    actions = []
+    if "fev1" in affected:
+        actions.append("Review smoking status and exposures; consider pulmonology referral for accelerated FEV1 decline")
+    if "fvc" in affected or "dlco" in affected:
+        actions.append("Evaluate for progressive interstitial or pulmonary vascular disease")
+    if affected:
+        actions.append("Repeat spirometry in 3-6 months to confirm the trend")
+
+    return {
+        "rapid_decline": bool(affected),
+        "decline_rate": decline_rate,
+        "parameters_affected": affected,
+        "parameters": parameters,
+        "urgency_upgrade": bool(affected),
+        "recommended_actions": actions or ["Continue routine monitoring"],
+        "clinical_significance": (
+            f"Rapid decline in {', '.join(p.upper() for p in affected)}" if affected
+            else "No accelerated decline detected"
+        )
+    }
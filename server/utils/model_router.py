@@ -0,0 +1,267 @@
+"""
+Model routing for AutoPFTReport System.
+
+Each agent call names its task ("interpretation", "terminology", ...) and
+is sent to the small or large model configured for it in MODEL_ROUTES.
+Complexity signals promote a small route to the large model up front:
+
+- rule_confidence: how clear-cut the rule engine finds the study
+  (below MIN_INTERPRETATION_CONFIDENCE)
+- file_type: formats whose extracted text is hard to read (ROUTING_LARGE_FILE_TYPES)
+- input_chars: long free-text questions (ROUTING_LONG_INPUT_CHARS)
+
+A small-model answer that cannot be parsed, or whose own confidence is
+below ROUTING_MIN_CONFIDENCE, is retried once on the large model. Calls
+go through utils/resilience.py (retries, circuit breaker, hedging) within
+the agent's step timeout, or by the enclosing workflow step's deadline
+when that comes first (see ModelRouter.step_deadline()).
+
+Every call records latency, tokens, cost, escalations and parse failures
+per route in the ``pft:routing:stats`` hash. The routes used for a report
+are stored in its processing metadata, so physician feedback accuracy can
+be broken down by route as well.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from agents import Agent, Runner, OpenAIChatCompletionsModel
+
+from config import settings, AGENT_TIMEOUTS, MODEL_ROUTES, MODEL_PRICING, timeout_key
+from utils.openai import get_client
+from utils.redis import get_redis
+from utils.resilience import resilience
+
+logger = logging.getLogger(__name__)
+
+ROUTING_STATS_KEY = "pft:routing:stats"
+ROUTE_METRICS = ("calls", "escalations", "parse_failures", "errors",
+                 "latency_ms", "input_tokens", "output_tokens", "cost_usd")
+
+# Routes taken while processing the current request, set by ModelRouter.recording()
+_request_routes: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "request_routes", default=None
+)
+# time.monotonic() by which agent calls must finish, set by ModelRouter.step_deadline()
+_step_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "step_deadline", default=None
+)
+
+
+def parse_json_output(raw_output: str) -> Any:
+    """Parse an agent's JSON answer, ignoring a markdown code fence around it."""
+    raw_output = raw_output.strip()
+    if raw_output.startswith("```") and raw_output.endswith("```"):
+        raw_output = re.sub(r"^```[a-zA-Z]*\n", "", raw_output)
+        raw_output = re.sub(r"\n```$", "", raw_output)
+    return json.loads(raw_output)
+
+
+def answer_confidence(parsed: Any) -> Optional[float]:
+    """Self-reported confidence of a parsed answer, if it has one."""
+    if not isinstance(parsed, dict):
+        return None
+    value = parsed.get("confidence", parsed.get("confidence_score"))
+    return float(value) if isinstance(value, (int, float)) else None
+
+
+def call_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = MODEL_PRICING.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+class ModelRouter:
+    """Chooses a model per agent task, escalates weak answers and records per-route metrics."""
+
+    def __init__(self):
+        self.redis_client = get_redis()
+        self._agents: Dict[Tuple[str, str], Agent] = {}
+
+    def choose(self, agent_name: str, task: str, signals: Optional[Dict[str, Any]] = None) -> str:
+        """Tier ("small" or "large") for a task given its complexity signals."""
+        tier = MODEL_ROUTES.get(agent_name, {}).get(task, "large")
+        if tier == "large" or not signals:
+            return tier
+        rule_confidence = signals.get("rule_confidence")
+        if rule_confidence is not None and rule_confidence < settings.MIN_INTERPRETATION_CONFIDENCE:
+            return "large"
+        if str(signals.get("file_type", "")).lower() in settings.ROUTING_LARGE_FILE_TYPES:
+            return "large"
+        if signals.get("input_chars", 0) > settings.ROUTING_LONG_INPUT_CHARS:
+            return "large"
+        return tier
+
+    def model_for(self, tier: str) -> str:
+        return settings.MODEL_SMALL if tier == "small" else settings.MODEL_LARGE
+
+    def agent_for(self, agent: Agent, task: str, signals: Optional[Dict[str, Any]] = None) -> Tuple[Agent, str]:
+        """The agent bound to the routed model (and the task's timeout), and that model's name."""
+        if not settings.MODEL_ROUTING_ENABLED:
+            return self._bind(agent, settings.OPENAI_MODEL, task)
+        return self._bind(agent, self.model_for(self.choose(agent.name, task, signals)), task)
+
+    def _bind(self, agent: Agent, model: str, task: Optional[str] = None) -> Tuple[Agent, str]:
+        client_key = timeout_key(agent.name, task)
+        key = (client_key, model)
+        if key not in self._agents:
+            self._agents[key] = agent.clone(
+                model=OpenAIChatCompletionsModel(model=model, openai_client=get_client(client_key))
+            )
+        return self._agents[key], model
+
+    async def run(
+        self,
+        agent: Agent,
+        task: str,
+        prompt: str,
+        signals: Optional[Dict[str, Any]] = None,
+        expect_json: bool = False
+    ):
+        """
+        Run ``prompt`` on the routed model, escalating to the large model when needed.
+
+        Args:
+            agent: The agent whose instructions to use
+            task: Task name, as listed in MODEL_ROUTES for the agent
+            signals: Complexity signals (rule_confidence, file_type, input_chars)
+            expect_json: Whether the answer must parse as JSON; unparseable
+                small-model answers are retried on the large model
+
+        Returns:
+            The run result of the final attempt (``final_output`` as usual)
+        """
+        # Retries and escalation share the step's time budget, leaving room for the fallback path
+        budget = (AGENT_TIMEOUTS.get(timeout_key(agent.name, task), settings.AGENT_TIMEOUT)
+                  - settings.RESILIENCE_FALLBACK_MARGIN)
+        deadline = time.monotonic() + budget
+        step_deadline = _step_deadline.get()
+        if step_deadline is not None:
+            # Earlier work in the step (extraction, other calls) has used part of its timeout
+            deadline = min(deadline, step_deadline)
+        routed, model = self.agent_for(agent, task, signals)
+        result, parsed_ok, confident = await self._attempt(
+            routed, agent.name, task, model, prompt, expect_json, deadline
+        )
+        if settings.MODEL_ROUTING_ENABLED and model != settings.MODEL_LARGE and not (parsed_ok and confident):
+            logger.info(f"Escalating {agent.name}.{task} from {model} to {settings.MODEL_LARGE}")
+            await self._record(agent.name, task, model, {"escalations": 1})
+            routed, model = self._bind(agent, settings.MODEL_LARGE, task)
+            try:
+                result, *_ = await self._attempt(
+                    routed, agent.name, task, model, prompt, expect_json, deadline, escalated=True
+                )
+            except Exception as e:
+                # Keep the small model's answer; the caller decides whether it is usable
+                logger.warning(f"Escalation of {agent.name}.{task} failed: {e!r}")
+        return result
+
+    async def _attempt(self, agent: Agent, agent_name: str, task: str, model: str, prompt: str,
+                       expect_json: bool, deadline: float, escalated: bool = False):
+        start = time.perf_counter()
+        try:
+            result = await resilience.call(model, lambda: Runner.run(agent, prompt), deadline)
+        except Exception:
+            await self._record(agent_name, task, model, {"calls": 1, "errors": 1})
+            raise
+        parsed_ok, confident = True, True
+        if expect_json:
+            try:
+                confidence = answer_confidence(parse_json_output(result.final_output))
+                confident = confidence is None or confidence >= settings.ROUTING_MIN_CONFIDENCE
+            except (ValueError, TypeError):
+                parsed_ok = False
+        self.track(agent_name, task, model, escalated)
+        await self.record_result(agent_name, task, model, result, time.perf_counter() - start,
+                                 parse_failures=0 if parsed_ok else 1)
+        return result, parsed_ok, confident
+
+    async def record_result(self, agent_name: str, task: str, model: str, result, elapsed: float,
+                            parse_failures: int = 0):
+        """Record one completed call (also used for streamed answers)."""
+        usage = result.context_wrapper.usage
+        await self._record(agent_name, task, model, {
+            "calls": 1,
+            "parse_failures": parse_failures,
+            "latency_ms": round(elapsed * 1000, 1),
+            "input_tokens": usage.input_tokens,
+            "output_tokens": usage.output_tokens,
+            "cost_usd": call_cost(model, usage.input_tokens, usage.output_tokens)
+        })
+
+    async def _record(self, agent_name: str, task: str, model: str, values: Dict[str, Any]):
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for metric, value in values.items():
+                    field = f"{agent_name}:{task}:{model}:{metric}"
+                    if isinstance(value, float):
+                        pipe.hincrbyfloat(ROUTING_STATS_KEY, field, value)
+                    elif value:
+                        pipe.hincrby(ROUTING_STATS_KEY, field, value)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not record routing metrics for {agent_name}.{task}: {e}")
+
+    def track(self, agent_name: str, task: str, model: str, escalated: bool = False):
+        """Note the route taken in the current request's record, if one is open."""
+        routes = _request_routes.get()
+        if routes is not None:
+            routes[f"{agent_name}.{task}"] = {"model": model, "escalated": escalated}
+
+    @contextmanager
+    def recording(self):
+        """Collect the routes taken by agent calls made inside the block (e.g. one workflow)."""
+        routes: Dict[str, Any] = {}
+        token = _request_routes.set(routes)
+        try:
+            yield routes
+        finally:
+            _request_routes.reset(token)
+
+    @contextmanager
+    def step_deadline(self, timeout: float):
+        """Bound agent calls made inside the block by a step's ``timeout``, less the fallback margin."""
+        token = _step_deadline.set(time.monotonic() + timeout - settings.RESILIENCE_FALLBACK_MARGIN)
+        try:
+            yield
+        finally:
+            _step_deadline.reset(token)
+
+    def recorded(self, function):
+        """Decorator: record the routes taken during each call of an async function."""
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with self.recording():
+                return await function(*args, **kwargs)
+        return wrapper
+
+    def current_routes(self) -> Dict[str, Any]:
+        """Routes recorded so far in the enclosing recording() block."""
+        return dict(_request_routes.get() or {})
+
+    async def stats(self) -> Dict[str, Any]:
+        """Totals and averages per route ("Agent.task" -> model -> metrics)."""
+        raw = await self.redis_client.hgetall(ROUTING_STATS_KEY)
+        routes: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for field, value in raw.items():
+            agent_name, task, rest = field.split(":", 2)
+            model, metric = rest.rsplit(":", 1)
+            value = float(value) if metric in ("latency_ms", "cost_usd") else int(value)
+            routes.setdefault(f"{agent_name}.{task}", {}).setdefault(model, {})[metric] = value
+        for models in routes.values():
+            for metrics in models.values():
+                calls = metrics.get("calls", 0)
+                for metric in ROUTE_METRICS[1:]:
+                    metrics.setdefault(metric, 0)
+                metrics["avg_latency_ms"] = round(metrics["latency_ms"] / calls, 1) if calls else None
+                metrics["avg_cost_usd"] = round(metrics["cost_usd"] / calls, 6) if calls else None
+                metrics["escalation_rate"] = round(metrics["escalations"] / calls, 3) if calls else None
+        return routes
+
+
+model_router = ModelRouter()
@@ -1,19 +1,184 @@
-from openai import AsyncOpenAI
+"""
+LLM gateway client for AutoPFTReport System.
+
+All agents share one HTTP connection pool to the LiteLLM gateway, with
+explicit pool limits, keep-alive and HTTP/2 (when the ``h2`` package is
+installed), so calls reuse warm connections instead of paying a TCP/TLS
+handshake each time. Each agent gets a view of the shared client with its
+own timeout, aligned with the orchestrator's step timeouts
+(``AGENT_TIMEOUTS``).
+
+Connections are opened at startup by ``warm_up()``. ``pool_stats()``
+reports pool saturation and the connection reuse rate.
+"""
+
+import asyncio
+import importlib.util
+import logging
+from typing import Any, Dict, Optional
+
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+# openai >= 3 is built on the httpx2 fork; the transport must come from the same package
+try:
+    import httpx2 as httpx
+except ImportError:
+    import httpx
 
 from agents import (
     set_default_openai_api,
     set_default_openai_client,
     set_tracing_disabled,
 )
-from config import settings
+from config import settings, AGENT_TIMEOUTS
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    """Request, new-connection and concurrency counters for the gateway pool."""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated_requests = 0  # requests started with every pooled connection busy
+
+    async def trace(self, event_name: str, info: Dict[str, Any]):
+        # httpcore reports a TCP connect only when the pool has no reusable connection
+        if event_name == "connection.connect_tcp.started":
+            self.new_connections += 1
+
+
+class MeteredTransport(httpx.AsyncHTTPTransport):
+    """Transport that counts requests, concurrency and new connections."""
+
+    def __init__(self, metrics: PoolMetrics, max_connections: int, http2: bool = False, **kwargs):
+        super().__init__(http2=http2, **kwargs)
+        self.metrics = metrics
+        self.max_connections = max_connections
+        self.http2 = http2
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        metrics = self.metrics
+        metrics.requests += 1
+        # HTTP/2 multiplexes requests over a connection, so only HTTP/1.1 requests queue for one
+        if not self.http2 and metrics.in_flight >= self.max_connections:
+            metrics.saturated_requests += 1
+        metrics.in_flight += 1
+        metrics.peak_in_flight = max(metrics.peak_in_flight, metrics.in_flight)
+        request.extensions["trace"] = metrics.trace
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            metrics.in_flight -= 1
+
+    def connections(self) -> Dict[str, int]:
+        connections = self._pool.connections
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"open": len(connections), "idle": idle, "active": len(connections) - idle}
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def create_transport(metrics: PoolMetrics) -> MeteredTransport:
+    """Connection pool with the configured limits, keep-alive and HTTP version."""
+    http2 = settings.LLM_HTTP2 and http2_available()
+    if settings.LLM_HTTP2 and not http2:
+        logger.warning("LLM_HTTP2 is enabled but the h2 package is not installed; using HTTP/1.1")
+    limits = httpx.Limits(
+        max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+    )
+    return MeteredTransport(metrics, settings.LLM_POOL_MAX_CONNECTIONS, http2=http2, limits=limits)
+
+
+def create_http_client(transport: MeteredTransport) -> httpx.AsyncClient:
+    """Keep-alive HTTP client for the LLM gateway over a pooled ``transport``."""
+    return DefaultAsyncHttpxClient(
+        transport=transport,
+        timeout=httpx.Timeout(settings.AGENT_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT)
+    )
+
+
+pool_metrics = PoolMetrics()
+transport = create_transport(pool_metrics)
+http_client = create_http_client(transport)
+
+# Retries are handled per call by utils/resilience.py, not by the SDK
 client = AsyncOpenAI(
         base_url=settings.LITELLM_API_BASE,
-        api_key=settings.LITELLM_KEY)
+        api_key=settings.LITELLM_KEY,
+        http_client=http_client,
+        max_retries=0)
+
+# Views of the shared client (same connection pool) with per-agent timeouts
+_agent_clients: Dict[str, AsyncOpenAI] = {}
+_warm_up_task: Optional[asyncio.Task] = None
 
 
 set_default_openai_client(client=client, use_for_tracing=False)
 set_default_openai_api("chat_completions")
 set_tracing_disabled(disabled=True)
 
-def get_client():
-    return client
+def get_client(agent_name: Optional[str] = None) -> AsyncOpenAI:
+    """The gateway client, with the timeout of ``agent_name`` (an AGENT_TIMEOUTS key) when given."""
+    if agent_name is None:
+        return client
+    if agent_name not in _agent_clients:
+        timeout = httpx.Timeout(AGENT_TIMEOUTS.get(agent_name, settings.AGENT_TIMEOUT),
+                                connect=settings.LLM_CONNECT_TIMEOUT)
+        _agent_clients[agent_name] = client.with_options(timeout=timeout)
+    return _agent_clients[agent_name]
+
+
+async def warm_up():
+    """Open gateway connections before the first request needs them."""
+    if settings.LLM_WARMUP_CONNECTIONS <= 0:
+        return
+    # One HTTP/2 connection multiplexes every request
+    count = 1 if transport.http2 else settings.LLM_WARMUP_CONNECTIONS
+    results = await asyncio.gather(
+        *(asyncio.wait_for(client.models.list(), settings.LLM_CONNECT_TIMEOUT * 2) for _ in range(count)),
+        return_exceptions=True
+    )
+    failures = [result for result in results if isinstance(result, BaseException)]
+    if failures:
+        logger.warning(f"LLM gateway warm-up: {len(failures)}/{count} connections failed ({failures[0]!r})")
+    else:
+        logger.info(f"LLM gateway warm-up opened {count} connection(s)")
+
+
+def start_warm_up():
+    """Warm up in the background so startup does not wait on the gateway."""
+    global _warm_up_task
+    _warm_up_task = asyncio.create_task(warm_up())
+
+
+async def close():
+    if _warm_up_task is not None:
+        _warm_up_task.cancel()
+        await asyncio.gather(_warm_up_task, return_exceptions=True)
+    await client.close()
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Pool saturation and connection reuse for /health."""
+    metrics = pool_metrics
+    reused = metrics.requests - metrics.new_connections
+    return {
+        "http2": transport.http2,
+        "max_connections": settings.LLM_POOL_MAX_CONNECTIONS,
+        "connections": transport.connections(),
+        "requests": metrics.requests,
+        "new_connections": metrics.new_connections,
+        "reuse_rate": round(reused / metrics.requests, 3) if metrics.requests else None,
+        "in_flight": metrics.in_flight,
+        "peak_in_flight": metrics.peak_in_flight,
+        "saturation": round(metrics.in_flight / settings.LLM_POOL_MAX_CONNECTIONS, 3),
+        "saturated_requests": metrics.saturated_requests
+    }
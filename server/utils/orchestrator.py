@@ -18,10 +18,13 @@ from agent.triage_specialist import TriageSpecialistAgent
 from agent.medical_chatbot import MedicalChatbotAgent
 from agent.learning_assistant import LearningAssistantAgent
 
-# Redis pub/sub for progress updates
-import redis.asyncio as aioredis
-from config import settings
-redis_client = aioredis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+from config import settings, AGENT_TIMEOUTS
+# Pipelined Redis pub/sub + persistence for progress updates
+from utils.progress import ProgressWriter
+from utils.worklist import worklist
+from utils.report_digest import digest_key, digest_fields
+from utils.model_router import model_router
+from utils.checkpoints import checkpoints
 import json
 
 
@@ -110,7 +113,7 @@ class PFTWorkflowOrchestrator:
                 "description": "Extracting and standardizing PFT data",
                 "agent": self.data_specialist,
                 "method": "process_file",
-                "timeout": 60  # seconds
+                "timeout": AGENT_TIMEOUTS["DataSpecialist"]  # seconds
             },
             {
                 "stage": ProcessingStage.INTERPRETATION,
@@ -118,7 +121,7 @@ class PFTWorkflowOrchestrator:
                 "description": "Analyzing PFT results",
                 "agent": self.interpreter,
                 "method": "interpret_pft_results",
-                "timeout": 90
+                "timeout": AGENT_TIMEOUTS["Interpreter"]
             },
             {
                 "stage": ProcessingStage.TRIAGE_ASSESSMENT,
@@ -126,7 +129,7 @@ class PFTWorkflowOrchestrator:
                 "description": "Assessing clinical priority",
                 "agent": self.triage_specialist,
                 "method": "assess_triage_priority",
-                "timeout": 60
+                "timeout": AGENT_TIMEOUTS["TriageSpecialist"]
             },
             {
                 "stage": ProcessingStage.REPORT_GENERATION,
@@ -134,7 +137,7 @@ class PFTWorkflowOrchestrator:
                 "description": "Generating professional report",
                 "agent": self.report_writer,
                 "method": "generate_full_report",
-                "timeout": 120
+                "timeout": AGENT_TIMEOUTS["ReportWriter"]
             },
             {
                 "stage": ProcessingStage.QUALITY_VALIDATION,
@@ -142,37 +145,41 @@ class PFTWorkflowOrchestrator:
                 "description": "Validating report quality",
                 "agent": self.report_writer,
                 "method": "validate_report_quality",
-                "timeout": 30
+                "timeout": AGENT_TIMEOUTS["ReportWriter.quality_validation"]
             }
         ]
     
+    @model_router.recorded
     async def process_pft_request(
         self,
         request_id: str,
-        file_content: str,
+        file_content: Optional[str],
         file_type: str,
         patient_demographics: Dict[str, Any],
         historical_data: List[Dict[str, Any]] = None,
         priority: str = "routine",
-        progress_callback: Optional[Callable] = None
+        progress_callback: Optional[Callable] = None,
+        file_path: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Process a complete PFT request through the multi-agent workflow.
         
         Args:
             request_id: Unique identifier for the request
-            file_content: Raw PFT file content
+            file_content: Raw PFT file content (None when file_path is given)
             file_type: Type of PFT file
             patient_demographics: Patient demographic information
             historical_data: Historical PFT data
             priority: Processing priority
             progress_callback: Optional callback for progress updates
+            file_path: Path of the stored PFT file, read only when extraction starts
             
         Returns:
             Complete processing results
         """
         
         status = WorkflowStatus(request_id)
+        progress = ProgressWriter(request_id)
         
         self.logger.info(f"Orchestrator starting workflow for request_id={request_id}")
         try:
@@ -180,6 +187,7 @@ class PFTWorkflowOrchestrator:
             workflow_data = {
                 "request_id": request_id,
                 "file_content": file_content,
+                "file_path": file_path,
                 "file_type": file_type,
                 "patient_demographics": patient_demographics,
                 "historical_data": historical_data or [],
@@ -190,9 +198,24 @@ class PFTWorkflowOrchestrator:
                 "report_data": {},
                 "quality_assessment": {}
             }
+            # Stages completed by an earlier run of this request are not run again
+            completed_stages = await checkpoints.begin(request_id, {
+                "file_content": file_content if file_path is None else None,
+                "file_path": file_path,
+                "file_type": file_type,
+                "patient_demographics": patient_demographics,
+                "historical_data": historical_data or [],
+                "priority": priority
+            })
             
             # Execute workflow steps
             for step in self.workflow_steps:
+                if step["stage"].value in completed_stages:
+                    result = completed_stages[step["stage"].value]
+                    status.stage_results[step["stage"].value] = result
+                    workflow_data = self._update_workflow_data(step["stage"], result, workflow_data)
+                    self.logger.info(f"Restored step {step['stage'].value} for request {request_id} from checkpoint")
+                    continue
                 try:
                     # Update status
                     status.update_stage(
@@ -200,29 +223,23 @@ class PFTWorkflowOrchestrator:
                         step["progress"],
                         step["description"]
                     )
-                    # Publish real-time progress
-                    await redis_client.publish(
-                        f"pft:progress:{request_id}",
-                        json.dumps(status.to_dict())
-                    )
-                    # Persist updated status to Redis for HTTP polling
-                    await redis_client.set(
-                        f"pft:processing:{request_id}",
-                        json.dumps(status.to_dict())
-                    )
+                    # Publish real-time progress and persist it for HTTP polling
+                    await progress.write(status.to_dict())
                     
                     # Call progress callback if provided
                     if progress_callback:
                         await progress_callback(status.to_dict())
                     
-                    # Execute step with timeout
-                    result = await asyncio.wait_for(
-                        self._execute_workflow_step(step, workflow_data),
-                        timeout=step["timeout"]
-                    )
+                    # Execute step with timeout; its agent calls share what is left of it
+                    with model_router.step_deadline(step["timeout"]):
+                        result = await asyncio.wait_for(
+                            self._execute_workflow_step(step, workflow_data),
+                            timeout=step["timeout"]
+                        )
                     
-                    # Store step result
+                    # Store step result, and checkpoint it so a retry can resume after this step
                     status.stage_results[step["stage"].value] = result
+                    await checkpoints.save(request_id, step["stage"].value, result)
                     
                     # Update workflow data based on step
                     workflow_data = self._update_workflow_data(step["stage"], result, workflow_data)
@@ -233,47 +250,46 @@ class PFTWorkflowOrchestrator:
                     error_msg = f"Timeout in step {step['stage'].value}"
                     self.logger.error(f"{error_msg} for request {request_id}")
                     status.set_error(error_msg)
-                    # Persist error status
-                    await redis_client.set(
-                        f"pft:processing:{request_id}",
-                        json.dumps(status.to_dict())
-                    )
+                    # Publish and persist error status
+                    await progress.write(status.to_dict(), force=True)
+                    await checkpoints.fail(request_id, error_msg)
                     return self._create_error_response(request_id, error_msg, status)
                     
                 except Exception as e:
                     error_msg = f"Error in step {step['stage'].value}: {str(e)}"
                     self.logger.error(f"{error_msg} for request {request_id}")
                     status.set_error(error_msg)
-                    # Persist error status
-                    await redis_client.set(
-                        f"pft:processing:{request_id}",
-                        json.dumps(status.to_dict())
-                    )
+                    # Publish and persist error status
+                    await progress.write(status.to_dict(), force=True)
+                    await checkpoints.fail(request_id, error_msg)
                     return self._create_error_response(request_id, error_msg, status)
             
             # Mark as completed
             status.update_stage(ProcessingStage.COMPLETED, 100, "Processing completed successfully")
-            # Publish and persist final status
-            await redis_client.publish(
-                f"pft:progress:{request_id}",
-                json.dumps(status.to_dict())
-            )
-            await redis_client.set(
-                f"pft:processing:{request_id}",
-                json.dumps(status.to_dict())
+            
+            # Create final result
+            final_result = self._create_final_result(request_id, workflow_data, status)
+            # Persist the generated report (and its chat digest) and publish the final status
+            # in one round-trip; the report is written first so clients never see "completed" without it
+            report = final_result.get("report", {})
+            await progress.write(
+                status.to_dict(),
+                force=True,
+                extra={
+                    f"pft:report:{request_id}": json.dumps(report),
+                    digest_key(request_id): digest_fields(report)
+                }
             )
+            await checkpoints.complete(request_id)
+            
+            try:
+                await worklist.record(request_id, workflow_data["triage_assessment"] or {})
+            except Exception as e:
+                self.logger.warning(f"Could not update triage worklist for request {request_id}: {e}")
             
             # Call final progress callback
             if progress_callback:
                 await progress_callback(status.to_dict())
-            
-            # Create final result
-            final_result = self._create_final_result(request_id, workflow_data, status)
-            # Persist the generated report for HTTP retrieval
-            await redis_client.set(
-                f"pft:report:{request_id}",
-                json.dumps(final_result.get("report", {}))
-            )
             self.logger.info(f"Successfully completed processing for request {request_id}")
             return final_result
             
@@ -281,13 +297,49 @@ class PFTWorkflowOrchestrator:
             error_msg = f"Unexpected error in workflow: {str(e)}"
             self.logger.error(f"{error_msg} for request {request_id}")
             status.set_error(error_msg)
-            # Persist error status
-            await redis_client.set(
-                f"pft:processing:{request_id}",
-                json.dumps(status.to_dict())
-            )
+            # Publish and persist error status
+            await progress.write(status.to_dict(), force=True)
+            await checkpoints.fail(request_id, error_msg)
             return self._create_error_response(request_id, error_msg, status)
     
+    async def resume_pft_request(self, request_id: str, automatic: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Run a failed or interrupted request again, from its last checkpointed stage.
+        
+        Args:
+            request_id: Request whose checkpoints to resume from
+            automatic: Resumed by a worker rather than requested; gives up (marking
+                the request failed) after CHECKPOINT_MAX_ATTEMPTS runs
+            
+        Returns:
+            Processing results as from process_pft_request, or None if the
+            request has no checkpoints (completed or expired)
+        """
+        checkpoint = await checkpoints.load(request_id)
+        if checkpoint is None:
+            await checkpoints.complete(request_id)
+            return None
+        if automatic and checkpoint["attempts"] >= settings.CHECKPOINT_MAX_ATTEMPTS:
+            error_msg = f"Processing interrupted {checkpoint['attempts']} times"
+            self.logger.error(f"{error_msg} for request {request_id}; not resuming automatically")
+            status = WorkflowStatus(request_id)
+            status.set_error(error_msg)
+            await ProgressWriter(request_id).write(status.to_dict(), force=True)
+            await checkpoints.fail(request_id, error_msg)
+            return self._create_error_response(request_id, error_msg, status)
+        
+        self.logger.info(f"Resuming request {request_id} after {len(checkpoint['stages'])} completed stage(s)")
+        job = checkpoint["job"]
+        return await self.process_pft_request(
+            request_id,
+            job.get("file_content"),
+            job["file_type"],
+            job["patient_demographics"],
+            job.get("historical_data"),
+            job.get("priority", "routine"),
+            file_path=job.get("file_path")
+        )
+    
     async def _execute_workflow_step(
         self,
         step: Dict[str, Any],
@@ -303,7 +355,8 @@ class PFTWorkflowOrchestrator:
         if stage == ProcessingStage.DATA_EXTRACTION:
             result = await agent.process_file(
                 file_content=workflow_data["file_content"],
-                file_type=workflow_data["file_type"]
+                file_type=workflow_data["file_type"],
+                file_path=workflow_data["file_path"]
             )
             
         elif stage == ProcessingStage.INTERPRETATION:
@@ -325,6 +378,12 @@ class PFTWorkflowOrchestrator:
                 percent_predicted=workflow_data["extracted_data"].get("percent_predicted", {}),
                 historical_data=workflow_data["historical_data"]
             )
+            if workflow_data["historical_data"] and isinstance(result, dict):
+                # Deterministic trend (regression slopes), no extra LLM call
+                result["longitudinal"] = await agent.assess_rapid_decline(
+                    workflow_data["extracted_data"].get("raw_data", {}),
+                    workflow_data["historical_data"]
+                )
             
         elif stage == ProcessingStage.REPORT_GENERATION:
             method = getattr(agent, method_name)
@@ -402,7 +461,8 @@ class PFTWorkflowOrchestrator:
                 "processing_metadata": {
                     "workflow_version": "1.0",
                     "agents_used": [step["stage"].value for step in self.workflow_steps],
-                    "processing_time": status.processing_time
+                    "processing_time": status.processing_time,
+                    "model_routes": model_router.current_routes()
                 }
             },
             "workflow_status": status.to_dict()
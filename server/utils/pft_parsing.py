@@ -0,0 +1,421 @@
+"""
+Deterministic PFT parsing helpers for AutoPFTReport System.
+
+Shared by the structured extractors (spreadsheets, CSV) and the regex fallback
+of DataSpecialistAgent: parameter label matching, trial selection, the
+single-pass text scanner, and the standard extraction result shape.
+"""
+
+import csv
+import io
+import re
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+# Key parameters, in the order used for completeness scoring
+PARAMETERS = ["fvc", "fev1", "fev1_fvc_ratio", "pef", "fef25_75", "tlc", "rv", "dlco"]
+
+# Parameters that have predicted / percent predicted values in the result
+PREDICTED_PARAMETERS = ["fvc", "fev1", "tlc", "dlco"]
+
+# Normalised label -> parameter
+PARAMETER_ALIASES = {
+    "fvc": "fvc",
+    "fev1": "fev1",
+    "fev1/fvc": "fev1_fvc_ratio",
+    "fev1fvc": "fev1_fvc_ratio",
+    "fev1%fvc": "fev1_fvc_ratio",
+    "fev1/fvc%": "fev1_fvc_ratio",
+    "fev1/fvcratio": "fev1_fvc_ratio",
+    "pef": "pef",
+    "pefr": "pef",
+    "fef2575": "fef25_75",
+    "fef2575%": "fef25_75",
+    "mmef": "fef25_75",
+    "tlc": "tlc",
+    "rv": "rv",
+    "dlco": "dlco",
+    "tlco": "dlco"
+}
+
+# Column kinds recognised by header keywords (checked in order)
+COLUMN_KEYWORDS = [
+    ("percent", ("%pred", "%predicted", "pctpred", "percentpred", "%ref", "pp")),
+    ("post", ("postbd", "post", "postbronchodilator")),
+    ("predicted", ("predicted", "pred", "ref", "reference")),
+    ("lln", ("lln",)),
+    ("value", ("prebd", "pre", "measured", "actual", "best", "result", "value", "observed", "meas"))
+]
+
+_UNITS_RE = re.compile(r"\(.*?\)|\[.*?\]")
+_SEPARATORS_RE = re.compile(r"[\s_\-\.:]+")
+_NUMBER_RE = re.compile(r"^[-+]?\d+(?:[.,]\d+)?")
+
+
+def normalize_label(label: Any) -> str:
+    """Lowercase a header/label and strip units in brackets and separators."""
+    text = _UNITS_RE.sub("", str(label or "")).lower()
+    return _SEPARATORS_RE.sub("", text)
+
+
+def match_parameter(label: Any) -> Optional[str]:
+    """Map a label such as "FEV1 (L)" or "FEF25-75%" to a parameter key."""
+    return PARAMETER_ALIASES.get(normalize_label(label))
+
+
+def classify_column(label: Any) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Classify a header cell as (parameter, kind).
+
+    "FEV1" -> ("fev1", "value"), "FEV1 %Pred" -> ("fev1", "percent"),
+    "Pred" -> (None, "predicted"), "Post-BD FVC" -> ("fvc", "post").
+    """
+    normalized = normalize_label(label)
+    if not normalized:
+        return None, None
+    if normalized in PARAMETER_ALIASES:
+        return PARAMETER_ALIASES[normalized], "value"
+
+    for kind, keywords in COLUMN_KEYWORDS:
+        for keyword in keywords:
+            if keyword in normalized:
+                rest = normalized.replace(keyword, "", 1)
+                if rest in PARAMETER_ALIASES:
+                    return PARAMETER_ALIASES[rest], kind
+                if not rest or rest in ("%", "value", "bd"):
+                    return None, kind
+    return None, None
+
+
+def to_float(value: Any) -> Optional[float]:
+    """Parse a cell value into a float ("3,2" and "3.2 L" included)."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER_RE.match(str(value).strip())
+    if not match:
+        return None
+    try:
+        return float(match.group(0).replace(",", "."))
+    except ValueError:
+        return None
+
+
+def normalize_ratio(value: Optional[float]) -> Optional[float]:
+    """FEV1/FVC is reported as a percentage; exports sometimes store it as a fraction."""
+    if value is not None and 0 < value <= 1.5:
+        return round(value * 100, 2)
+    return value
+
+
+def combine_trials(trials: List[Dict[str, float]]) -> Dict[str, float]:
+    """
+    Combine several manoeuvres/rows into one set of results.
+
+    Follows ATS/ERS practice: the largest FVC and largest FEV1 are reported
+    (even from different trials) and the ratio is recomputed from them; other
+    parameters come from the best trial (largest FVC + FEV1).
+    """
+    trials = [t for t in trials if t]
+    if not trials:
+        return {}
+    if len(trials) == 1:
+        combined = dict(trials[0])
+    else:
+        best = max(trials, key=lambda t: (t.get("fvc") or 0) + (t.get("fev1") or 0))
+        combined = dict(best)
+        for key in ("fvc", "fev1", "pef"):
+            values = [t[key] for t in trials if t.get(key) is not None]
+            if values:
+                combined[key] = max(values)
+        if combined.get("fvc") and combined.get("fev1"):
+            combined["fev1_fvc_ratio"] = round(combined["fev1"] / combined["fvc"] * 100, 2)
+
+    if "fev1_fvc_ratio" in combined:
+        combined["fev1_fvc_ratio"] = normalize_ratio(combined["fev1_fvc_ratio"])
+    return combined
+
+
+def build_extraction_result(
+    raw_data: Dict[str, float],
+    predicted_values: Optional[Dict[str, float]] = None,
+    percent_predicted: Optional[Dict[str, float]] = None,
+    data_quality_issues: Optional[List[str]] = None,
+    test_metadata: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Build the standard extraction result returned by DataSpecialistAgent."""
+    completeness = len([p for p in PARAMETERS if p in raw_data]) / len(PARAMETERS) * 100
+    missing = [p for p in PARAMETERS if p not in raw_data]
+    quality = 'excellent' if completeness >= 80 else 'good' if completeness >= 60 else 'fair' if completeness >= 40 else 'poor'
+    issues = list(data_quality_issues or [])
+    if completeness <= 50:
+        issues.append('low_data_completeness')
+    metadata = {
+        'test_date': None,
+        'technician': None,
+        'equipment': None,
+        'test_quality': None
+    }
+    metadata.update(test_metadata or {})
+    return {
+        'raw_data': raw_data,
+        'predicted_values': predicted_values or {},
+        'percent_predicted': percent_predicted or {},
+        'quality_metrics': {
+            'data_completeness': completeness,
+            'measurement_quality': quality,
+            'missing_parameters': missing,
+            'data_quality_issues': issues
+        },
+        'test_metadata': metadata
+    }
+
+
+# --- Single-pass text scanner -------------------------------------------------
+
+# Labels tried longest first so "FEV1/FVC" is never read as "FEV1". Ratios
+# such as RV/TLC are matched only so their values are not taken for TLC.
+_LABELS = (
+    r"FEV1\s*/\s*FVC|FEV1\s*%\s*FVC|RV\s*/\s*TLC|DLCO\s*/\s*VA|FEF\s*25\s*[-\u2013]?\s*75"
+    r"|FEV1|FVC|PEFR?|TLCO?|DLCO|RV|MMEF|KCO"
+)
+
+# Every alternative starts with one of these letters; the leading lookahead
+# lets the regex engine skip all other positions cheaply.
+_SCANNER_RE = re.compile(
+    r"(?=[dfkmprtDFKMPRT])(?:"
+    r"(?P<section>\b(?:pre|post)[\s\-]*(?:bd|bronchodilator|broncho-dilator)\b)"
+    r"|(?P<label>\b(?:" + _LABELS + r")\b%?)(?P<rest>[^\n]*)"
+    r"|(?P<header>\b(?:pred|predicted|ref|reference)\b)"
+    r")",
+    re.IGNORECASE
+)
+
+# A second label on the same line ends the current one's values
+_NEXT_LABEL_RE = re.compile(r"\b(?:" + _LABELS + r")\b", re.IGNORECASE)
+
+_VALUE_RE = re.compile(
+    r"(?P<number>[-+]?\d+(?:\.\d+)?)\s*"
+    r"(?P<unit>mL/min/mmHg|mmol/min/kPa|L/min|L/s|mL|L|%)?"
+    r"(?P<predicted>\s*(?:of\s+)?pred(?:icted)?)?",
+    re.IGNORECASE
+)
+
+_DIGIT_RE = re.compile(r"\d")
+
+_CELL_SPLIT_RE = re.compile(r"\s*[|,;\t]\s*|\s{2,}")
+
+_BRACKET_UNIT_RE = re.compile(r"^\W*\(\s*(mL|L|L/s|L/min)\s*\)", re.IGNORECASE)
+
+_VOLUME_PARAMETERS = ("fvc", "fev1", "tlc", "rv")
+
+# Parameters a bronchodilator section applies to; lung volumes and diffusion
+# sections that follow a "Post-bronchodilator" marker keep their plain keys
+_BRONCHODILATOR_PARAMETERS = ("fvc", "fev1", "fev1_fvc_ratio", "pef", "fef25_75")
+
+# Columns that identify a test session in multi-row exports
+_SESSION_COLUMNS = ("id", "patientid", "subject", "visit", "session", "date", "testdate", "visitdate")
+
+
+# Labels repeat across documents; cache their lookup
+_LABEL_PARAMETERS = lru_cache(maxsize=256)(match_parameter)
+
+
+@lru_cache(maxsize=128)
+def compile_pattern(pattern: str) -> "re.Pattern":
+    """Compile (once) a case-insensitive pattern passed around as a string."""
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _convert_units(parameter: str, value: float, unit: Optional[str]) -> float:
+    unit = (unit or "").lower()
+    if unit == "ml" and parameter in _VOLUME_PARAMETERS:
+        return round(value / 1000, 3)
+    if unit == "l/min" and parameter == "pef":
+        return round(value / 60, 2)
+    return value
+
+
+def _header_kinds(line: str) -> List[Optional[str]]:
+    """Column kinds of a table header line, label column excluded."""
+    cells = [c for c in _CELL_SPLIT_RE.split(line.strip()) if c]
+    return [classify_column(c)[1] for c in cells[1:]]
+
+
+def scan_pft_text(text: str) -> Dict[str, Any]:
+    """
+    Extract PFT measurements from free text in a single pass.
+
+    One compiled alternation walks the text once and recognises:
+    - table headers ("Parameter | Pre | Pred | %Pred | Post") that give the
+      meaning of the numbers on following rows,
+    - pre/post-bronchodilator section markers, which apply to spirometry
+      parameters only,
+    - parameter labels with their values, units ("mL", "L/min") and inline
+      percent predicted ("FVC: 3.2 L (76% predicted)").
+    The first value seen for a parameter wins.
+    """
+    raw_data: Dict[str, float] = {}
+    predicted: Dict[str, float] = {}
+    percent: Dict[str, float] = {}
+    columns: List[Optional[str]] = []
+    post_section = False
+
+    position = 0
+    while True:
+        match = _SCANNER_RE.search(text, position)
+        if match is None:
+            break
+        position = match.end()
+
+        if match.group("header") is not None:
+            # Header keyword: the whole line is a header if it holds no numbers
+            line_start = text.rfind("\n", 0, match.start()) + 1
+            line_end = text.find("\n", match.end())
+            line_end = len(text) if line_end == -1 else line_end
+            line = text[line_start:line_end]
+            if not _DIGIT_RE.search(line):
+                kinds = _header_kinds(line)
+                columns = kinds if ("value" in kinds or "post" in kinds) else []
+                position = line_end
+            continue
+        if match.group("section") is not None:
+            post_section = match.group("section")[:4].lower() == "post"
+            continue
+
+        parameter = _LABEL_PARAMETERS(match.group("label"))
+        rest = match.group("rest")
+        next_label = _NEXT_LABEL_RE.search(rest)
+        if next_label:
+            rest = rest[:next_label.start()]
+            position = match.start("rest") + next_label.start()
+        if parameter is None:
+            continue
+        bracket_unit = _BRACKET_UNIT_RE.match(rest)
+        default_unit = bracket_unit.group(1) if bracket_unit else None
+        if bracket_unit:
+            rest = rest[bracket_unit.end():]
+        post = post_section and parameter in _BRONCHODILATOR_PARAMETERS
+        value_key = f"post_bd_{parameter}" if post else parameter
+        percent_key = f"{value_key}_percent"
+
+        if columns and _CELL_SPLIT_RE.search(rest.strip()):
+            # Table row: numbers are positional under the header columns
+            cells = _CELL_SPLIT_RE.split(rest.strip())
+            if cells and cells[0] == "":
+                cells = cells[1:]
+            post_columns = False
+            for kind, cell in zip(columns, cells):
+                # "%Pred" after a "Post" column belongs to the post-bronchodilator value
+                post_columns = post_columns or kind == "post"
+                value = to_float(cell)
+                if value is None:
+                    continue
+                if kind == "value":
+                    raw_data.setdefault(value_key, _convert_units(parameter, value, default_unit))
+                elif kind == "post":
+                    raw_data.setdefault(f"post_bd_{parameter}", _convert_units(parameter, value, default_unit))
+                elif kind == "predicted":
+                    predicted.setdefault(parameter, _convert_units(parameter, value, default_unit))
+                elif kind == "percent":
+                    key = f"post_bd_{parameter}_percent" if post_columns else percent_key
+                    percent.setdefault(key, value)
+            continue
+
+        for value_match in _VALUE_RE.finditer(rest):
+            value = float(value_match.group("number"))
+            if value_match.group("predicted"):
+                percent.setdefault(percent_key, value)
+            elif value_key not in raw_data:
+                unit = value_match.group("unit") or default_unit
+                raw_data[value_key] = _convert_units(parameter, value, unit)
+
+    for key in ("fev1_fvc_ratio", "post_bd_fev1_fvc_ratio"):
+        if key in raw_data:
+            raw_data[key] = normalize_ratio(raw_data[key])
+    return {
+        "raw_data": raw_data,
+        "predicted_values": {k: v for k, v in predicted.items() if k in PREDICTED_PARAMETERS},
+        "percent_predicted": percent
+    }
+
+
+def parse_delimited(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse a wide CSV/TSV export (one column per parameter, one row per trial).
+
+    Rows of the last test session in the file (by id/visit/date columns) are
+    combined with combine_trials instead of keeping only the last row.
+
+    Returns:
+        Partial result (raw_data, predicted_values, percent_predicted, trials),
+        or None if the text is not a wide parameter table
+    """
+    head = text.lstrip()[:4096]
+    first_line = head.split("\n", 1)[0]
+    delimiter = max(",;\t|", key=first_line.count)
+    if not first_line.count(delimiter):
+        return None
+
+    reader = csv.reader(io.StringIO(text.lstrip()), delimiter=delimiter)
+    header = next(reader, [])
+    columns = {i: classify_column(cell) for i, cell in enumerate(header)}
+    parameter_columns = {i: c for i, c in columns.items() if c[0] is not None}
+    if len(parameter_columns) < 2:
+        return None
+    session_columns = [i for i, cell in enumerate(header) if normalize_label(cell) in _SESSION_COLUMNS]
+
+    sessions: Dict[Tuple, List[List[str]]] = {}
+    last_session: Tuple = ()
+    for row in reader:
+        if not row:
+            continue
+        last_session = tuple(row[i] for i in session_columns if i < len(row))
+        sessions.setdefault(last_session, []).append(row)
+
+    trials: List[Dict[str, float]] = []
+    predicted: Dict[str, float] = {}
+    percent: Dict[str, float] = {}
+    for row in sessions.get(last_session, []):
+        trial = {}
+        for index, (parameter, kind) in parameter_columns.items():
+            value = to_float(row[index]) if index < len(row) else None
+            if value is None:
+                continue
+            if kind == "value":
+                trial[parameter] = value
+            elif kind == "post":
+                trial[f"post_bd_{parameter}"] = value
+            elif kind == "predicted":
+                predicted.setdefault(parameter, value)
+            elif kind == "percent":
+                percent.setdefault(f"{parameter}_percent", value)
+        if trial:
+            trials.append(trial)
+
+    raw_data = combine_trials(trials)
+    if "post_bd_fev1_fvc_ratio" in raw_data:
+        raw_data["post_bd_fev1_fvc_ratio"] = normalize_ratio(raw_data["post_bd_fev1_fvc_ratio"])
+    return {
+        "raw_data": raw_data,
+        "predicted_values": {k: v for k, v in predicted.items() if k in PREDICTED_PARAMETERS},
+        "percent_predicted": percent,
+        "trials": len(trials)
+    }
+
+
+def parse_pft_text(text: str) -> Dict[str, Any]:
+    """Parse a text/CSV export into the standard extraction result."""
+    parsed = parse_delimited(text)
+    metadata = None
+    if parsed is not None and parsed["raw_data"]:
+        metadata = {"trials": parsed.pop("trials")}
+    else:
+        parsed = scan_pft_text(text)
+    return build_extraction_result(
+        parsed["raw_data"],
+        parsed["predicted_values"],
+        parsed["percent_predicted"],
+        test_metadata=metadata
+    )
@@ -0,0 +1,381 @@
+"""
+Vectorized rule engine for AutoPFTReport System.
+
+Applies the deterministic interpretation rules of
+InterpreterAgent._fallback_interpretation and the triage rules of
+TriageSpecialistAgent._fallback_triage_assessment to many studies at once:
+the thresholds are evaluated on NumPy column arrays, so scoring a cohort
+costs a handful of array operations instead of a Python branch per study.
+
+Also usable from the command line on cohort extracts:
+
+    python -m utils.pft_rules spirometry_summary.csv --output classified.csv
+"""
+
+import argparse
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from utils.pft_parsing import classify_column
+
+# Thresholds shared with InterpreterAgent._fallback_interpretation
+OBSTRUCTION_RATIO = 70
+RESTRICTION_FVC_PERCENT = 80
+DIFFUSION_DLCO_PERCENT = 75
+SEVERITY_BINS = [30, 50, 70, 80]  # FEV1 % predicted
+SEVERITY_LABELS = ["very_severe", "severe", "moderate", "mild", "normal"]
+PATTERN_LABELS = ["normal", "obstructive", "restrictive", "mixed", "inconclusive"]
+
+# Triage thresholds shared with TriageSpecialistAgent._fallback_triage_assessment
+TRIAGE_LABELS = ["routine", "urgent", "critical"]
+CRITICAL_FEV1_PERCENT = 30
+URGENT_FEV1_PERCENT = 50
+MODERATE_FEV1_PERCENT = 70
+SEVERE_DLCO_PERCENT = 40
+RED_FLAGS = {
+    "severe_impairment": "Severe respiratory impairment",
+    "gas_exchange": "Severe gas exchange impairment"
+}
+
+# Columns the rule engine reads
+RULE_COLUMNS = ["fev1_fvc_ratio", "fvc_percent", "fev1_percent", "dlco_percent"]
+BORDERLINE_MARGIN = 5  # percentage points from a threshold within which a rule call is uncertain
+
+
+def to_column(values: Sequence[Any]) -> np.ndarray:
+    """Float array with NaN for missing or non-numeric values (comparisons with NaN are False)."""
+    return pd.to_numeric(pd.Series(list(values), dtype=object), errors="coerce").to_numpy(dtype=float)
+
+
+def classify_arrays(
+    fev1_fvc_ratio: Sequence[Optional[float]],
+    fvc_percent: Sequence[Optional[float]],
+    fev1_percent: Sequence[Optional[float]],
+    dlco_percent: Sequence[Optional[float]]
+) -> Dict[str, Any]:
+    """
+    Classify pattern, severity and impairments for column arrays of studies.
+
+    Returns:
+        Arrays keyed by airway_obstruction, restriction, diffusion_impairment
+        (bool), pattern and severity (pandas Categorical)
+    """
+    ratio = np.asarray(fev1_fvc_ratio, dtype=float)
+    fvc = np.asarray(fvc_percent, dtype=float)
+    fev1 = np.asarray(fev1_percent, dtype=float)
+    dlco = np.asarray(dlco_percent, dtype=float)
+
+    obstruction = ratio < OBSTRUCTION_RATIO
+    restriction = fvc < RESTRICTION_FVC_PERCENT
+    diffusion = dlco < DIFFUSION_DLCO_PERCENT
+
+    # Codes index PATTERN_LABELS; only diffusion impairment leaves the pattern inconclusive
+    pattern_codes = np.select(
+        [obstruction & restriction, obstruction, restriction, diffusion],
+        [3, 1, 2, 4],
+        default=0
+    )
+    # Missing FEV1 keeps the default severity
+    severity_codes = np.where(
+        np.isnan(fev1),
+        len(SEVERITY_LABELS) - 1,
+        np.digitize(np.nan_to_num(fev1), SEVERITY_BINS)
+    )
+    return {
+        "airway_obstruction": obstruction,
+        "restriction": restriction,
+        "diffusion_impairment": diffusion,
+        "pattern": pd.Categorical.from_codes(pattern_codes, categories=PATTERN_LABELS),
+        "severity": pd.Categorical.from_codes(severity_codes, categories=SEVERITY_LABELS, ordered=True)
+    }
+
+
+def cohort_columns(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Map an extract's headers ("FEV1/FVC", "FEV1 %Pred", ...) to RULE_COLUMNS.
+
+    Ratios stored as fractions are converted to percent; columns the extract
+    lacks are NaN, which the rules treat like a missing value.
+    """
+    mapped = {}
+    for column in frame.columns:
+        parameter, kind = classify_column(column)
+        if parameter == "fev1_fvc_ratio" and kind == "value":
+            name = "fev1_fvc_ratio"
+        elif parameter is not None and kind == "percent":
+            name = f"{parameter}_percent"
+        else:
+            name = column if column in RULE_COLUMNS else None
+        if name in RULE_COLUMNS and name not in mapped:
+            mapped[name] = pd.to_numeric(frame[column], errors="coerce")
+
+    columns = pd.DataFrame(
+        {name: mapped.get(name, pd.Series(np.nan, index=frame.index)) for name in RULE_COLUMNS},
+        index=frame.index,
+        dtype=float
+    )
+    ratio = columns["fev1_fvc_ratio"]
+    fractions = (ratio > 0) & (ratio <= 1.5)
+    columns.loc[fractions, "fev1_fvc_ratio"] = (ratio[fractions] * 100).round(2)
+    return columns
+
+
+def interpret_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Interpret every row of a cohort extract.
+
+    Returns:
+        The rule columns used plus pattern/severity (categorical) and the
+        obstruction/restriction/diffusion flags, aligned with the input rows
+    """
+    columns = cohort_columns(frame)
+    classified = classify_arrays(*(columns[name].to_numpy() for name in RULE_COLUMNS))
+    for name, values in classified.items():
+        columns[name] = values
+    return columns
+
+
+def interpret_batch(studies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Rule-based interpretation of many studies, vectorized across the batch.
+
+    Args:
+        studies: Dicts with raw_data and percent_predicted
+
+    Returns:
+        One interpretation per study, in the shape of
+        InterpreterAgent._fallback_interpretation
+    """
+    if not studies:
+        return []
+    raw = [s.get("raw_data") or {} for s in studies]
+    percent = [s.get("percent_predicted") or {} for s in studies]
+    ratio = [r.get("fev1_fvc_ratio") for r in raw]
+    fvc = [p.get("fvc_percent") for p in percent]
+    dlco = [p.get("dlco_percent") for p in percent]
+    classified = classify_arrays(
+        to_column(ratio), to_column(fvc), to_column([p.get("fev1_percent") for p in percent]), to_column(dlco)
+    )
+
+    interpretations = []
+    for i in range(len(studies)):
+        obstruction = bool(classified["airway_obstruction"][i])
+        restriction = bool(classified["restriction"][i])
+        diffusion = bool(classified["diffusion_impairment"][i])
+        key_findings = []
+        if obstruction:
+            key_findings.append(f"FEV1/FVC ratio {ratio[i]}% indicates airway obstruction")
+        if restriction:
+            key_findings.append(f"FVC {fvc[i]}% predicted suggests restriction")
+        if diffusion:
+            key_findings.append(f"DLCO {dlco[i]}% predicted indicates diffusion impairment")
+        interpretations.append({
+            "pattern": str(classified["pattern"][i]),
+            "severity": str(classified["severity"][i]),
+            "reversibility": None,
+            "reversibility_percent": None,
+            "airway_obstruction": obstruction,
+            "restriction": restriction,
+            "diffusion_impairment": diffusion,
+            "respiratory_muscle_weakness": False,
+            "likely_diagnoses": [],
+            "recommendations": [],
+            "interpretation_rationale": "Automated rule-based interpretation",
+            "key_findings": key_findings,
+            "trend_analysis": "No historical data available",
+            "clinical_significance": "Unable to determine clinical significance",
+            "follow_up_recommendations": ["Manual review recommended"]
+        })
+    return interpretations
+
+
+def rule_confidence(raw_data: Dict[str, Any], percent_predicted: Dict[str, Any]) -> float:
+    """
+    How clear-cut the rule-based interpretation of one study is, from 0 to 1.
+
+    Confidence falls with each missing core value (FEV1/FVC, FVC and FEV1
+    % predicted) and as the closest value approaches a pattern or severity
+    threshold; studies near a cut-off are the ones worth a stronger model.
+    """
+    raw_data, percent_predicted = raw_data or {}, percent_predicted or {}
+    checks = [
+        (raw_data.get("fev1_fvc_ratio"), [OBSTRUCTION_RATIO]),
+        (percent_predicted.get("fvc_percent"), [RESTRICTION_FVC_PERCENT]),
+        (percent_predicted.get("fev1_percent"), SEVERITY_BINS)
+    ]
+    present = [(float(value), thresholds) for value, thresholds in checks if isinstance(value, (int, float))]
+    if not present:
+        return 0.0
+    distance = min(abs(value - threshold) for value, thresholds in present for threshold in thresholds)
+    return round(min(distance / BORDERLINE_MARGIN, 1.0) * len(present) / len(checks), 3)
+
+
+def triage_arrays(
+    fev1_percent: Sequence[Optional[float]],
+    dlco_percent: Sequence[Optional[float]],
+    pattern: Sequence[str],
+    reversibility: Sequence[Any]
+) -> Dict[str, Any]:
+    """
+    Triage level, urgency score and red flags for column arrays of studies.
+
+    Returns:
+        level (Categorical of TRIAGE_LABELS), urgency_score (int array), one
+        bool array per RED_FLAGS key, and the bool arrays behind each reason
+        (fev1_critical, fev1_urgent, fev1_moderate, dlco_severe, reversible)
+    """
+    fev1 = np.asarray(fev1_percent, dtype=float)
+    dlco = np.asarray(dlco_percent, dtype=float)
+    obstructive = np.asarray(pattern, dtype=object) == "obstructive"
+    reversible = np.array([bool(r) for r in reversibility], dtype=bool) & obstructive
+
+    fev1_critical = fev1 < CRITICAL_FEV1_PERCENT
+    fev1_urgent = ~fev1_critical & (fev1 < URGENT_FEV1_PERCENT)
+    fev1_moderate = ~fev1_critical & ~fev1_urgent & (fev1 < MODERATE_FEV1_PERCENT)
+    dlco_severe = dlco < SEVERE_DLCO_PERCENT
+
+    level = np.select([fev1_critical, fev1_urgent, fev1_moderate & obstructive], [2, 1, 1], default=0)
+    score = np.select([fev1_critical, fev1_urgent, fev1_moderate], [9, 7, 5], default=3)
+    # Severe diffusion impairment, then reversibility, escalate routine cases only
+    escalate = dlco_severe & (level == 0)
+    score = np.where(escalate, np.maximum(score, 6), score)
+    level = np.where(escalate, 1, level)
+    escalate = reversible & (level == 0)
+    score = np.where(escalate, np.maximum(score, 5), score)
+    level = np.where(escalate, 1, level)
+
+    return {
+        "level": pd.Categorical.from_codes(level, categories=TRIAGE_LABELS, ordered=True),
+        "urgency_score": score,
+        "severe_impairment": fev1_critical,
+        "gas_exchange": dlco_severe,
+        "fev1_critical": fev1_critical,
+        "fev1_urgent": fev1_urgent,
+        "fev1_moderate": fev1_moderate,
+        "dlco_severe": dlco_severe,
+        "reversible": reversible
+    }
+
+
+_FOLLOW_UP = {
+    "critical": "Immediate (same day)",
+    "urgent": "Within 1-2 weeks",
+    "routine": "Within 4-6 weeks"
+}
+
+_MONITORING = {
+    "critical": ["Continuous monitoring if hospitalized", "Serial PFTs every 3-6 months", "Symptom monitoring"],
+    "urgent": ["PFT follow-up in 6-12 months", "Symptom tracking", "Response to treatment monitoring"],
+    "routine": ["Annual PFT follow-up", "Symptom monitoring as needed"]
+}
+
+_INSTRUCTIONS = {
+    "critical": [
+        "Immediate medical evaluation required",
+        "Consider emergency department if symptomatic",
+        "Urgent pulmonologist consultation"
+    ],
+    "urgent": [
+        "Schedule appointment within 1-2 weeks",
+        "Contact provider if symptoms worsen",
+        "Consider pulmonologist referral"
+    ],
+    "routine": [
+        "Routine follow-up as scheduled",
+        "Contact provider if new symptoms develop"
+    ]
+}
+
+_RISK_FACTORS = [
+    ("airway_obstruction", "Airway obstruction"),
+    ("restriction", "Restrictive lung disease"),
+    ("diffusion_impairment", "Impaired gas exchange"),
+    ("respiratory_muscle_weakness", "Respiratory muscle weakness")
+]
+
+
+def triage_batch(
+    interpretations: List[Dict[str, Any]],
+    percent_predicted: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Rule-based triage of many studies, vectorized across the batch.
+
+    Returns:
+        One assessment per study, in the shape of
+        TriageSpecialistAgent._fallback_triage_assessment
+    """
+    if not interpretations:
+        return []
+    fev1 = [p.get("fev1_percent") for p in percent_predicted]
+    dlco = [p.get("dlco_percent") for p in percent_predicted]
+    patterns = [i.get("pattern", "normal") for i in interpretations]
+    triage = triage_arrays(
+        to_column(fev1), to_column(dlco), patterns, [i.get("reversibility") for i in interpretations]
+    )
+
+    assessments = []
+    for i, interpretation in enumerate(interpretations):
+        level = str(triage["level"][i])
+        pattern = patterns[i]
+        severity = interpretation.get("severity", "normal")
+        reasons, immediate_actions, red_flags = [], [], []
+        if triage["fev1_critical"][i]:
+            reasons.append(f"Very severe impairment (FEV1 {fev1[i]}% predicted)")
+            immediate_actions.append("Immediate pulmonologist consultation")
+            red_flags.append(RED_FLAGS["severe_impairment"])
+        elif triage["fev1_urgent"][i]:
+            reasons.append(f"Severe impairment (FEV1 {fev1[i]}% predicted)")
+            immediate_actions.append("Expedited pulmonologist referral")
+        elif triage["fev1_moderate"][i]:
+            reasons.append(f"Moderate impairment (FEV1 {fev1[i]}% predicted)")
+        if triage["dlco_severe"][i]:
+            reasons.append(f"Severe diffusion impairment (DLCO {dlco[i]}% predicted)")
+            red_flags.append(RED_FLAGS["gas_exchange"])
+        if triage["reversible"][i]:
+            reasons.append("Significant bronchodilator reversibility - possible uncontrolled asthma")
+
+        specialist_referral = level in ["critical", "urgent"] or severity in ["severe", "very_severe"]
+        monitoring = list(_MONITORING[level]) + (["Peak flow monitoring"] if pattern == "obstructive" else [])
+        instructions = list(_INSTRUCTIONS[level])
+        if pattern == "obstructive":
+            instructions.extend(["Ensure proper inhaler technique", "Consider bronchodilator therapy optimization"])
+        assessments.append({
+            "level": level,
+            "reasons": reasons or [f"{severity} {pattern} pattern"],
+            "recommended_followup": _FOLLOW_UP[level],
+            "specialist_referral": specialist_referral,
+            "specialist_type": "Pulmonologist" if specialist_referral else None,
+            "urgency_score": int(triage["urgency_score"][i]),
+            "risk_factors": [label for key, label in _RISK_FACTORS if interpretation.get(key)],
+            "immediate_actions": immediate_actions or ["Standard follow-up"],
+            "monitoring_requirements": monitoring,
+            "patient_safety_concerns": red_flags,
+            "clinical_rationale": f"Triage level {level} based on {severity} {pattern} pattern",
+            "red_flags": list(red_flags),
+            "follow_up_instructions": instructions,
+            "assessed_by": "rules"
+        })
+    return assessments
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Rule-based interpretation of a cohort extract (CSV)")
+    parser.add_argument("input", help="CSV with FEV1/FVC and optional %% predicted columns")
+    parser.add_argument("--output", help="Write the input with the interpretation columns appended")
+    args = parser.parse_args(argv)
+
+    frame = pd.read_csv(args.input)
+    result = interpret_frame(frame)
+    print(f"{len(result)} rows")
+    for name in ("pattern", "severity"):
+        print(result[name].value_counts(sort=False).to_string())
+    if args.output:
+        frame.join(result.drop(columns=[c for c in RULE_COLUMNS if c in frame.columns])).to_csv(args.output, index=False)
+        print(f"Written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Progress publishing utilities for AutoPFTReport System.
+
+The orchestrator reports status after every workflow stage. Each report needs a
+pub/sub message for WebSocket listeners, a persisted copy for HTTP polling and
+an entry in the per-request event stream replayed by the SSE endpoint, so all
+of them are sent through one pipelined round-trip, and intermediate updates
+that arrive faster than the flush interval are coalesced into the latest one.
+"""
+
+import asyncio
+import json
+from typing import Dict, Any, Optional
+
+from config import settings
+from utils.redis import get_redis
+
+
+TERMINAL_STAGES = ("completed", "failed")
+
+
+def progress_stream_key(request_id: str) -> str:
+    """Redis Stream holding the progress history of a request."""
+    return f"pft:events:{request_id}"
+
+
+def is_terminal(status: Dict[str, Any]) -> bool:
+    """Whether a status dictionary represents a finished request."""
+    return status.get("stage") in TERMINAL_STAGES or status.get("status") in TERMINAL_STAGES
+
+
+class ProgressWriter:
+    """Batched, coalescing status writer for a single request."""
+
+    def __init__(self, request_id: str, flush_interval: Optional[float] = None):
+        self.request_id = request_id
+        self.flush_interval = settings.STATUS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.redis_client = get_redis()
+        self.channel = f"pft:progress:{request_id}"
+        self.status_key = f"pft:processing:{request_id}"
+        self.stream_key = progress_stream_key(request_id)
+
+        self._pending: Optional[Dict[str, Any]] = None
+        self._pending_extra: Dict[str, str] = {}
+        self._last_flush = float("-inf")
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def write(
+        self,
+        status: Dict[str, Any],
+        force: bool = False,
+        extra: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Queue a status update, flushing immediately when due.
+
+        Args:
+            status: Status dictionary to publish and persist
+            force: Flush now regardless of the coalescing interval (terminal states)
+            extra: Additional keys to SET in the same pipeline, written before the status
+                (dict values replace a hash)
+        """
+        self._pending = status
+        if extra:
+            self._pending_extra.update(extra)
+
+        loop = asyncio.get_running_loop()
+        elapsed = loop.time() - self._last_flush
+        if force or elapsed >= self.flush_interval:
+            await self.flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(
+                self._delayed_flush(self.flush_interval - elapsed)
+            )
+
+    async def _delayed_flush(self, delay: float):
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        """Send the latest pending status (and extra keys) in one pipeline."""
+        task = self._flush_task
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+            self._flush_task = None
+
+        async with self._lock:
+            if self._pending is None and not self._pending_extra:
+                return
+            status, self._pending = self._pending, None
+            extra, self._pending_extra = self._pending_extra, {}
+
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for key, value in extra.items():
+                    if isinstance(value, dict):
+                        pipe.delete(key)
+                        pipe.hset(key, mapping=value)
+                    else:
+                        pipe.set(key, value)
+                if status is not None:
+                    payload = json.dumps(status)
+                    pipe.xadd(
+                        self.stream_key,
+                        {"data": payload},
+                        maxlen=settings.PROGRESS_STREAM_MAXLEN,
+                        approximate=True
+                    )
+                    pipe.expire(self.stream_key, settings.PROGRESS_STREAM_TTL)
+                    pipe.publish(self.channel, payload)
+                    pipe.set(self.status_key, payload)
+                await pipe.execute()
+            self._last_flush = asyncio.get_running_loop().time()
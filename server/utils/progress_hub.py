@@ -0,0 +1,126 @@
+"""
+Progress fan-out hub for AutoPFTReport System.
+
+A single pattern subscription (``pft:progress:*``) per worker receives every
+progress message; the hub routes each one in-process to the WebSocket clients
+that subscribed to its request ID. Connection count therefore scales with
+users rather than in-flight jobs.
+"""
+
+import asyncio
+import logging
+from typing import Dict, Set, Optional, Tuple
+
+from config import settings
+from utils.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_CHANNEL_PREFIX = "pft:progress:"
+
+
+class ProgressSubscriber:
+    """Per-connection bounded mailbox of (request_id, payload) messages."""
+
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.request_ids: Set[str] = set()
+        self.dropped = False
+
+    def offer(self, request_id: str, payload: str) -> bool:
+        """Enqueue a message without blocking; returns False if the consumer is too slow."""
+        try:
+            self.queue.put_nowait((request_id, payload))
+            return True
+        except asyncio.QueueFull:
+            self.dropped = True
+            return False
+
+    async def next_message(self, timeout: float) -> Optional[Tuple[str, str]]:
+        """Wait for the next message, or return None after ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class ProgressHub:
+    """Routes progress messages from one Redis pattern subscription to many subscribers."""
+
+    def __init__(self):
+        self.redis_client = get_redis()
+        self._routes: Dict[str, Set[ProgressSubscriber]] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the shared listener (idempotent)."""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def register(self) -> ProgressSubscriber:
+        return ProgressSubscriber(settings.WS_QUEUE_SIZE)
+
+    def unregister(self, subscriber: ProgressSubscriber):
+        for request_id in list(subscriber.request_ids):
+            self.unsubscribe(subscriber, request_id)
+
+    def subscribe(self, subscriber: ProgressSubscriber, request_id: str):
+        subscriber.request_ids.add(request_id)
+        self._routes.setdefault(request_id, set()).add(subscriber)
+
+    def unsubscribe(self, subscriber: ProgressSubscriber, request_id: str):
+        subscriber.request_ids.discard(request_id)
+        routes = self._routes.get(request_id)
+        if routes is not None:
+            routes.discard(subscriber)
+            if not routes:
+                del self._routes[request_id]
+
+    def stats(self) -> Dict[str, int]:
+        subscribers = set()
+        for routes in self._routes.values():
+            subscribers.update(routes)
+        return {"request_ids": len(self._routes), "subscribers": len(subscribers)}
+
+    def _dispatch(self, request_id: str, payload: str):
+        for subscriber in list(self._routes.get(request_id, ())):
+            if not subscriber.offer(request_id, payload):
+                logger.warning(f"Dropping slow progress subscriber (request_id={request_id})")
+                self.unregister(subscriber)
+
+    async def _listen(self):
+        """Consume the pattern subscription, reconnecting with backoff on errors."""
+        delay = 1.0
+        while True:
+            pubsub = self.redis_client.pubsub()
+            try:
+                await pubsub.psubscribe(f"{PROGRESS_CHANNEL_PREFIX}*")
+                delay = 1.0
+                async for message in pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    channel = message.get("channel", "")
+                    self._dispatch(channel[len(PROGRESS_CHANNEL_PREFIX):], message.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Progress hub listener error: {e}; reconnecting in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+
+progress_hub = ProgressHub()
@@ -0,0 +1,16 @@
+import redis.asyncio as aioredis
+
+from config import settings
+
+# One connection pool per worker, shared by the API handlers and the orchestrator
+pool = aioredis.ConnectionPool.from_url(
+    settings.REDIS_URL,
+    encoding="utf-8",
+    decode_responses=True,
+    max_connections=settings.REDIS_MAX_CONNECTIONS
+)
+client = aioredis.Redis(connection_pool=pool)
+
+
+def get_redis():
+    return client
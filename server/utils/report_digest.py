@@ -0,0 +1,141 @@
+"""
+Compact report digests for AutoPFTReport System.
+
+A stored report carries the full narrative report, quality assessment and
+every agent field. Chat prompts only need the key values, pattern, triage
+and top findings, so they are given a digest of a few hundred bytes
+instead of the whole report.
+
+The orchestrator writes the digest and the report's detailed sections to a
+``pft:digest:{report_id}`` hash alongside the report. Chat endpoints read
+the digest and fetch a detailed section only when the question mentions
+it.
+"""
+
+import json
+import re
+from typing import Dict, Any, List, Optional
+
+from utils.redis import get_redis
+
+# Detailed sections stored next to the digest, with the question keywords that need them
+DETAIL_SECTIONS = {
+    "interpretation": re.compile(
+        r"\b(why|rationale|reason|explain|how was|derived|diagnos|differential|recommend|significan|trend)", re.I),
+    "triage": re.compile(r"\b(triage|urgen|critical|follow[- ]?up|referr|specialist|red flag|next step|action)", re.I),
+    "predicted_values": re.compile(r"\b(predicted|reference|lln|uln|z[- ]?score|percent|normal range|gli)", re.I),
+    "quality": re.compile(r"\b(quality|acceptab|reproducib|repeatab|effort|technique|grade|valid)", re.I),
+    "report_content": re.compile(r"\b(report|summary|impression|conclusion|wording|wrote|written)", re.I),
+}
+
+DEMOGRAPHIC_FIELDS = ("age", "gender", "height", "weight", "ethnicity", "smoking_status")
+MAX_FINDINGS = 5
+MAX_DIAGNOSES = 3
+MAX_REASONS = 3
+
+
+def _present(values: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop empty entries and round floats."""
+    compact = {}
+    for key, value in (values or {}).items():
+        if value is None or value == "" or value == [] or value == {}:
+            continue
+        compact[key] = round(value, 2) if isinstance(value, float) else value
+    return compact
+
+
+def build_report_digest(report: Dict[str, Any]) -> Dict[str, Any]:
+    """Key values, pattern, triage and top findings of a stored report."""
+    interpretation = report.get("interpretation") or {}
+    triage = report.get("triage") or {}
+    demographics = report.get("patient_demographics") or {}
+    return _present({
+        "report_id": report.get("report_id"),
+        "test_date": report.get("test_date"),
+        "patient": _present({field: demographics.get(field) for field in DEMOGRAPHIC_FIELDS}),
+        "values": _present(report.get("raw_data")),
+        "percent_predicted": _present(report.get("percent_predicted")),
+        "pattern": interpretation.get("pattern"),
+        "severity": interpretation.get("severity"),
+        "reversibility": interpretation.get("reversibility"),
+        "key_findings": (interpretation.get("key_findings") or [])[:MAX_FINDINGS],
+        "likely_diagnoses": (interpretation.get("likely_diagnoses") or [])[:MAX_DIAGNOSES],
+        "triage": _present({
+            "level": triage.get("level"),
+            "urgency_score": triage.get("urgency_score"),
+            "reasons": (triage.get("reasons") or [])[:MAX_REASONS]
+        })
+    })
+
+
+def dumps_digest(digest: Dict[str, Any]) -> str:
+    """Serialize a digest without whitespace, for prompts and storage."""
+    return json.dumps(digest, separators=(",", ":"), default=str)
+
+
+def digest_key(report_id: str) -> str:
+    return f"pft:digest:{report_id}"
+
+
+def digest_fields(report: Dict[str, Any]) -> Dict[str, str]:
+    """Hash fields for a report: the digest plus each detailed section."""
+    sections = {
+        "interpretation": report.get("interpretation"),
+        "triage": report.get("triage"),
+        "predicted_values": _present({
+            "predicted_values": report.get("predicted_values"),
+            "percent_predicted": report.get("percent_predicted")
+        }),
+        "quality": _present({
+            "quality_metrics": report.get("quality_metrics"),
+            "quality_assessment": report.get("quality_assessment")
+        }),
+        "report_content": report.get("report_content"),
+    }
+    fields = {"digest": dumps_digest(build_report_digest(report))}
+    fields.update({name: dumps_digest(value) for name, value in sections.items() if value})
+    return fields
+
+
+def sections_for_question(question: Optional[str]) -> List[str]:
+    """Detailed sections a question needs beyond the digest."""
+    if not question:
+        return []
+    return [name for name, pattern in DETAIL_SECTIONS.items() if pattern.search(question)]
+
+
+class ReportDigestStore:
+    """Reads report digests and on-demand detail sections from Redis."""
+
+    def __init__(self):
+        self.redis_client = get_redis()
+
+    async def context(self, report_id: str, sections: List[str] = ()) -> Optional[Dict[str, Any]]:
+        """
+        Digest of a report plus the requested detailed sections.
+
+        Reports stored before digests existed are digested from the full
+        report once and backfilled.
+
+        Returns:
+            Digest dict with a "details" entry when sections were requested,
+            or None if the report does not exist
+        """
+        names = ["digest", *sections]
+        values = await self.redis_client.hmget(digest_key(report_id), names)
+        if values[0] is None:
+            data = await self.redis_client.get(f"pft:report:{report_id}")
+            if not data:
+                return None
+            fields = digest_fields(json.loads(data))
+            await self.redis_client.hset(digest_key(report_id), mapping=fields)
+            values = [fields.get(name) for name in names]
+
+        context = json.loads(values[0])
+        details = {name: json.loads(value) for name, value in zip(sections, values[1:]) if value}
+        if details:
+            context["details"] = details
+        return context
+
+
+report_digests = ReportDigestStore()
@@ -0,0 +1,213 @@
+"""
+Resilient agent calls for AutoPFTReport System.
+
+Every LLM call made through the model router goes through ``resilience.call``:
+
+- transient failures (connection errors, timeouts, 429 and 5xx responses)
+  are retried up to RETRY_ATTEMPTS times with full-jitter exponential
+  backoff starting at RETRY_DELAY seconds
+- the whole call, retries included, must finish within the deadline the
+  caller gives (the agent's step timeout less RESILIENCE_FALLBACK_MARGIN),
+  so a slow gateway times out the call rather than the pipeline step
+- a circuit breaker per model endpoint opens after CIRCUIT_FAILURE_THRESHOLD
+  consecutive failures. While it is open, calls fail immediately with
+  CircuitOpenError and the agents take their deterministic fallback paths.
+  After CIRCUIT_RESET_TIMEOUT one probe call is let through to test the
+  endpoint
+- with HEDGE_ENABLED, a call still running after the endpoint's recent
+  p95 latency is duplicated and the first answer wins
+
+Breakers and latency windows are per worker process.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import numpy as np
+import openai
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit breaker is open."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an error is transient (worth retrying and counted against the endpoint)."""
+    if isinstance(error, (asyncio.TimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open probe after a cool-down."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+
+    def check(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < settings.CIRCUIT_RESET_TIMEOUT:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit open for {self.name}")
+            self.state = "half_open"
+        if self.state == "half_open":
+            # Only one probe at a time while the endpoint is being tested
+            if self.probing:
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit half-open for {self.name}; probe in progress")
+            self.probing = True
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit closed for {self.name}")
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= settings.CIRCUIT_FAILURE_THRESHOLD:
+            if self.state != "open":
+                logger.warning(f"Circuit opened for {self.name} after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """End a probe that neither succeeded nor failed transiently."""
+        self.probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures, "rejected": self.rejected}
+
+
+class ResilientCaller:
+    """Retries, circuit breaking and hedging for calls to model endpoints."""
+
+    def __init__(self):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker(endpoint)
+        return self.breakers[endpoint]
+
+    def hedge_delay(self, endpoint: str) -> Optional[float]:
+        """Seconds after which to hedge a call to ``endpoint``; None if hedging is off or unfounded."""
+        samples = self.latencies.get(endpoint)
+        if not settings.HEDGE_ENABLED or not samples or len(samples) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        return float(np.percentile(samples, settings.HEDGE_PERCENTILE))
+
+    async def call(
+        self,
+        endpoint: str,
+        make_call: Callable[[], Awaitable[Any]],
+        deadline: Optional[float] = None
+    ) -> Any:
+        """
+        Await ``make_call()`` with retries, circuit breaking and hedging.
+
+        Args:
+            endpoint: Model endpoint the call goes to (one breaker per endpoint)
+            make_call: Starts one attempt; called again for retries and hedges
+            deadline: time.monotonic() by which the call must have finished
+
+        Raises:
+            CircuitOpenError: the endpoint's breaker is open
+            asyncio.TimeoutError: the deadline passed
+            The last error, once retries are exhausted or it is not transient
+        """
+        deadline = deadline or time.monotonic() + settings.AGENT_TIMEOUT
+        breaker = self.breaker(endpoint)
+        for attempt in range(settings.RETRY_ATTEMPTS):
+            breaker.check()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                breaker.release()
+                raise asyncio.TimeoutError(f"Deadline passed before calling {endpoint}")
+            start = time.monotonic()
+            try:
+                result = await asyncio.wait_for(self._hedged(endpoint, make_call), remaining)
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.release()
+                    raise
+                breaker.record_failure()
+                delay = random.uniform(0, min(settings.RETRY_MAX_DELAY, settings.RETRY_DELAY * 2 ** attempt))
+                if attempt + 1 >= settings.RETRY_ATTEMPTS or time.monotonic() + delay >= deadline:
+                    raise
+                self.retries += 1
+                logger.warning(f"Call to {endpoint} failed ({e!r}); retry {attempt + 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success()
+            self.latencies.setdefault(endpoint, deque(maxlen=settings.LATENCY_WINDOW)).append(
+                time.monotonic() - start
+            )
+            return result
+
+    async def _hedged(self, endpoint: str, make_call: Callable[[], Awaitable[Any]]) -> Any:
+        delay = self.hedge_delay(endpoint)
+        if delay is None:
+            return await make_call()
+        primary = asyncio.ensure_future(make_call())
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                self.hedges += 1
+                pending.add(asyncio.ensure_future(make_call()))
+            error = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, breaker in self.breakers.items():
+            samples = self.latencies.get(endpoint)
+            endpoints[endpoint] = {
+                **breaker.stats(),
+                "p95_latency_s": round(float(np.percentile(samples, 95)), 3) if samples else None
+            }
+        return {"retries": self.retries, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                "endpoints": endpoints}
+
+
+resilience = ResilientCaller()
@@ -0,0 +1,152 @@
+"""
+Upload ingestion utilities for AutoPFTReport System.
+
+Uploaded files are copied to disk in fixed-size chunks so request memory stays
+bounded regardless of file size, and ZIP archives are expanded entry by entry
+for bulk ingestion.
+"""
+
+import csv
+import io
+import json
+import os
+import zipfile
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+import aiofiles
+from fastapi import UploadFile
+
+from config import settings
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload or archive entry exceeds the configured size limit."""
+
+
+DEMOGRAPHIC_FIELDS = [
+    "patient_id", "age", "gender", "height", "weight", "ethnicity", "smoking_status"
+]
+MANIFEST_FIELDS = ["filename"] + DEMOGRAPHIC_FIELDS + ["priority", "requesting_physician"]
+
+
+def file_extension(filename: str) -> str:
+    return filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+
+
+async def spool_upload(upload: UploadFile, destination: Path, max_bytes: int) -> int:
+    """
+    Copy an upload to ``destination`` in chunks, rejecting it as soon as it grows past ``max_bytes``.
+
+    Returns:
+        Number of bytes written
+    """
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    try:
+        async with aiofiles.open(destination, "wb") as out:
+            while True:
+                chunk = await upload.read(settings.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLargeError(
+                        f"{upload.filename} exceeds maximum of {max_bytes} bytes"
+                    )
+                await out.write(chunk)
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+    return written
+
+
+def extract_zip(
+    archive: Path,
+    destination: Path,
+    max_entry_bytes: int,
+    max_entries: int,
+    seen_names: Optional[Set[str]] = None
+) -> Tuple[List[Path], List[Dict[str, str]]]:
+    """
+    Expand a ZIP archive entry by entry into ``destination`` (blocking; run off the event loop).
+
+    Entries are streamed, so an entry that lies about its declared size is still cut off
+    at ``max_entry_bytes``. Directory entries and macOS resource forks are skipped.
+    Studies are matched to the manifest by file name, so an entry whose name is already
+    in ``seen_names`` (from another folder or another upload) is rejected; the names of
+    extracted entries are added to it.
+
+    Returns:
+        Tuple of (extracted file paths, rejected entries with reasons)
+    """
+    extracted: List[Path] = []
+    rejected: List[Dict[str, str]] = []
+    seen_names = set() if seen_names is None else seen_names
+    destination.mkdir(parents=True, exist_ok=True)
+
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or info.filename.startswith("__MACOSX/") or name.startswith("."):
+                continue
+            if name in seen_names:
+                rejected.append({"filename": name, "reason": "Duplicate filename in batch"})
+                continue
+            if len(extracted) >= max_entries:
+                rejected.append({"filename": name, "reason": f"Batch exceeds {max_entries} files"})
+                continue
+            if info.file_size > max_entry_bytes:
+                rejected.append({"filename": name, "reason": f"File size exceeds maximum of {max_entry_bytes} bytes"})
+                continue
+
+            target = destination / name
+            written = 0
+            try:
+                with zf.open(info) as src, open(target, "wb") as out:
+                    while True:
+                        chunk = src.read(settings.UPLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        written += len(chunk)
+                        if written > max_entry_bytes:
+                            raise UploadTooLargeError(f"File size exceeds maximum of {max_entry_bytes} bytes")
+                        out.write(chunk)
+            except (UploadTooLargeError, zipfile.BadZipFile, OSError) as e:
+                target.unlink(missing_ok=True)
+                rejected.append({"filename": name, "reason": str(e)})
+                continue
+            extracted.append(target)
+            seen_names.add(name)
+
+    return extracted, rejected
+
+
+def parse_manifest(content: bytes, filename: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Parse a demographics manifest (CSV with a header row, or a JSON list of objects).
+
+    Returns:
+        Mapping of study filename to its manifest row
+    """
+    text = content.decode("utf-8-sig")
+    if file_extension(filename) == "json":
+        rows = json.loads(text)
+        if isinstance(rows, dict):
+            rows = rows.get("studies", [])
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("JSON manifest must be a list of objects")
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+    manifest = {}
+    for row in rows:
+        row = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+        name = os.path.basename(str(row.get("filename") or "").strip())
+        if name:
+            manifest[name] = {k: (v if v != "" else None) for k, v in row.items() if k in MANIFEST_FIELDS}
+    return manifest
+
+
+def batch_directory(batch_id: str) -> Path:
+    return Path(settings.UPLOAD_DIR) / "batches" / batch_id
@@ -0,0 +1,132 @@
+"""
+Triage worklists for AutoPFTReport System.
+
+Critical and urgent reports are kept in Redis sorted sets scored by urgency,
+so clinicians can pull the highest-priority cases first. Reports are added
+as they complete; when triage thresholds change the whole report store is
+re-triaged with the vectorized rule engine and the worklists are rebuilt in
+bulk.
+"""
+
+import json
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+
+from utils.redis import get_redis
+from utils.pft_rules import TRIAGE_LABELS, triage_arrays, to_column
+
+WORKLIST_LEVELS = ("critical", "urgent")
+
+
+def worklist_key(level: str) -> str:
+    return f"pft:worklist:{level}"
+
+
+class Worklist:
+    """Redis sorted sets of report ids per triage level, scored by urgency."""
+
+    def __init__(self):
+        self.redis_client = get_redis()
+
+    async def record(self, report_id: str, triage: Dict[str, Any]):
+        """Place a completed report on the worklist for its triage level (or remove it)."""
+        level = triage.get("level")
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for name in WORKLIST_LEVELS:
+                if name != level:
+                    pipe.zrem(worklist_key(name), report_id)
+            if level in WORKLIST_LEVELS:
+                pipe.zadd(worklist_key(level), {report_id: float(triage.get("urgency_score") or 0)})
+            await pipe.execute()
+
+    async def entries(self, level: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Highest-urgency reports first."""
+        members = await self.redis_client.zrevrange(worklist_key(level), 0, limit - 1, withscores=True)
+        return [{"report_id": report_id, "urgency_score": int(score)} for report_id, score in members]
+
+    async def counts(self) -> Dict[str, int]:
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for level in WORKLIST_LEVELS:
+                pipe.zcard(worklist_key(level))
+            sizes = await pipe.execute()
+        return dict(zip(WORKLIST_LEVELS, sizes))
+
+    async def rebuild(self, batch_size: int = 1000) -> Dict[str, Any]:
+        """
+        Re-triage every stored report with the rule engine and rebuild the worklists.
+
+        Reports are read in MGET batches and scored in one vectorized pass.
+        The level and urgency assessed by the triage agent are kept as a floor,
+        so a rebuild never downgrades a case the agent escalated. Assessments
+        that came from the rule-based fallback (``assessed_by == "rules"``) are
+        recomputed outright, so loosened thresholds can lower them. The new sets
+        are written under temporary keys and renamed into place, so readers
+        never see a half-built worklist.
+        """
+        start = time.perf_counter()
+        report_ids, fev1, dlco, patterns, reversibility = [], [], [], [], []
+        stored_levels, stored_scores = [], []
+
+        async def load(keys: List[str]):
+            for key, data in zip(keys, await self.redis_client.mget(keys)):
+                if not data:
+                    continue
+                report = json.loads(data)
+                interpretation = report.get("interpretation") or {}
+                percent = report.get("percent_predicted") or {}
+                report_ids.append(key.split(":", 2)[2])
+                fev1.append(percent.get("fev1_percent"))
+                dlco.append(percent.get("dlco_percent"))
+                patterns.append(interpretation.get("pattern", "normal"))
+                reversibility.append(interpretation.get("reversibility"))
+                stored = report.get("triage") or {}
+                if stored.get("assessed_by") == "rules":
+                    stored = {}
+                stored_levels.append(stored.get("level"))
+                stored_scores.append(stored.get("urgency_score"))
+
+        keys = []
+        async for key in self.redis_client.scan_iter(match="pft:report:*", count=batch_size):
+            keys.append(key)
+            if len(keys) >= batch_size:
+                await load(keys)
+                keys = []
+        if keys:
+            await load(keys)
+
+        triage = triage_arrays(to_column(fev1), to_column(dlco), patterns, reversibility)
+        rank = {label: index for index, label in enumerate(TRIAGE_LABELS)}
+        stored_codes = np.array([rank.get(level, 0) for level in stored_levels], dtype=int)
+        level_codes = np.maximum(triage["level"].codes, stored_codes)
+        scores = np.fmax(triage["urgency_score"], to_column(stored_scores))
+
+        counts = {}
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for level in WORKLIST_LEVELS:
+                selected = np.flatnonzero(level_codes == rank[level])
+                counts[level] = int(selected.size)
+                temporary = f"{worklist_key(level)}:rebuild"
+                pipe.delete(temporary)
+                for offset in range(0, selected.size, batch_size):
+                    chunk = selected[offset:offset + batch_size]
+                    pipe.zadd(temporary, {report_ids[i]: float(scores[i]) for i in chunk})
+                if selected.size:
+                    pipe.rename(temporary, worklist_key(level))
+                else:
+                    pipe.delete(worklist_key(level))
+            await pipe.execute()
+
+        return {
+            "reports": len(report_ids),
+            "worklists": counts,
+            "red_flags": {
+                "severe_impairment": int(triage["severe_impairment"].sum()),
+                "gas_exchange": int(triage["gas_exchange"].sum())
+            },
+            "elapsed_seconds": round(time.perf_counter() - start, 3)
+        }
+
+
+worklist = Worklist()